@@ -23,6 +23,7 @@ from the configuration file, generating some type of computed output.
 """
 __author__ = 'mkenny'
 from .processors import *
+from .readers import close_connection_pools, commit_watermarks, discard_watermarks
 from simplejson import loads as json_loads
 
 
@@ -104,14 +105,18 @@ class Controller(object):
         """
         Create a LayerConstructor for each layer.
         Initiate processing calling the LayerConstructor's serialize() method.
+        Close any pooled database connections once all layers are processed.
         """
         # Spawn LayerConstructor Instances for each layer.
-        for layer in self.layers:
-            # Extract processing steps for a layer
-            layer_name = layer['name']
-            processing_steps = layer['processing_steps']
-            rBuild_Inst = LayerConstructor(layer_name, processing_steps, self.readers)
-            rBuild_Inst.serialize()
+        try:
+            for layer in self.layers:
+                # Extract processing steps for a layer
+                layer_name = layer['name']
+                processing_steps = layer['processing_steps']
+                rBuild_Inst = LayerConstructor(layer_name, processing_steps, self.readers)
+                rBuild_Inst.serialize()
+        finally:
+            close_connection_pools()
 
 
 class LayerConstructor(object):
@@ -149,10 +154,11 @@ class LayerConstructor(object):
         # that property will be assigned the value extracted from **kwargs
         for processor_dict in processors:
             for processor_name, processor_args in processor_dict.iteritems():
-                # Add readers to processor_args dict
+                # Add readers and the layer name to processor_args dict
                 # Conditional fails if value of None is used in JSON config for a processor.
                 if processor_args:
                     processor_args['readers'] = self.readers
+                    processor_args['layer'] = self.layer_name
                 else:
                     # Need an empty dict to pass as **kwargs
                     processor_args = {}
@@ -173,7 +179,14 @@ class LayerConstructor(object):
         - Adds an instance of ``ProcessorDevNull()`` to the outermost (last) step of the chain,
           this ensures that input iterable is iterated until exhaustion.
         - Executes processing steps via ``self._build_decorated_classes()`` method.
+        - Saves the high-water marks of incremental readers once all processors have finished,
+          such that a failed layer is read again in full by the next run.
         """
         self.processing_steps.reverse()
         initial_processor = ProcessorDevNull()
-        self._build_decorated_classes(initial_processor, self.processing_steps, ProcessorBaseClass)
+        try:
+            self._build_decorated_classes(initial_processor, self.processing_steps, ProcessorBaseClass)
+        except Exception:
+            discard_watermarks()
+            raise
+        commit_watermarks()
@@ -11,11 +11,33 @@ Processors perform actions on a collection records.
 """
 __author__ = 'mkenny'
 import abc
+import bz2
+import cPickle
 import csv
+import gzip
 import itertools
+import json
+import marshal
+import math
+import multiprocessing
+import operator
 import os
+import Queue
+import re
+import sqlite3
+import StringIO
+import struct
+import sys
+import tempfile
+import threading
+import fiona.transform
+import numpy
+import psycopg2
+import psycopg2.errorcodes
 import readers
-from collections import deque
+import recordfile
+import sketches
+from collections import deque, OrderedDict
 
 
 class ProcessorBaseClass(object):
@@ -85,6 +107,232 @@ class ProcessorBaseClass(object):
         return mod_records_iterable
 
 
+def _update_min(state, value):
+    return value if state is None or value < state else state
+
+
+def _update_max(state, value):
+    return value if state is None or value > state else state
+
+
+def _merge_min(state, other):
+    return state if other is None else _update_min(state, other)
+
+
+def _merge_max(state, other):
+    return state if other is None else _update_max(state, other)
+
+
+def _merge_mean(state, other):
+    return state[0] + other[0], state[1] + other[1]
+
+
+def _update_distinct(state, value):
+    state.add(value)
+    return state
+
+
+# Aggregate functions, as (initial state factory, update, merge, finalize) tuples.
+# update(state, value) is called for each non-None value, merge(state, other) combines
+# partial states in input order, and finalize(state) returns the output value.
+AGGREGATE_FUNCTIONS = {
+    'sum': (int, operator.add, operator.add, None),
+    'count': (int, lambda state, value: state + 1, operator.add, None),
+    'min': (lambda: None, _update_min, _merge_min, None),
+    'max': (lambda: None, _update_max, _merge_max, None),
+    'mean': (lambda: (0, 0), lambda state, value: (state[0] + value, state[1] + 1), _merge_mean,
+             lambda state: float(state[0]) / state[1] if state[1] else None),
+    'first': (lambda: None, lambda state, value: value if state is None else state,
+              lambda state, other: other if state is None else state, None),
+    'last': (lambda: None, lambda state, value: value, lambda state, other: state if other is None else other, None),
+    'distinct': (set, _update_distinct, operator.ior, len)
+}
+
+
+class ProcessorAggregate(ProcessorBaseClass):
+    """
+    Group records by the values of one or more key fields, emitting a single record per group
+    containing the key fields and the result of each aggregate.
+
+    Aggregates are given as output field names mapped to a ``[function, field]`` pair.
+    Supported functions are "sum", "count", "min", "max", "mean", "first", "last" and "distinct",
+    a count of distinct values. None values are ignored by all functions. A field of "*" with
+    "count" counts all records. Values should be cast by the reader, e.g. using ``field_types``.
+
+    Two modes are supported:
+
+    * "hash" - groups are accumulated in a dictionary, emitted once all records are read.
+      Once more than ``max_groups`` groups are held, partial results are spilled to temporary
+      files, partitioned by a hash of the group key, and merged a partition at a time.
+    * "sorted" - records must arrive sorted by the key fields, e.g. via ``ProcessorSortRecords``.
+      Each group is emitted as soon as the key changes, holding a single group in memory.
+      A ValueError is raised if an out of order key is found.
+
+    Required Config Parameters:
+
+    :param list keys: Field names to group by.
+    :param dict aggregates: Output field names mapped to ``[function, field]`` pairs.
+
+    Non-Required Config Parameters:
+
+    :param str mode: Either "hash" or "sorted". DEFAULTS to "hash".
+    :param int max_groups: Used with "hash" mode. Maximum number of groups held in memory
+        before spilling to disk. DEFAULTS to 100000.
+    :param int spill_partitions: Used with "hash" mode. Number of spill files. DEFAULTS to 16.
+
+    Example configuration file entry::
+
+        {"ProcessorAggregate": {
+            "keys": ["STATE_CODE"],
+            "aggregates": {
+                "Facilities": ["count", "*"],
+                "Counties": ["distinct", "COUNTY_NAME"],
+                "FirstUpdate": ["min", "UPDATE_DATE"]
+            }
+        }}
+    """
+    # Serializer, 'm' for marshal or 'p' for pickle, and length of a spilled block.
+    spill_block_struct = struct.Struct('<cQ')
+
+    def __init__(self, processor, keys, aggregates, mode='hash', max_groups=100000, spill_partitions=16, **kwargs):
+        self.processor = processor
+        self.keys = keys
+        self.aggregates = aggregates
+        self.mode = mode.lower()
+        if self.mode not in ('hash', 'sorted'):
+            raise ValueError("Mode Not Supported")
+        self.max_groups = int(max_groups)
+        self.spill_partitions = int(spill_partitions)
+        # Lists of output field names, source field names and aggregate functions, in matching order.
+        self._output_fields = []
+        self._source_fields = []
+        self._functions = []
+        for output_field, (function_name, source_field) in sorted(aggregates.iteritems()):
+            if function_name not in AGGREGATE_FUNCTIONS:
+                raise ValueError("Aggregate function %s not supported." % function_name)
+            if source_field == '*' and function_name != 'count':
+                raise ValueError("Only the count aggregate function supports a field of '*'.")
+            self._output_fields.append(output_field)
+            self._source_fields.append(source_field)
+            self._functions.append(AGGREGATE_FUNCTIONS[function_name])
+        self._state_factories = [function[0] for function in self._functions]
+        self._get_key = operator.itemgetter(*self.keys)
+
+    def _initial_states(self):
+        """Return a list of new aggregate states for a group."""
+        return [state_factory() for state_factory in self._state_factories]
+
+    def _group_key(self, record):
+        """Return a tuple of the key field values of a record."""
+        key = self._get_key(record)
+        return key if len(self.keys) > 1 else (key,)
+
+    def _update(self, states, record):
+        """Update a list of aggregate states in place with the values of a record."""
+        for i, source_field in enumerate(self._source_fields):
+            value = 1 if source_field == '*' else record.get(source_field)
+            if value is not None:
+                states[i] = self._functions[i][1](states[i], value)
+
+    def _merge(self, states, other_states):
+        """Merge a later list of partial aggregate states into states, in place."""
+        for i, function in enumerate(self._functions):
+            states[i] = function[2](states[i], other_states[i])
+
+    def _output_record(self, key, states):
+        """Return an output record for a group key and its aggregate states."""
+        output_record = dict(itertools.izip(self.keys, key))
+        for output_field, function, state in itertools.izip(self._output_fields, self._functions, states):
+            output_record[output_field] = function[3](state) if function[3] else state
+        return output_record
+
+    def _spill(self, groups, spill_files):
+        """
+        Write partial group states to spill files, partitioned by a hash of the group key.
+        Each spill writes a single block, a list of (key, states) tuples, to each file.
+        Blocks are serialized using marshal, which is far faster than pickle, falling back
+        to cPickle for blocks containing other types, e.g. datetime values.
+        """
+        partitions = [[] for spill_file in spill_files]
+        for key, states in groups.iteritems():
+            partitions[hash(key) % self.spill_partitions].append((key, states))
+        for spill_file, partition in itertools.izip(spill_files, partitions):
+            try:
+                serializer, block = 'm', marshal.dumps(partition)
+            except ValueError:
+                serializer, block = 'p', cPickle.dumps(partition, cPickle.HIGHEST_PROTOCOL)
+            spill_file.write(self.spill_block_struct.pack(serializer, len(block)))
+            spill_file.write(block)
+
+    def _iter_spill_file(self, spill_file):
+        """Generator returning each (key, states) tuple from a spill file, in the order spilled."""
+        spill_file.seek(0)
+        while True:
+            block_header = spill_file.read(self.spill_block_struct.size)
+            if not block_header:
+                return
+            serializer, block_length = self.spill_block_struct.unpack(block_header)
+            block = spill_file.read(block_length)
+            partition = marshal.loads(block) if serializer == 'm' else cPickle.loads(block)
+            for key_states in partition:
+                yield key_states
+
+    def _aggregate_hash(self, records_iterable):
+        """Generator returning an output record per group, grouping records using a dictionary."""
+        groups = {}
+        spill_files = None
+        try:
+            for record in records_iterable:
+                key = self._group_key(record)
+                states = groups.get(key)
+                if states is None:
+                    if len(groups) >= self.max_groups:
+                        if spill_files is None:
+                            spill_files = [tempfile.TemporaryFile() for i in xrange(self.spill_partitions)]
+                        self._spill(groups, spill_files)
+                        groups = {}
+                    states = groups[key] = self._initial_states()
+                self._update(states, record)
+            if spill_files is None:
+                for key, states in groups.iteritems():
+                    yield self._output_record(key, states)
+                return
+            self._spill(groups, spill_files)
+            groups = None
+            # Partial states for a key are merged in the order they were spilled.
+            for spill_file in spill_files:
+                partition_groups = {}
+                for key, states in self._iter_spill_file(spill_file):
+                    if key in partition_groups:
+                        self._merge(partition_groups[key], states)
+                    else:
+                        partition_groups[key] = states
+                spill_file.close()
+                for key, states in partition_groups.iteritems():
+                    yield self._output_record(key, states)
+        finally:
+            for spill_file in spill_files or []:
+                spill_file.close()
+
+    def _aggregate_sorted(self, records_iterable):
+        """Generator returning an output record per group, as each group of sorted records ends."""
+        previous_key = None
+        for key, group_records in itertools.groupby(records_iterable, key=self._group_key):
+            if previous_key is not None and key < previous_key:
+                raise ValueError("Records are not sorted by keys %s: %s follows %s." % (self.keys, key, previous_key))
+            previous_key = key
+            states = self._initial_states()
+            for record in group_records:
+                self._update(states, record)
+            yield self._output_record(key, states)
+
+    def _process(self, records_iterable):
+        """Return an iterator of aggregated records."""
+        if self.mode == 'sorted':
+            return self._aggregate_sorted(records_iterable)
+        return self._aggregate_hash(records_iterable)
+
+
 class ProcessorConcatenateFields(ProcessorBaseClass):
     """
     Concatenate a user-provided set of fields for a given row
@@ -129,15 +377,217 @@ class ProcessorConcatenateFields(ProcessorBaseClass):
         write_record_iterator = itertools.imap(self._reducer, records_iterable)
         return write_record_iterator
 
+class BackgroundWriter(object):
+    """
+    Perform writes within a dedicated thread, overlapping file I/O with upstream processing.
+
+    Batches handed to ``put()`` are passed to ``write_function`` by the writer thread, in order.
+    The queue of pending batches is bounded, so a slow writer blocks the pipeline rather than
+    accumulating records in memory. An exception raised by ``write_function`` is re-raised
+    within the pipeline by the next call to ``put()`` or ``close()``.
+
+    :param write_function: callable accepting a single batch.
+    :param queue_size: maximum number of batches waiting to be written.
+    """
+    # Placed on the queue by close(), ending the writer thread.
+    _stop = object()
+
+    def __init__(self, write_function, queue_size=8):
+        self.write_function = write_function
+        self._queue = Queue.Queue(int(queue_size))
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """
+        Write batches until stopped. After an error, remaining batches are
+        discarded so that the pipeline is never blocked on a full queue.
+        """
+        while True:
+            batch = self._queue.get()
+            if batch is self._stop:
+                return
+            if self._error is None:
+                try:
+                    self.write_function(batch)
+                except Exception:
+                    self._error = sys.exc_info()
+
+    def _raise_error(self):
+        """Re-raise an exception from the writer thread, with its original traceback."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error[0], error[1], error[2]
+
+    def put(self, batch):
+        """Queue a batch for writing, blocking while the queue is full."""
+        self._raise_error()
+        self._queue.put(batch)
+
+    def close(self):
+        """Wait for all queued batches to be written, raising any writer error."""
+        if self._thread:
+            self._queue.put(self._stop)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+
+def _compress_block(block_args):
+    """
+    Return a block of data compressed as a complete, independent gzip member, bz2 or xz stream.
+    block_args is a (compression suffix, compression level, data) tuple.
+    Defined at the module level so that it can be pickled and run within a worker process.
+    """
+    suffix, level, data = block_args
+    if suffix == '.gz':
+        member = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=member, mode='wb', compresslevel=level, mtime=0) as gzip_handle:
+            gzip_handle.write(data)
+        return member.getvalue()
+    if suffix == '.bz2':
+        return bz2.compress(data, level)
+    from backports import lzma
+    return lzma.compress(data, preset=level)
+
+
+class CompressedOutputFile(object):
+    """
+    A write only file object compressing its output as gzip, bz2 or xz, chosen by the
+    suffix of ``path``.
+
+    Written data is split into blocks, each compressed as an independent gzip member or
+    bz2/xz stream by a pool of worker processes, and written to the file in order.
+    Concatenated members form a valid compressed file, readable by gzip, bzip2 and xz,
+    and by ``readers.open_input`` in any ``decompress`` mode. Python 2 lacks the
+    lzma module, so xz output requires the backports.lzma package.
+
+    Calling ``flush()`` compresses any buffered data as a final block, leaving a complete file.
+
+    :param path: output path, ending with '.gz', '.bz2' or '.xz'.
+    :param mode: 'w' to write, or 'a' to append further members to an existing file.
+    :param processes: number of worker processes. Defaults to the number of CPUs.
+        A value of 1 compresses within the current process.
+    :param block_size: size in bytes of each uncompressed block.
+    :param level: compression level, from 1 (fastest) to 9 (smallest).
+    :param buffer_size: size in bytes of the output file buffer.
+    """
+    suffixes = ('.gz', '.bz2', '.xz')
+
+    def __init__(self, path, mode='w', processes=None, block_size=1 << 20, level=6, buffer_size=1 << 20):
+        self.suffix = readers.compression_suffix(path)
+        if self.suffix not in self.suffixes:
+            raise ValueError("Compressed output requires a path ending with one of %s." % ', '.join(self.suffixes))
+        if self.suffix == '.xz':
+            # Fail before opening the file if xz compression is unavailable.
+            try:
+                from backports import lzma
+            except ImportError:
+                raise ValueError("xz output requires the backports.lzma package.")
+        self.name = path
+        self.processes = processes
+        self.block_size = int(block_size)
+        self.level = int(level)
+        self._file = open(path, mode + 'b', int(buffer_size))
+        self._buffer = []
+        self._buffered_size = 0
+        self._pending = deque()
+        self._pool = None
+        if processes != 1:
+            self._pool = multiprocessing.Pool(processes)
+            self._max_pending = 2 * (processes or multiprocessing.cpu_count())
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def _compress_buffer(self):
+        """Compress the buffered data as a block, writing completed blocks in order."""
+        if not self._buffered_size:
+            return
+        block_args = (self.suffix, self.level, ''.join(self._buffer))
+        self._buffer = []
+        self._buffered_size = 0
+        if self._pool is None:
+            self._file.write(_compress_block(block_args))
+            return
+        self._pending.append(self._pool.apply_async(_compress_block, (block_args,)))
+        # Bound the number of blocks in flight, writing the oldest first.
+        while len(self._pending) > self._max_pending:
+            self._file.write(self._pending.popleft().get())
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered_size += len(data)
+        if self._buffered_size >= self.block_size:
+            self._compress_buffer()
+
+    def flush(self):
+        """Compress and write all buffered data."""
+        self._compress_buffer()
+        while self._pending:
+            self._file.write(self._pending.popleft().get())
+        self._file.flush()
+
+    def close(self):
+        """Write all buffered data, then close the file and worker pool."""
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            if self._pool:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def __del__(self):
+        """Terminate the worker pool, if the file was not closed."""
+        if self._pool:
+            self._pool.terminate()
+            self._pool = None
+
+
+def _csv_output_row(row, fields):
+    """
+    Return a list of the values of a record to be written to a CSV file, ordered by fields.
+    Missing fields are written as empty values. Unicode values are encoded as UTF8.
+    """
+    return [v.encode('utf8') if isinstance(v, unicode) else v for v in itertools.imap(row.get, fields)]
+
+
 class ProcessorCSVWriter(ProcessorBaseClass):
     """
     Write records to an output CSV file.
 
+    Output rows are built in the order given by ``fields``, encoding only the values
+    written, and are written in batches through a buffered file handle. Records are
+    passed on unmodified.
+
     Required Config Parameters:
 
     :param str path: Absolute path for output CSV file.
     :param list fields: A list of field names to output.
 
+    Non-Required Config Parameters:
+
+    :param str mode: Either "write" or "append". When appending, records are added to
+        an existing file, and a header is only written if the file is empty. Useful
+        alongside readers using a ``watermark_column``. DEFAULTS to "write".
+    :param int batch_size: Number of rows passed to each csv writerows() call. DEFAULTS to 1000.
+    :param int buffer_size: Size in bytes of the output file buffer. DEFAULTS to 1048576.
+    :param bool background: If true, batches are written by a ``BackgroundWriter`` thread,
+        overlapping disk writes with upstream processing. DEFAULTS to false.
+    :param int queue_size: Used with ``background``. Maximum number of batches waiting to be
+        written before upstream processing is blocked. DEFAULTS to 8.
+    :param int compression_processes: Used when ``path`` ends with '.gz', '.bz2' or '.xz'. Number of
+        worker processes compressing output blocks. See ``CompressedOutputFile``. DEFAULTS to the number of CPUs.
+    :param int compression_level: Used when ``path`` ends with '.gz', '.bz2' or '.xz'. From 1 (fastest)
+        to 9 (smallest). DEFAULTS to 6.
+
     Example configuration file entry::
 
         {"ProcessorCSVWriter": {
@@ -145,32 +595,76 @@ class ProcessorCSVWriter(ProcessorBaseClass):
             "fields": ["Age", "Gender", "Name"]
         }}
 
+    Example configuration file entry for gzip compressed output::
+
+        {"ProcessorCSVWriter": {
+            "path":"/path/to/out_data.csv.gz",
+            "fields": ["Age", "Gender", "Name"],
+            "compression_processes": 4
+        }}
+
     """
-    def __init__(self, processor, path, fields, delimiter=',', **kwargs):
+    def __init__(self, processor, path, fields, delimiter=',', mode='write', batch_size=1000,
+                 buffer_size=1 << 20, background=False, queue_size=8, compression_processes=None,
+                 compression_level=6, **kwargs):
         self.processor = processor
         self.path = path
         self.fields = fields
         self.delimiter = delimiter
-        self.file = open(self.path, 'w')
-        self.d_writer = csv.DictWriter(self.file, self.fields, delimiter=self.delimiter, extrasaction='ignore')
+        self.mode = mode.lower()
+        if self.mode not in ('write', 'append'):
+            raise ValueError("Mode Not Supported")
+        self.batch_size = int(batch_size)
+        self.background = background
+        self.queue_size = queue_size
+        # An appended file only requires a header if it is empty.
+        self.write_header = self.mode == 'write' or not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        self.compressed = bool(readers.compression_suffix(self.path))
+        if self.compressed:
+            self.file = CompressedOutputFile(self.path, 'a' if self.mode == 'append' else 'w',
+                                             compression_processes, level=compression_level,
+                                             buffer_size=buffer_size)
+        else:
+            self.file = open(self.path, 'a' if self.mode == 'append' else 'w', int(buffer_size))
+        self.writer = csv.writer(self.file, delimiter=self.delimiter)
 
     def _log(self, mod_records_iterable):
         """Alert that CSV output is beginning."""
         print "Starting AggregateProcessorCSVWriter"
 
-    def _write_row(self, row):
-        # Convert Unicode values to 8-bit UTF8 encoded string.
-        for k, v in row.iteritems():
-            if isinstance(v, unicode):
-                row[k] = v.encode('utf8')
-        self.d_writer.writerow(row)
-        return row
+    def _write_rows(self, records_iterable):
+        """
+        Generator returning each record, writing output rows in batches.
+        Remaining rows are written and the file flushed once all records have been read.
+        Compressed files are closed, shutting down their worker pool.
+        """
+        write_batch = self.writer.writerows
+        background_writer = None
+        if self.background:
+            background_writer = BackgroundWriter(self.writer.writerows, self.queue_size)
+            write_batch = background_writer.put
+        try:
+            batch = []
+            for record in records_iterable:
+                batch.append(_csv_output_row(record, self.fields))
+                if len(batch) >= self.batch_size:
+                    write_batch(batch)
+                    batch = []
+                yield record
+            write_batch(batch)
+        finally:
+            if background_writer:
+                background_writer.close()
+        if self.compressed:
+            self.file.close()
+        else:
+            self.file.flush()
 
     def _process(self, records_iterable):
         """Write inRecords out to a given CSV file"""
-        self.d_writer.writeheader()
-        write_record_iterator = itertools.imap(self._write_row, records_iterable)
-        return write_record_iterator
+        if self.write_header:
+            self.writer.writerow(self.fields)
+        return self._write_rows(records_iterable)
 
     def __exit__(self):
         """
@@ -257,14 +751,18 @@ class ProcessorGetData(ProcessorBaseClass):
 
     :param str reader: name of a given reader.
 
+    Readers reading incrementally store their high-water mark using
+    the key "<layer name>/<reader name>".
+
     Example configuration file entry::
 
         {"ProcessorGetData": {"reader": "Grades"}},
     """
-    def __init__(self, processor, reader, readers, **kwargs):
+    def __init__(self, processor, reader, readers, layer=None, **kwargs):
         self.processor = processor
         self.reader_name = reader
         self.readers = readers
+        self.layer_name = layer
 
     def _get_reader_class(self):
         """
@@ -283,7 +781,11 @@ class ProcessorGetData(ProcessorBaseClass):
         """Return the generator for a given reader."""
         print "in ProcessorGetData._process() %s" % self.reader_name
         reader_class = self._get_reader_class()
-        reader_kwargs = self.readers[reader_name]
+        reader_kwargs = dict(self.readers[reader_name])
+        if self.layer_name:
+            reader_kwargs.setdefault('watermark_key', '%s/%s' % (self.layer_name, reader_name))
+        else:
+            reader_kwargs.setdefault('watermark_key', reader_name)
         reader_instance = reader_class(**reader_kwargs)
         return reader_instance.__iter__()
 
@@ -378,7 +880,7 @@ class ProcessorCombineData_ValueHash(ProcessorBaseClass):
     def __init__(self, processor, reader, keys, readers, **kwargs):
         self.processor = processor
         self.join_keys = keys
-        self.new_reader_iterable = ProcessorGetData(None, reader, readers).process(reader)
+        self.new_reader_iterable = ProcessorGetData(None, reader, readers, kwargs.get('layer')).process(reader)
 
     def _filter_keys(self, in_record):
         """Return True if records have matching self.join_keys values."""
@@ -566,6 +1068,756 @@ class ProcessorMatchValue(ProcessorBaseClass):
         return matched_iterator
 
 
+class ProcessorPartitionedCSVWriter(ProcessorBaseClass):
+    """
+    Write records to many output CSV files in a single pass, routing each record to a file
+    named by the values of one or more of its fields.
+
+    ``path`` is a template containing ``{field}`` placeholders, each replaced with the record's
+    value for that field. Path separators within values are replaced with underscores.
+    Rows are buffered per partition, and written in batches. At most ``max_open_files``
+    files are held open at once, the least recently written file being closed when the
+    limit is reached, then reopened for appending if further records arrive.
+
+    Required Config Parameters:
+
+    :param str path: Absolute path template for output CSV files, e.g. "/path/to/frs_{STATE_CODE}.csv"
+    :param list fields: A list of field names to output.
+
+    Non-Required Config Parameters:
+
+    :param int max_open_files: Maximum number of open output files. DEFAULTS to 64.
+    :param int batch_size: Number of rows buffered for a partition before being written. DEFAULTS to 1000.
+    :param int buffer_size: Size in bytes of each output file buffer. DEFAULTS to 65536.
+    :param int compression_level: Used when ``path`` ends with '.gz', '.bz2' or '.xz'. Each partition
+        is compressed within the current process, see ``CompressedOutputFile``. DEFAULTS to 6.
+
+    Example configuration file entry::
+
+        {"ProcessorPartitionedCSVWriter": {
+            "path": "/path/to/out_data_{STATE_CODE}.csv",
+            "fields": ["REGISTRY_ID", "PRIMARY_NAME", "STATE_CODE"]
+        }}
+
+    """
+    def __init__(self, processor, path, fields, delimiter=',', max_open_files=64, batch_size=1000,
+                 buffer_size=1 << 16, compression_level=6, **kwargs):
+        self.processor = processor
+        self.path = path
+        self.fields = fields
+        self.delimiter = delimiter
+        self.max_open_files = int(max_open_files)
+        if self.max_open_files < 1:
+            raise ValueError("max_open_files must be at least 1.")
+        self.batch_size = int(batch_size)
+        self.buffer_size = int(buffer_size)
+        self.compression_level = int(compression_level)
+        self.partition_fields = re.findall(r'\{([^{}]+)\}', path)
+        if not self.partition_fields:
+            raise ValueError("Path %s contains no {field} placeholders." % path)
+        # Partition key: list of rows waiting to be written.
+        self._pending = {}
+        # Partition path: (file handle, csv writer), ordered from least to most recently written.
+        # Keyed by path, as values sanitized to the same path, e.g. 'a/b' and 'a_b', share a file.
+        self._open_files = OrderedDict()
+        # Paths written during this run. Files are truncated on first use, and appended to after.
+        self._written_paths = set()
+
+    def _partition_path(self, key):
+        """Return the output path for a partition key, a tuple of partition field values."""
+        partition_path = self.path
+        for field, value in itertools.izip(self.partition_fields, key):
+            if isinstance(value, unicode):
+                value = value.encode('utf8')
+            value = str('' if value is None else value).replace(os.sep, '_')
+            partition_path = partition_path.replace('{%s}' % field, value)
+        return partition_path
+
+    def _partition_writer(self, key):
+        """
+        Return the csv writer for a partition, opening its file if required.
+        Closes the least recently written file when max_open_files is reached.
+        """
+        partition_path = self._partition_path(key)
+        if partition_path in self._open_files:
+            # Move to the most recently written position.
+            file_writer = self._open_files.pop(partition_path)
+        else:
+            if len(self._open_files) >= self.max_open_files:
+                self._open_files.popitem(last=False)[1][0].close()
+            partition_dir = os.path.dirname(partition_path)
+            if partition_dir and not os.path.isdir(partition_dir):
+                os.makedirs(partition_dir)
+            file_mode = 'a' if partition_path in self._written_paths else 'w'
+            if readers.compression_suffix(partition_path):
+                partition_file = CompressedOutputFile(partition_path, file_mode, processes=1,
+                                                      level=self.compression_level, buffer_size=self.buffer_size)
+            else:
+                partition_file = open(partition_path, file_mode, self.buffer_size)
+            file_writer = partition_file, csv.writer(partition_file, delimiter=self.delimiter)
+            if file_mode == 'w':
+                self._written_paths.add(partition_path)
+                file_writer[1].writerow(self.fields)
+        self._open_files[partition_path] = file_writer
+        return file_writer[1]
+
+    def _write_partition(self, key):
+        """Write the pending rows of a partition."""
+        self._partition_writer(key).writerows(self._pending.pop(key))
+
+    def close(self):
+        """Write all pending rows, and close all open files."""
+        for key in self._pending.keys():
+            self._write_partition(key)
+        while self._open_files:
+            self._open_files.popitem()[1][0].close()
+
+    def _write_rows(self, records_iterable):
+        """Generator returning each record, routing output rows to their partition."""
+        get_key = operator.itemgetter(*self.partition_fields)
+        single_field = len(self.partition_fields) == 1
+        try:
+            for record in records_iterable:
+                key = get_key(record)
+                if single_field:
+                    key = (key,)
+                partition_rows = self._pending.setdefault(key, [])
+                partition_rows.append(_csv_output_row(record, self.fields))
+                if len(partition_rows) >= self.batch_size:
+                    self._write_partition(key)
+                yield record
+        finally:
+            self.close()
+
+    def _process(self, records_iterable):
+        """Write records out to partitioned CSV files."""
+        return self._write_rows(records_iterable)
+
+
+class ProcessorPostgresWriter(ProcessorBaseClass, readers.PostgresConnectionMixin):
+    """
+    Load records into a Postgres table using ``COPY ... FROM STDIN``, in batches.
+
+    The entire load runs within a single transaction, committed once all records have been
+    written. Should an error occur, the transaction is rolled back, leaving the table unchanged.
+
+    Three modes are supported:
+
+    * 'append' - add records to the table.
+    * 'truncate' - replace the contents of the table.
+    * 'upsert' - insert records, updating existing rows sharing the values of ``key_fields``.
+      Requires Postgres 9.5 or later, and a unique index or constraint on ``key_fields``.
+      Each batch is copied to a temporary table, then merged using ``INSERT ... ON CONFLICT``.
+
+    With ``staging``, all records are first copied into a staging table, created alongside the
+    target table using ``CREATE TABLE ... (LIKE table INCLUDING ALL)``. Once loaded, the staging
+    table is appended to or merged into the target table or, when truncating, swapped in place
+    of the target table, which is dropped. This keeps the target table available to readers
+    until the load completes, rather than locking it from the start. Note that the swapped in
+    table does not carry over the target table's grants.
+
+    A table referenced by views or foreign keys can't be dropped. In that case, or with ``swap``
+    set to false, a truncating load instead truncates the target table and inserts the staging
+    table's rows, within the same transaction, keeping the table, its grants and dependents.
+
+    Required Config Parameters:
+
+    :param str table: Name of the target table, optionally schema qualified, e.g. "public.facilities".
+    :param list fields: A list of field names to load, matching the table's column names.
+    :param str database: Name of the database to connect to.
+
+    Non-Required Config Parameters:
+
+    :param str user: db user to connect as.
+    :param str password: password for db user.
+    :param str host: host name, defaults to localhost.
+    :param int port: port number, defaults to 5432.
+    :param str mode: One of "append", "truncate" or "upsert". DEFAULTS to "append".
+    :param list key_fields: Used with a mode of "upsert". Fields identifying an existing row.
+    :param bool staging: If true, load into a staging table before appending, merging or swapping.
+        DEFAULTS to false.
+    :param bool swap: Used with ``staging`` and a mode of "truncate". If true, swap the staging table
+        in place of the target table, otherwise truncate the target table and insert the staged rows.
+        DEFAULTS to true.
+    :param int batch_size: Number of records sent per COPY statement. DEFAULTS to 10000.
+    :param int pool_size: If given, borrow a connection from the ``PostgresConnectionPool`` shared with
+        readers using the same connection parameters. See ``ReaderPostgres``.
+    :param int pool_timeout: Used with ``pool_size``. Seconds to wait for a free connection. DEFAULTS to 30.
+
+    NOTE: Values are sent as CSV, None values as NULL. A text value of '\\N' is indistinguishable from NULL.
+
+    Example configuration file entry::
+
+        {"ProcessorPostgresWriter": {
+            "table": "public.frs_facilities",
+            "fields": ["registry_id", "primary_name", "state_code"],
+            "database": "dbname",
+            "user": "postgres",
+            "mode": "truncate",
+            "staging": true
+        }}
+
+    Example configuration file entry for upserts::
+
+        {"ProcessorPostgresWriter": {
+            "table": "public.frs_facilities",
+            "fields": ["registry_id", "primary_name", "state_code"],
+            "database": "dbname",
+            "mode": "upsert",
+            "key_fields": ["registry_id"]
+        }}
+    """
+    copy_null = '\\N'
+    staging_suffix = '_dp_staging'
+
+    def __init__(self, processor, table, fields, database, user=None, password=None, host='localhost', port=5432,
+                 mode='append', key_fields=None, staging=False, swap=True, batch_size=10000, pool_size=None,
+                 pool_timeout=30, **kwargs):
+        self.processor = processor
+        self._init_connection_params(database, user, password, host, port, pool_size, pool_timeout)
+        self.table = table
+        self.fields = fields
+        self.mode = mode.lower()
+        if self.mode not in ('append', 'truncate', 'upsert'):
+            raise ValueError("Mode Not Supported")
+        self.key_fields = key_fields or []
+        if self.mode == 'upsert' and not self.key_fields:
+            raise ValueError("ProcessorPostgresWriter upsert mode requires key_fields.")
+        self.staging = staging
+        self.swap = swap
+        self.batch_size = int(batch_size)
+        # Name of the table records are copied into, set when loading begins.
+        self._load_table = None
+
+    def _quote_identifier(self, identifier):
+        """Return a double-quoted SQL identifier. Schema qualified names are quoted by part."""
+        return '.'.join('"%s"' % part.replace('"', '""') for part in identifier.split('.'))
+
+    def _column_list(self, fields):
+        return ', '.join(self._quote_identifier(field) for field in fields)
+
+    def _output_row(self, row):
+        """
+        Return a list of the values of a record to be copied, ordered by self.fields.
+        Missing and None values are sent as NULL. Unicode values are encoded as UTF8.
+        """
+        output_row = []
+        for value in itertools.imap(row.get, self.fields):
+            if value is None:
+                value = self.copy_null
+            elif isinstance(value, unicode):
+                value = value.encode('utf8')
+            output_row.append(value)
+        return output_row
+
+    def _merge_statement(self, source_table):
+        """Return an INSERT ... ON CONFLICT statement merging source_table into the target table."""
+        columns = self._column_list(self.fields)
+        update_fields = [f for f in self.fields if f not in self.key_fields]
+        if update_fields:
+            conflict_action = 'DO UPDATE SET ' + ', '.join(
+                '%s = EXCLUDED.%s' % (self._quote_identifier(f), self._quote_identifier(f)) for f in update_fields)
+        else:
+            conflict_action = 'DO NOTHING'
+        return 'INSERT INTO %s (%s) SELECT %s FROM %s ON CONFLICT (%s) %s' % (
+            self._quote_identifier(self.table), columns, columns, source_table,
+            self._column_list(self.key_fields), conflict_action)
+
+    def _begin_load(self, cursor):
+        """Prepare the table records are copied into."""
+        table = self._quote_identifier(self.table)
+        if self.staging:
+            self._load_table = self._quote_identifier(self.table + self.staging_suffix)
+            cursor.execute('DROP TABLE IF EXISTS %s' % self._load_table)
+            cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING ALL)' % (self._load_table, table))
+        elif self.mode == 'upsert':
+            self._load_table = self._quote_identifier('dp_upsert' + self.staging_suffix)
+            cursor.execute('CREATE TEMPORARY TABLE %s (LIKE %s INCLUDING DEFAULTS) ON COMMIT DROP' %
+                           (self._load_table, table))
+        else:
+            self._load_table = table
+            if self.mode == 'truncate':
+                cursor.execute('TRUNCATE TABLE %s' % table)
+
+    def _copy_batch(self, cursor, batch):
+        """Copy a batch of output rows into the load table, merging if upserting without staging."""
+        if not batch:
+            return
+        batch_file = StringIO.StringIO()
+        csv.writer(batch_file).writerows(batch)
+        batch_file.seek(0)
+        cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '%s')" % (
+            self._load_table, self._column_list(self.fields), self.copy_null), batch_file)
+        if self.mode == 'upsert' and not self.staging:
+            cursor.execute(self._merge_statement(self._load_table))
+            cursor.execute('TRUNCATE TABLE %s' % self._load_table)
+
+    def _swap_tables(self, cursor):
+        """
+        Replace the target table with the staging table. Returns False, leaving both tables
+        in place, if the target table can't be dropped as views or foreign keys depend upon it.
+        """
+        cursor.execute('SAVEPOINT dp_swap')
+        try:
+            cursor.execute('DROP TABLE %s' % self._quote_identifier(self.table))
+        except psycopg2.Error as e:
+            if e.pgcode != psycopg2.errorcodes.DEPENDENT_OBJECTS_STILL_EXIST:
+                raise
+            cursor.execute('ROLLBACK TO SAVEPOINT dp_swap')
+            return False
+        cursor.execute('ALTER TABLE %s RENAME TO %s' % (
+            self._load_table, self._quote_identifier(self.table.split('.')[-1])))
+        cursor.execute('RELEASE SAVEPOINT dp_swap')
+        return True
+
+    def _finish_load(self, cursor):
+        """Append, merge or swap a staging table into the target table."""
+        if not self.staging:
+            return
+        table = self._quote_identifier(self.table)
+        if self.mode == 'truncate':
+            if self.swap and self._swap_tables(cursor):
+                return
+            cursor.execute('TRUNCATE TABLE %s' % table)
+        if self.mode == 'upsert':
+            cursor.execute(self._merge_statement(self._load_table))
+        else:
+            columns = self._column_list(self.fields)
+            cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s' % (table, columns, columns, self._load_table))
+        cursor.execute('DROP TABLE %s' % self._load_table)
+
+    def _write_rows(self, records_iterable):
+        """
+        Generator returning each record, copying output rows in batches.
+        The transaction is committed once all records have been read.
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            self._begin_load(cursor)
+            batch = []
+            for record in records_iterable:
+                batch.append(self._output_row(record))
+                if len(batch) >= self.batch_size:
+                    self._copy_batch(cursor, batch)
+                    batch = []
+                yield record
+            self._copy_batch(cursor, batch)
+            self._finish_load(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_connection(conn)
+
+    def _process(self, records_iterable):
+        """Load records into a Postgres table."""
+        return self._write_rows(records_iterable)
+
+
+class FieldProfile(object):
+    """
+    Bounded memory summary of the values of a single field, used by ``ProcessorProfile``.
+    """
+    def __init__(self, precision, top_k, top_k_capacity, kll_k, seed):
+        self.count = 0
+        self.empty = 0
+        self.numeric = 0
+        self.minimum = None
+        self.maximum = None
+        self.top_k = top_k
+        self.distinct = sketches.HyperLogLog(precision)
+        self.quantiles = sketches.KLLSketch(kll_k, seed)
+        self.frequent = sketches.SpaceSaving(top_k_capacity)
+
+    def add(self, value):
+        """Add a non-null value to the profile."""
+        self.count += 1
+        if value == '':
+            self.empty += 1
+        self.distinct.add(value)
+        if isinstance(value, (dict, list)):
+            # Unhashable values, e.g. geometries, are counted by their representation.
+            self.frequent.add(repr(value))
+        else:
+            self.frequent.add(value)
+        if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            self.numeric += 1
+            self.quantiles.add(value)
+            if self.minimum is None or value < self.minimum:
+                self.minimum = value
+            if self.maximum is None or value > self.maximum:
+                self.maximum = value
+
+    def report(self, records, fractions):
+        """Return a dict summarizing the field, given the total number of records seen."""
+        nulls = records - self.count
+        field_report = OrderedDict([
+            ('count', self.count),
+            ('nulls', nulls),
+            ('null_rate', float(nulls) / records if records else None),
+            ('empty', self.empty),
+            ('empty_rate', float(self.empty) / records if records else None),
+            ('distinct', self.distinct.count() if self.count else 0),
+            ('numeric', self.numeric)
+        ])
+        if self.numeric:
+            field_report['min'] = self.minimum
+            field_report['max'] = self.maximum
+            field_report['quantiles'] = OrderedDict(
+                (str(fraction), value) for fraction, value in
+                itertools.izip(fractions, self.quantiles.quantiles(fractions)))
+        field_report['top_values'] = [OrderedDict([('value', self._report_value(value)), ('count', count),
+                                                   ('error', error)])
+                                      for value, count, error in self.frequent.top(self.top_k)]
+        return field_report
+
+    def _report_value(self, value):
+        """Return a value for the JSON report. Byte strings which aren't UTF8 are decoded with replacements."""
+        if isinstance(value, str):
+            return value.decode('utf8', 'replace')
+        return value
+
+
+class ProcessorProfile(ProcessorBaseClass):
+    """
+    Profile the values of each field in a single pass, writing a JSON report once all records
+    have been read. Records are passed through unchanged, so a profile can be taken alongside
+    any other output.
+
+    Each field is summarized using bounded memory, regardless of the number of records
+    (see ``dataplunger.sketches``):
+
+    * ``count``, ``nulls``, ``empty``: exact counts of values, missing or None values, and empty strings.
+      Rates are relative to the total number of records.
+    * ``distinct``: the approximate number of distinct values, using HyperLogLog.
+    * ``min``, ``max``, ``quantiles``: for int and float values only. Quantiles are approximate,
+      using a KLL sketch. Use ``field_types`` on a reader to cast numeric strings.
+    * ``top_values``: the approximate most frequent values, using Space-Saving. Each count is an
+      overestimate by at most its ``error``.
+
+    Required Config Parameters:
+
+    :param str path: Absolute path for the output JSON report.
+
+    Non-Required Config Parameters:
+
+    :param list fields: A list of field names to profile. DEFAULTS to all fields seen.
+    :param list quantiles: Fractions of numeric values to report. DEFAULTS to [0.01, 0.25, 0.5, 0.75, 0.99].
+    :param int top_k: Number of most frequent values to report. DEFAULTS to 10.
+    :param int top_k_capacity: Number of values tracked for top_k, increasing accuracy. DEFAULTS to 10 * top_k.
+    :param int precision: HyperLogLog precision, from 4 to 18. Error is ~1.04 / sqrt(2 ** precision). DEFAULTS to 14.
+    :param int kll_k: KLL sketch size. Rank error is ~1.7 / kll_k. DEFAULTS to 200.
+    :param int seed: Random seed for quantile sketches, for reproducible reports. DEFAULTS to None.
+
+    Example configuration file entry::
+
+        {"ProcessorProfile": {
+            "path": "/path/to/facilities_profile.json",
+            "fields": ["STATE_CODE", "LATITUDE83", "LONGITUDE83"],
+            "quantiles": [0.05, 0.5, 0.95],
+            "top_k": 5
+        }}
+    """
+    def __init__(self, processor, path, fields=None, quantiles=(0.01, 0.25, 0.5, 0.75, 0.99), top_k=10,
+                 top_k_capacity=None, precision=14, kll_k=200, seed=None, **kwargs):
+        self.processor = processor
+        self.path = path
+        self.fields = fields
+        self.quantiles = list(quantiles)
+        self.top_k = top_k
+        self.top_k_capacity = top_k_capacity or 10 * top_k
+        self.precision = precision
+        self.kll_k = kll_k
+        self.seed = seed
+        # Validate sketch parameters up front, rather than on the first record.
+        sketches.HyperLogLog(precision)
+
+    def _new_field_profile(self):
+        return FieldProfile(self.precision, self.top_k, self.top_k_capacity, self.kll_k, self.seed)
+
+    def _profile_records(self, records_iterable):
+        """
+        Generator returning each record, adding its values to the profile of each field.
+        The report is written once all records have been read.
+        """
+        profiles = OrderedDict((field, self._new_field_profile()) for field in self.fields or [])
+        records = 0
+        for record in records_iterable:
+            records += 1
+            if self.fields:
+                for field, profile in profiles.iteritems():
+                    value = record.get(field)
+                    if value is not None:
+                        profile.add(value)
+            else:
+                for field, value in record.iteritems():
+                    if value is not None:
+                        if field not in profiles:
+                            profiles[field] = self._new_field_profile()
+                        profiles[field].add(value)
+            yield record
+        report = OrderedDict([
+            ('records', records),
+            ('fields', OrderedDict((field, profile.report(records, self.quantiles))
+                                   for field, profile in profiles.iteritems()))
+        ])
+        with open(self.path, 'w') as file_handle:
+            # Values JSON can't represent, e.g. dates or decimals, are written as text.
+            json.dump(report, file_handle, indent=2, default=unicode)
+
+    def _process(self, records_iterable):
+        """Profile records, writing a JSON report."""
+        return self._profile_records(records_iterable)
+
+
+class ProcessorRecordFileWriter(ProcessorBaseClass):
+    """
+    Write records to a record file, a typed binary format read by ``ReaderRecordFile``.
+    Record files preserve the types of values, so that a following layer or configuration
+    can read them without parsing text or re-casting values. See ``dataplunger.recordfile``.
+
+    The minimum and maximum values of each column are recorded for each row group, allowing
+    ``ReaderRecordFile`` filters to skip row groups. Skipping is most effective when records are
+    sorted on the filtered field, e.g. using ``ProcessorSortRecords`` before writing.
+
+    Required Config Parameters:
+
+    :param str path: Absolute path for the output record file.
+    :param list fields: A list of field names to output.
+
+    Non-Required Config Parameters:
+
+    :param dict field_types: a mapping of field names to column types, one of 'int', 'float',
+        'bool', 'string', 'bytes' or 'object'. Values of these fields are cast when written,
+        e.g. strings read from a CSV file. Types of other fields are inferred from their values.
+    :param int row_group_size: Number of records per row group. DEFAULTS to 65536.
+    :param compression: Either a codec applied to all fields, or a mapping of field names to codecs.
+        One of 'none', 'zlib' or 'bz2'. DEFAULTS to 'none'.
+
+    Example configuration file entry::
+
+        {"ProcessorRecordFileWriter": {
+            "path": "/path/to/facilities.dprf",
+            "fields": ["REGISTRY_ID", "PRIMARY_NAME", "STATE_CODE"],
+            "field_types": {"REGISTRY_ID": "int"},
+            "compression": {"PRIMARY_NAME": "zlib"}
+        }}
+    """
+    def __init__(self, processor, path, fields, field_types=None, row_group_size=65536, compression=None,
+                 **kwargs):
+        self.processor = processor
+        self.path = path
+        self.fields = fields
+        self.field_types = field_types
+        self.row_group_size = row_group_size
+        self.compression = compression
+
+    def _write_records(self, records_iterable):
+        """
+        Generator returning each record, writing it to the record file.
+        The file is completed once all records have been read. If an upstream step fails,
+        or iteration stops early, the incomplete file is removed rather than completed.
+        """
+        with recordfile.RecordFileWriter(self.path, self.fields, self.field_types, self.row_group_size,
+                                         self.compression) as record_writer:
+            for record in records_iterable:
+                record_writer.write(record)
+                yield record
+
+    def _process(self, records_iterable):
+        """Write records out to a record file."""
+        return self._write_records(records_iterable)
+
+
+# Depth of coordinate sequence nesting within each geometry type's coordinates.
+GEOMETRY_DEPTHS = {
+    'Point': 0,
+    'LineString': 1,
+    'MultiPoint': 1,
+    'Polygon': 2,
+    'MultiLineString': 2,
+    'MultiPolygon': 3
+}
+
+
+def _coordinate_sequences(coordinates, depth):
+    """
+    Return a list of coordinate sequences (lists of coordinate tuples) found within
+    a geometry's coordinates. A Point's coordinates are returned as a one element sequence.
+    """
+    if depth == 0:
+        return [[coordinates]]
+    if depth == 1:
+        return [coordinates]
+    return [sequence for part in coordinates for sequence in _coordinate_sequences(part, depth - 1)]
+
+
+def _replace_coordinate_sequences(coordinates, depth, sequences):
+    """
+    Return a geometry's coordinates, with each coordinate sequence replaced by
+    the next member of the iterator, sequences.
+    """
+    if depth == 0:
+        return next(sequences)[0]
+    if depth == 1:
+        return next(sequences)
+    return [_replace_coordinate_sequences(part, depth - 1, sequences) for part in coordinates]
+
+
+class ProcessorReproject(ProcessorBaseClass):
+    """
+    Transform record geometries from one coordinate reference system to another.
+
+    Records are processed in batches. The coordinates of every geometry within a batch are
+    flattened into lists of x and y values, and transformed by a single call to fiona.transform.transform().
+    Geometries are emitted as two dimensional Fiona geometries, e.g.::
+
+        {'type': 'Point', 'coordinates': (111319.49, 334111.17)}
+
+    Required Config Parameters:
+
+    :param str src_crs: Source coordinate reference system, e.g. "EPSG:4326".
+    :param str dst_crs: Destination coordinate reference system, e.g. "EPSG:3857".
+
+    Non-Required Config Parameters:
+
+    :param int batch_size: Number of records transformed per call. Defaults to 1000.
+    :param str geometry_field: Field name containing a geometry. Defaults to "geometry".
+
+    Example configuration file entry::
+
+        {"ProcessorReproject": {
+            "src_crs": "EPSG:4326",
+            "dst_crs": "EPSG:3857"
+        }}
+    """
+    def __init__(self, processor, src_crs, dst_crs, batch_size=1000, geometry_field='geometry', **kwargs):
+        self.processor = processor
+        self.src_crs = src_crs
+        self.dst_crs = dst_crs
+        self.batch_size = int(batch_size)
+        self.geometry_field = geometry_field
+
+    def _transform_batch(self, batch):
+        """Transform the geometries of a list of records, returning the list."""
+        geometries = [record[self.geometry_field] for record in batch if record.get(self.geometry_field)]
+        sequences = [sequence for geometry in geometries
+                     for sequence in _coordinate_sequences(geometry['coordinates'], GEOMETRY_DEPTHS[geometry['type']])]
+        if not sequences:
+            return batch
+        xs = [c[0] for sequence in sequences for c in sequence]
+        ys = [c[1] for sequence in sequences for c in sequence]
+        new_xs, new_ys = fiona.transform.transform(self.src_crs, self.dst_crs, xs, ys)
+
+        # Split the transformed coordinates back into sequences, then geometries.
+        new_coordinates = zip(new_xs, new_ys)
+        offsets = [0]
+        for sequence in sequences:
+            offsets.append(offsets[-1] + len(sequence))
+        new_sequences = (new_coordinates[start:end] for start, end in itertools.izip(offsets, offsets[1:]))
+        for record in batch:
+            geometry = record.get(self.geometry_field)
+            if geometry:
+                record[self.geometry_field] = {
+                    'type': geometry['type'],
+                    'coordinates': _replace_coordinate_sequences(geometry['coordinates'],
+                                                                 GEOMETRY_DEPTHS[geometry['type']], new_sequences)
+                }
+        return batch
+
+    def _process(self, records_iterable):
+        """Return an iterator of records, with geometries transformed in batches."""
+        records_iterator = iter(records_iterable)
+        batches = iter(lambda: list(itertools.islice(records_iterator, self.batch_size)), [])
+        return itertools.chain.from_iterable(itertools.imap(self._transform_batch, batches))
+
+
+class ProcessorSimplify(ProcessorBaseClass):
+    """
+    Simplify record geometries using the Douglas-Peucker algorithm.
+
+    Each coordinate sequence (a line, or polygon ring) is simplified separately, computing the
+    distance of all intermediate coordinates from a segment using vectorized NumPy operations.
+    Polygon rings that would be reduced below four coordinates, and lines below two, are left
+    unsimplified. Points are left unchanged.
+
+    Required Config Parameters:
+
+    :param float tolerance: Maximum distance, in the units of the geometry's coordinates,
+        between a removed coordinate and the simplified geometry.
+
+    Non-Required Config Parameters:
+
+    :param str geometry_field: Field name containing a geometry. Defaults to "geometry".
+
+    Example configuration file entry::
+
+        {"ProcessorSimplify": {"tolerance": 0.01}}
+    """
+    def __init__(self, processor, tolerance, geometry_field='geometry', **kwargs):
+        self.processor = processor
+        self.tolerance = float(tolerance)
+        self.geometry_field = geometry_field
+
+    def _douglas_peucker(self, coordinates):
+        """Return a boolean NumPy array, True for each coordinate kept."""
+        coordinate_count = len(coordinates)
+        keep = numpy.zeros(coordinate_count, dtype=bool)
+        keep[0] = keep[-1] = True
+        stack = [(0, coordinate_count - 1)]
+        while stack:
+            start, end = stack.pop()
+            if end <= start + 1:
+                continue
+            segment = coordinates[end] - coordinates[start]
+            offsets = coordinates[start + 1:end] - coordinates[start]
+            segment_length = numpy.hypot(segment[0], segment[1])
+            if segment_length == 0:
+                # Closed rings start and end at the same coordinate.
+                distances = numpy.hypot(offsets[:, 0], offsets[:, 1])
+            else:
+                distances = numpy.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / segment_length
+            farthest = numpy.argmax(distances)
+            if distances[farthest] > self.tolerance:
+                split = start + 1 + farthest
+                keep[split] = True
+                stack.append((start, split))
+                stack.append((split, end))
+        return keep
+
+    def _simplify_sequence(self, sequence, minimum_length):
+        """Return a simplified coordinate sequence, or the original if it would be too short."""
+        if len(sequence) <= minimum_length:
+            return sequence
+        coordinates = numpy.array([c[:2] for c in sequence], dtype=float)
+        keep = self._douglas_peucker(coordinates)
+        if keep.sum() < minimum_length:
+            return sequence
+        return map(tuple, coordinates[keep].tolist())
+
+    def _simplify(self, dict_record):
+        """Return a record with a simplified geometry."""
+        geometry = dict_record.get(self.geometry_field)
+        if not geometry or geometry['type'] in ('Point', 'MultiPoint'):
+            return dict_record
+        depth = GEOMETRY_DEPTHS[geometry['type']]
+        minimum_length = 4 if geometry['type'] in ('Polygon', 'MultiPolygon') else 2
+        sequences = _coordinate_sequences(geometry['coordinates'], depth)
+        simplified = iter([self._simplify_sequence(sequence, minimum_length) for sequence in sequences])
+        dict_record[self.geometry_field] = {
+            'type': geometry['type'],
+            'coordinates': _replace_coordinate_sequences(geometry['coordinates'], depth, simplified)
+        }
+        return dict_record
+
+    def _process(self, records_iterable):
+        """Return an iterator mapped to _simplify()."""
+        simplify_iterator = itertools.imap(self._simplify, records_iterable)
+        return simplify_iterator
+
+
 class ProcessorScreenWriter(ProcessorBaseClass):
     """
     A Processor class that simply prints a record's key, values.
@@ -622,6 +1874,292 @@ class ProcessorSortRecords(ProcessorBaseClass):
         return sorted_records_list
 
 
+class ProcessorSpatialJoin(ProcessorBaseClass):
+    """
+    Joins attributes of polygon features from a new Reader to each point record
+    of an existing Reader+Processors. Performs a LEFT JOIN, emitting one merged
+    record for each polygon containing the point, or the original record with
+    empty values for the joined fields if no polygon contains it.
+
+    Polygons are indexed using a uniform grid of their bounding boxes. For each point,
+    polygons sharing its grid cell are tested against their bounding box, then by an
+    exact point-in-polygon test. Points on a polygon's boundary may or may not match.
+
+    Points are read from the ``x_field`` and ``y_field`` values of a record, or if not
+    given, from a record's Point ``geometry``, as emitted by ReaderSHP. Both readers are
+    expected to share a coordinate reference system. Records with blank coordinates or no
+    geometry are emitted unmatched, and polygon records without a geometry are ignored.
+
+    Required Config Parameters:
+
+    :param str reader: name of a given reader, emitting Polygon or MultiPolygon geometries.
+
+    Non-Required Config Parameters:
+
+    :param list fields: field names of the new reader to join. Defaults to all fields,
+        except geometry, fiona_id and fiona_type.
+    :param str x_field: field name containing a point's x coordinate, e.g. longitude.
+    :param str y_field: field name containing a point's y coordinate, e.g. latitude.
+    :param float cell_size: width and height of a grid cell. Defaults to a size
+        giving roughly one polygon per cell.
+
+    Example configuration file entry::
+
+        {"ProcessorSpatialJoin": {
+            "reader": "Counties",
+            "fields": ["COUNTYFP", "NAME"],
+            "x_field": "LONGITUDE83",
+            "y_field": "LATITUDE83"
+        }}
+    """
+    def __init__(self, processor, reader, readers, fields=None, x_field=None, y_field=None, cell_size=None,
+                 **kwargs):
+        self.processor = processor
+        self.fields = fields
+        self.x_field = x_field
+        self.y_field = y_field
+        self.cell_size = cell_size
+        self.polygons = None
+        self.new_reader_iterable = ProcessorGetData(None, reader, readers, kwargs.get('layer')).process(reader)
+
+    def _polygon_rings(self, geometry):
+        """Return a list of polygons, each a list of rings, for a Polygon or MultiPolygon."""
+        if geometry['type'] == 'Polygon':
+            return [geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            return geometry['coordinates']
+        raise ValueError("Geometry type %s is not supported for spatial joins." % geometry['type'])
+
+    def _point_in_ring(self, x, y, ring):
+        """Return True if a point is inside a ring, using a ray casting test."""
+        inside = False
+        x1, y1 = ring[-1][:2]
+        for vertex in ring:
+            x2, y2 = vertex[:2]
+            if (y2 > y) != (y1 > y) and x < (x1 - x2) * (y - y2) / (y1 - y2) + x2:
+                inside = not inside
+            x1, y1 = x2, y2
+        return inside
+
+    def _point_in_polygons(self, x, y, polygons):
+        """Return True if a point is inside the exterior ring, and outside any holes, of a polygon."""
+        for rings in polygons:
+            if self._point_in_ring(x, y, rings[0]) and \
+                    not any(self._point_in_ring(x, y, hole) for hole in rings[1:]):
+                return True
+        return False
+
+    def _grid_cell(self, x, y):
+        """Return the (column, row) grid cell containing a coordinate."""
+        return (int(math.floor((x - self.grid_origin[0]) / self.cell_size)),
+                int(math.floor((y - self.grid_origin[1]) / self.cell_size)))
+
+    def _build_index(self):
+        """
+        Populate self.polygons with (bbox, polygons, join values) tuples, and
+        self.grid with grid cells mapped to lists of indexes into self.polygons.
+        """
+        self.polygons = []
+        for record in self.new_reader_iterable:
+            if self.fields is None:
+                self.fields = [k for k in record.keys() if k not in ('geometry', 'fiona_id', 'fiona_type')]
+            if record.get('geometry') is None:
+                continue
+            polygons = self._polygon_rings(record['geometry'])
+            xs = [vertex[0] for rings in polygons for vertex in rings[0]]
+            ys = [vertex[1] for rings in polygons for vertex in rings[0]]
+            join_values = {k: record[k] for k in self.fields}
+            self.polygons.append(((min(xs), min(ys), max(xs), max(ys)), polygons, join_values))
+
+        self.grid = {}
+        if not self.polygons:
+            return
+        min_x = min(p[0][0] for p in self.polygons)
+        min_y = min(p[0][1] for p in self.polygons)
+        max_x = max(p[0][2] for p in self.polygons)
+        max_y = max(p[0][3] for p in self.polygons)
+        self.grid_origin = (min_x, min_y)
+        if not self.cell_size:
+            # Aim for roughly one polygon per cell.
+            self.cell_size = max(max_x - min_x, max_y - min_y) / math.sqrt(len(self.polygons)) or 1.0
+        self.cell_size = float(self.cell_size)
+        for index, (bbox, polygons, join_values) in enumerate(self.polygons):
+            min_cell = self._grid_cell(bbox[0], bbox[1])
+            max_cell = self._grid_cell(bbox[2], bbox[3])
+            for column in xrange(min_cell[0], max_cell[0] + 1):
+                for row in xrange(min_cell[1], max_cell[1] + 1):
+                    self.grid.setdefault((column, row), []).append(index)
+
+    def _get_point(self, in_record):
+        """Return the x, y coordinates of a record, or None if its coordinates are blank or missing."""
+        if self.x_field and self.y_field:
+            x, y = in_record.get(self.x_field), in_record.get(self.y_field)
+            if x is None or y is None or (isinstance(x, basestring) and not x.strip()) or \
+                    (isinstance(y, basestring) and not y.strip()):
+                return None
+            return float(x), float(y)
+        geometry = in_record.get('geometry')
+        if geometry is None:
+            return None
+        if geometry['type'] != 'Point':
+            raise ValueError("Geometry type %s is not supported for spatial joins." % geometry['type'])
+        return geometry['coordinates'][0], geometry['coordinates'][1]
+
+    def _join_record(self, in_record):
+        """Return a list of records merged with the values of each polygon containing it."""
+        merged_records = []
+        point = self._get_point(in_record)
+        if point and self.polygons:
+            x, y = point
+            for index in self.grid.get(self._grid_cell(x, y), []):
+                bbox, polygons, join_values = self.polygons[index]
+                if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3] and self._point_in_polygons(x, y, polygons):
+                    merged_record = dict(in_record)
+                    merged_record.update(join_values)
+                    merged_records.append(merged_record)
+        if not merged_records:
+            # match not found, add empty values for joined fields.
+            merged_record = dict(in_record)
+            merged_record.update((k, '') for k in self.fields or [])
+            merged_records.append(merged_record)
+        return merged_records
+
+    def _process(self, records_iterable):
+        """Return an iterator that yields point records joined to polygon attributes."""
+        print "in ProcessorSpatialJoin._process()"
+        # The new reader can only be iterated once.
+        if self.polygons is None:
+            self._build_index()
+        join_iterator = itertools.imap(self._join_record, records_iterable)
+        flatten_iterator = itertools.chain.from_iterable(join_iterator)
+        return flatten_iterator
+
+
+class ProcessorSQLiteWriter(ProcessorBaseClass):
+    """
+    Load records into a SQLite table, inserting batches using executemany()
+    within a single transaction, committed once all records have been written.
+
+    For load speed, the database's journal mode and synchronous setting are set using pragmas,
+    defaulting to write-ahead logging with synchronous writes off. A crash mid-load may then
+    lose the load, but will not corrupt the database. Indexes are created once loading completes.
+
+    Required Config Parameters:
+
+    :param str path: Absolute path for the SQLite database file, created if it does not exist.
+    :param str table: Name of the table to load.
+    :param list fields: A list of field names to load, used as column names.
+
+    Non-Required Config Parameters:
+
+    :param str mode: Either "write" or "append". When writing, any existing table is replaced.
+        When appending, the table is created only if it does not exist. DEFAULTS to "write".
+    :param dict field_types: a mapping of field names to column types, one of 'int', 'float'
+        or 'string'. Columns without a type store values as given.
+    :param list indexes: A list of indexes to create after loading, each a list of field names.
+    :param int batch_size: Number of records passed to each executemany() call. DEFAULTS to 10000.
+    :param str journal_mode: SQLite journal_mode pragma. DEFAULTS to "WAL".
+    :param str synchronous: SQLite synchronous pragma. DEFAULTS to "OFF".
+
+    Example configuration file entry::
+
+        {"ProcessorSQLiteWriter": {
+            "path": "/path/to/staging.sqlite",
+            "table": "facilities",
+            "fields": ["registry_id", "primary_name", "state_code"],
+            "field_types": {"registry_id": "int"},
+            "indexes": [["registry_id"], ["state_code"]]
+        }}
+    """
+    column_types = {
+        'int': 'INTEGER',
+        'integer': 'INTEGER',
+        'float': 'REAL',
+        'str': 'TEXT',
+        'string': 'TEXT',
+        'unicode': 'TEXT',
+        'text': 'TEXT'
+    }
+
+    def __init__(self, processor, path, table, fields, mode='write', field_types=None, indexes=None,
+                 batch_size=10000, journal_mode='WAL', synchronous='OFF', **kwargs):
+        self.processor = processor
+        self.path = path
+        self.table = table
+        self.fields = fields
+        self.mode = mode.lower()
+        if self.mode not in ('write', 'append'):
+            raise ValueError("Mode Not Supported")
+        self.field_types = field_types or {}
+        self.indexes = indexes or []
+        self.batch_size = int(batch_size)
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+
+    def _quote_identifier(self, identifier):
+        """Return a double-quoted SQL identifier."""
+        return '"%s"' % identifier.replace('"', '""')
+
+    def _output_row(self, row):
+        """
+        Return a tuple of the values of a record to be inserted, ordered by self.fields.
+        Byte strings are decoded as UTF8, as sqlite3 binds them as text.
+        """
+        return tuple(v.decode('utf8') if isinstance(v, str) else v for v in itertools.imap(row.get, self.fields))
+
+    def _create_table(self, conn):
+        """Create the output table, replacing any existing table if writing."""
+        table = self._quote_identifier(self.table)
+        if self.mode == 'write':
+            conn.execute('DROP TABLE IF EXISTS %s' % table)
+        columns = ', '.join(
+            ' '.join([self._quote_identifier(f)] + ([self.column_types[self.field_types[f]]]
+                                                    if f in self.field_types else []))
+            for f in self.fields)
+        conn.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (table, columns))
+
+    def _create_indexes(self, conn):
+        """Create indexes on the loaded table."""
+        for index_fields in self.indexes:
+            index_name = '_'.join(['idx', self.table] + list(index_fields))
+            conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                self._quote_identifier(index_name), self._quote_identifier(self.table),
+                ', '.join(self._quote_identifier(f) for f in index_fields)))
+
+    def _write_rows(self, records_iterable):
+        """
+        Generator returning each record, inserting output rows in batches.
+        The transaction is committed, and indexes created, once all records have been read.
+        """
+        # Transactions are managed explicitly, rather than by the sqlite3 module.
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode = %s' % self.journal_mode)
+            conn.execute('PRAGMA synchronous = %s' % self.synchronous)
+            conn.execute('BEGIN')
+            self._create_table(conn)
+            insert_statement = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                self._quote_identifier(self.table), ', '.join(self._quote_identifier(f) for f in self.fields),
+                ', '.join('?' * len(self.fields)))
+            batch = []
+            for record in records_iterable:
+                batch.append(self._output_row(record))
+                if len(batch) >= self.batch_size:
+                    conn.executemany(insert_statement, batch)
+                    batch = []
+                yield record
+            conn.executemany(insert_statement, batch)
+            self._create_indexes(conn)
+            conn.execute('COMMIT')
+        finally:
+            # Closing the connection rolls back an uncommitted load.
+            conn.close()
+
+    def _process(self, records_iterable):
+        """Load records into a SQLite table."""
+        return self._write_rows(records_iterable)
+
+
 class ProcessorTruncateFields(ProcessorBaseClass):
     """
     A decorator class which implements a Processor class' public
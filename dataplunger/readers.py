@@ -24,10 +24,34 @@ Geometries are represented as lists of two-element tuples, representing a single
 """
 __author__ = 'mkenny'
 import abc
+import bz2
 import csv
+import errno
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import operator
 import os
+import Queue
+import sqlite3
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+import zipfile
+from datetime import datetime
 import fiona
+import recordfile
 import psycopg2
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 
 
@@ -61,6 +85,349 @@ class ReaderBaseClass(object):
         pass
 
 
+class Watermark(object):
+    """
+    Tracks the high-water mark of a column for incremental extraction, persisted between runs
+    within a JSON-formatted state file. A single state file can hold the marks of many readers,
+    each stored under its own key, e.g. "LayerName/ReaderName".
+
+    A new mark is held as pending once all records have been read, and only saved by
+    ``commit_watermarks()``, called by the ``LayerConstructor`` once every processor of the
+    layer has finished. A failed write therefore leaves the previous mark in place, and the
+    same records are read again by the next run.
+
+    :param state_path: pathway to the JSON state file. Created if it does not exist.
+    :param key: name the mark is stored under within the state file.
+    :param column: name of the watermark column.
+    :param sort_key: function used to compare watermark values. Defaults to comparing values directly.
+    """
+
+    def __init__(self, state_path, key, column, sort_key=None):
+        self.state_path = state_path
+        self.key = key
+        self.column = column
+        self.sort_key = sort_key or (lambda v: v)
+        self.value = self._load_state().get(self.key)
+        self.pending = None
+
+    def _load_state(self):
+        """Return the contents of the state file, or an empty dict if it doesn't exist."""
+        if not os.path.isfile(self.state_path):
+            return {}
+        with open(self.state_path, 'r') as state_file_handle:
+            return json.load(state_file_handle)
+
+    def save(self, value):
+        """
+        Persist a new mark for self.key, leaving the marks of other keys intact.
+        Dates and times are stored in ISO 8601 format.
+        """
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        state = self._load_state()
+        state[self.key] = value
+        state_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.state_path)))
+        with os.fdopen(state_fd, 'w') as state_file_handle:
+            json.dump(state, state_file_handle, indent=4, sort_keys=True)
+        os.rename(temp_path, self.state_path)
+        self.value = value
+
+    def is_newer(self, record):
+        """Return True if a record's watermark value is greater than the stored mark."""
+        if self.value is None:
+            return True
+        record_value = record[self.column]
+        if record_value is None or record_value == '':
+            return False
+        return self.sort_key(record_value) > self.sort_key(self.value)
+
+    def commit(self):
+        """Save the pending mark, if any."""
+        if self.pending is not None:
+            self.save(self.pending)
+            self.pending = None
+
+    def track(self, records_iterable):
+        """
+        Generator yielding each record. Once all records have been read, the greatest
+        watermark value seen is held as pending, to be saved by ``commit_watermarks()``.
+        """
+        high_value = None
+        high_key = None
+        for record in records_iterable:
+            record_value = record[self.column]
+            if record_value is not None and record_value != '':
+                record_key = self.sort_key(record_value)
+                if high_key is None or record_key > high_key:
+                    high_value, high_key = record_value, record_key
+            yield record
+        if high_value is not None:
+            self.pending = high_value
+            with _pending_watermarks_lock:
+                _pending_watermarks.append(self)
+
+
+# Watermarks of readers that have been read to exhaustion, awaiting commit_watermarks().
+_pending_watermarks = []
+_pending_watermarks_lock = threading.Lock()
+
+
+def commit_watermarks():
+    """Save the pending marks of all watermarks. Called once a layer has been processed successfully."""
+    with _pending_watermarks_lock:
+        for watermark in _pending_watermarks:
+            watermark.commit()
+        del _pending_watermarks[:]
+
+
+def discard_watermarks():
+    """Discard all pending marks, leaving the saved marks unchanged. Called when a layer fails."""
+    with _pending_watermarks_lock:
+        for watermark in _pending_watermarks:
+            watermark.pending = None
+        del _pending_watermarks[:]
+
+
+# Shell commands decompressing a file to stdout, used by open_input() when decompress is 'process'.
+DECOMPRESSION_COMMANDS = {
+    '.gz': ['gzip', '-dc'],
+    '.bz2': ['bzip2', '-dc'],
+    '.xz': ['xz', '-dc'],
+    '.zip': ['unzip', '-p']
+}
+
+
+def compression_suffix(path):
+    """Return the compression suffix of a path, e.g. '.gz', or an empty string if uncompressed."""
+    suffix = os.path.splitext(path)[1].lower()
+    return suffix if suffix in DECOMPRESSION_COMMANDS else ''
+
+
+def strip_compression_suffix(path):
+    """Return a path without its compression suffix, e.g. 'g20125wa.csv.gz' becomes 'g20125wa.csv'."""
+    suffix = compression_suffix(path)
+    return path[:-len(suffix)] if suffix else path
+
+
+class _MultiStreamBZ2Reader(io.RawIOBase):
+    """
+    A raw, read only file object decompressing every stream of a bz2 file.
+    Python 2's bz2.BZ2File stops silently after the first stream, losing the remainder of
+    files written as concatenated streams, e.g. by ``CompressedOutputFile`` or ``bzip2`` in append mode.
+    """
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._decompressor = bz2.BZ2Decompressor()
+        self._pending = ''
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def _decompress(self, compressed):
+        """Return decompressed data, starting a new decompressor at the end of each stream."""
+        output = []
+        while compressed:
+            try:
+                output.append(self._decompressor.decompress(compressed))
+            except EOFError:
+                # The previous stream ended exactly at the end of the last block read.
+                self._decompressor = bz2.BZ2Decompressor()
+                continue
+            compressed = self._decompressor.unused_data
+            if compressed:
+                self._decompressor = bz2.BZ2Decompressor()
+        return ''.join(output)
+
+    def readinto(self, buffer):
+        while self._position >= len(self._pending):
+            compressed = self._file.read(1 << 16)
+            if not compressed:
+                return 0
+            self._pending = self._decompress(compressed)
+            self._position = 0
+        size = min(len(buffer), len(self._pending) - self._position)
+        buffer[:size] = self._pending[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super(_MultiStreamBZ2Reader, self).close()
+
+
+class DecompressedFile(object):
+    """
+    A read only, line iterable file object streaming the decompressed contents of a
+    gzip, bz2, xz or zip file, without writing the decompressed data to disk.
+
+    Decompression is performed in one of three ways, set by ``decompress``:
+
+    * 'inline' - decompress within the reading thread using the gzip, bz2, lzma or zipfile modules.
+    * 'thread' - decompress within a background thread, writing to a pipe read by the caller.
+    * 'process' - decompress within a child process, e.g. ``gzip -dc``, reading its stdout.
+
+    The 'thread' and 'process' modes overlap decompression with parsing, and emit lines
+    from an OS level pipe. Python 2 lacks the lzma module, so xz files require the
+    'process' mode unless the backports.lzma package is installed.
+
+    :param path: path to a compressed file.
+    :param member: name of the zip archive member to read. Defaults to the only member of the archive.
+    :param decompress: one of 'inline', 'thread' or 'process'. Defaults to 'inline'.
+    """
+    def __init__(self, path, member=None, decompress='inline'):
+        if decompress not in ('inline', 'thread', 'process'):
+            raise ValueError("Decompress mode must be one of 'inline', 'thread' or 'process'.")
+        self.path = path
+        self.suffix = compression_suffix(path)
+        self.member = member
+        self.decompress = decompress
+        self._archive = None
+        self._process = None
+        self._thread = None
+        self._thread_error = None
+        if self.suffix == '.zip':
+            self._archive = zipfile.ZipFile(path, 'r')
+            if self.member is None:
+                members = self._archive.namelist()
+                if len(members) != 1:
+                    raise ValueError("Zip archive %s contains %s members, a member must be given." %
+                                     (path, len(members)))
+                self.member = members[0]
+        if decompress == 'process':
+            command = DECOMPRESSION_COMMANDS[self.suffix] + [path] + ([self.member] if self._archive else [])
+            self._process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=1 << 16)
+            self._handle = self._process.stdout
+        elif decompress == 'thread':
+            read_fd, write_fd = os.pipe()
+            self._handle = os.fdopen(read_fd, 'rb', 1 << 16)
+            self._thread = threading.Thread(target=self._decompress_to_handle,
+                                            args=(self._open_inline(), os.fdopen(write_fd, 'wb', 1 << 16)))
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self._handle = self._open_inline()
+
+    def _open_inline(self):
+        """Return a file object decompressing within the calling thread."""
+        if self._archive:
+            return self._archive.open(self.member, 'r')
+        if self.suffix == '.gz':
+            return gzip.open(self.path, 'rb')
+        if self.suffix == '.bz2':
+            return io.BufferedReader(_MultiStreamBZ2Reader(self.path), 1 << 16)
+        try:
+            from backports import lzma
+        except ImportError:
+            raise IOError("Reading %s requires the backports.lzma package, or a decompress mode of 'process'."
+                          % self.path)
+        return lzma.open(self.path, 'rb')
+
+    def _decompress_to_handle(self, source_handle, write_handle):
+        """
+        Copy decompressed blocks from source_handle to write_handle, run within a thread.
+        Errors are stored and raised by the reading thread once the pipe is exhausted.
+        A closed pipe indicates the reader has stopped early, and is not an error.
+        """
+        try:
+            for block in iter(lambda: source_handle.read(1 << 20), ''):
+                write_handle.write(block)
+        except IOError as e:
+            if e.errno != errno.EPIPE:
+                self._thread_error = e
+        except Exception as e:
+            self._thread_error = e
+        finally:
+            source_handle.close()
+            try:
+                write_handle.close()
+            except IOError:
+                pass
+
+    def _check_complete(self):
+        """Raise any error encountered by a decompressing thread or process."""
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+            if self._thread_error:
+                raise self._thread_error
+        if self._process:
+            return_code = self._process.wait()
+            self._process = None
+            if return_code != 0:
+                raise IOError("Decompressing %s failed with exit status %s." % (self.path, return_code))
+
+    def __iter__(self):
+        for line in self._handle:
+            yield line
+        self._check_complete()
+
+    def read(self, size=-1):
+        data = self._handle.read(size)
+        if not data:
+            self._check_complete()
+        return data
+
+    def readline(self):
+        line = self._handle.readline()
+        if not line:
+            self._check_complete()
+        return line
+
+    def close(self):
+        """
+        Close the file, stopping any decompressing thread or process.
+        Closing the read end of the pipe causes the writer to stop with a broken pipe.
+        """
+        self._handle.close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._process:
+            if self._process.poll() is None:
+                self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._archive:
+            self._archive.close()
+            self._archive = None
+
+
+def open_input(path, member=None, decompress='inline'):
+    """
+    Return a read only file object for path. Files with a '.gz', '.bz2', '.xz' or '.zip'
+    suffix are returned as a ``DecompressedFile``, otherwise a plain file object is returned.
+    """
+    if compression_suffix(path):
+        return DecompressedFile(path, member, decompress)
+    return open(path, 'rt')
+
+
+def _flatten_feature(row, geometry=True):
+    """
+    Return a flattened Fiona record. Properties are combined with
+    the feature's geometry (if decoded), id and type.
+    """
+    flat_dict = row['properties']
+    if geometry:
+        flat_dict['geometry'] = row['geometry']
+    flat_dict['fiona_id'] = row['id']
+    flat_dict['fiona_type'] = row['type']
+    return flat_dict
+
+
+def _read_shp_features(chunk_args):
+    """
+    Return a list of flattened records for a slice of a layer's features, given a tuple of
+    (path, fiona.open kwargs, bbox, geometry, start, stop). Defined at the module level so
+    that it can be pickled and run within a worker process.
+    """
+    path, open_kwargs, bbox, geometry, start, stop = chunk_args
+    with fiona.open(path, 'r', **open_kwargs) as shp_reader:
+        return [_flatten_feature(row, geometry) for row in shp_reader.filter(start, stop, bbox=bbox)]
+
+
 class ReaderSHP(ReaderBaseClass):
     """
     Reader class implementation for SHP files using Fiona.
@@ -72,36 +439,128 @@ class ReaderSHP(ReaderBaseClass):
 
     :param path: Attribute containing the actual file path.
 
+    Non-Required Config Parameters:
+
+    :param bbox: Array of [minx, miny, maxx, maxy]. Only features intersecting the bounding box
+        are read, using Fiona's spatial filter. A .qix spatial index is used if present.
+    :param geometry: if false, geometries are not decoded, and records contain
+        properties only. Defaults to true.
+    :param properties: Array of property names to read. Other properties are not decoded.
+        Defaults to all properties.
+    :param processes: if given, split features into chunks decoded by a pool of worker processes,
+        each opening its own Fiona collection.
+    :param ordered: used with ``processes``. If true, emit records in feature order. Otherwise
+        emit each chunk as soon as it is decoded. Defaults to true.
+    :param chunk_size: used with ``processes``. Number of features per chunk. Defaults to 1000.
+
     Example configuration file entry::
 
             "NaturalEarthLakes": {
                 "type": "ReaderSHP",
                 "path": "/Users/matt/Projects/dataplunger/tests/test_data/50m_lakes_utf8.shp"
             }
+
+    Example configuration file entry reading properties of features within a region::
+
+            "ScandinavianLakeNames": {
+                "type": "ReaderSHP",
+                "path": "/Users/matt/Projects/dataplunger/tests/test_data/50m_lakes_utf8.shp",
+                "bbox": [4.5, 54.5, 31.5, 71.5],
+                "geometry": false,
+                "properties": ["name", "scalerank"]
+            }
     """
 
-    def __init__(self, path, **kwargs):
+    def __init__(self, path, bbox=None, geometry=True, properties=None, processes=None, ordered=True,
+                 chunk_size=1000, **kwargs):
         """
         :param path: Attribute containing the actual file path.
+        :param bbox: bounding box used to filter features.
+        :param geometry: decode geometries.
+        :param properties: list of property names to decode.
+        :param processes: number of worker processes.
+        :param ordered: emit records in feature order when using worker processes.
+        :param chunk_size: number of features decoded per worker task.
+        :param _pool: multiprocessing.Pool instance, created during iteration.
         """
         self.path = path
-        self._shp_reader = fiona.open(path, 'r')
+        self.bbox = tuple(bbox) if bbox else None
+        self.geometry = geometry
+        self.properties = properties
+        self.processes = processes
+        self.ordered = ordered
+        self.chunk_size = int(chunk_size)
+        self._pool = None
+        self._shp_reader = None
+        self._shp_reader = fiona.open(path, 'r', **self._open_kwargs())
+
+    def _open_kwargs(self):
+        """
+        Return kwargs for fiona.open(), skipping decoding of
+        geometries and properties that aren't required.
+        """
+        open_kwargs = {}
+        if not self.geometry:
+            open_kwargs['ignore_geometry'] = True
+        if self.properties is not None:
+            with fiona.open(self.path, 'r') as schema_reader:
+                schema_properties = schema_reader.schema['properties'].keys()
+            open_kwargs['ignore_fields'] = [p for p in schema_properties if p not in self.properties]
+        return open_kwargs
+
+    def _feature_count(self):
+        """
+        Return the number of features to be read. Features within a bbox are
+        counted without decoding their properties or geometries.
+        """
+        if not self.bbox:
+            return len(self._shp_reader)
+        with fiona.open(self.path, 'r', ignore_geometry=True,
+                        ignore_fields=self._shp_reader.schema['properties'].keys()) as count_reader:
+            return sum(1 for _ in count_reader.filter(bbox=self.bbox))
+
+    def _iter_parallel(self):
+        """
+        Generator returning flattened records decoded by a pool of worker processes.
+        Fiona slices a bbox filtered collection by position within the filtered features.
+        """
+        open_kwargs = self._open_kwargs()
+        chunks = [(self.path, open_kwargs, self.bbox, self.geometry, start, start + self.chunk_size)
+                  for start in xrange(0, self._feature_count(), self.chunk_size)]
+        self._pool = multiprocessing.Pool(self.processes)
+        if self.ordered:
+            chunk_records = self._pool.imap(_read_shp_features, chunks)
+        else:
+            chunk_records = self._pool.imap_unordered(_read_shp_features, chunks)
+        for records in chunk_records:
+            for record in records:
+                yield record
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
 
     def __iter__(self):
         """
         Generator returning a dict of field name: field value pairs for each record.
         """
-        for row in self._shp_reader:
+        if self.processes and self.processes > 1:
+            for record in self._iter_parallel():
+                yield record
+            return
+        if self.bbox:
+            features = self._shp_reader.filter(bbox=self.bbox)
+        else:
+            features = self._shp_reader
+        for row in features:
             # Flatten the Fiona returned record.
-            # Convert from unicode to utf8 encoded str.
-            flat_dict = row['properties']
-            flat_dict['geometry'] = row['geometry']
-            flat_dict['fiona_id'] = row['id']
-            flat_dict['fiona_type'] = row['type']
-            yield flat_dict
+            yield _flatten_feature(row, self.geometry)
 
     def __del__(self, exc_type=None, exc_val=None, exc_tb=None):
-        """Close the file handler. Note: Will be Called Twice if a Context Manager is used."""
+        """Close the file handler and terminate any worker pool.
+        Note: Will be Called Twice if a Context Manager is used."""
+        if self._pool:
+            self._pool.terminate()
+            self._pool = None
         if self._shp_reader:
             self._shp_reader.close()
         if exc_type is not None:
@@ -123,6 +582,17 @@ class ReaderCSV(ReaderBaseClass):
 
     :param field_types: a mapping of field names to output python data type.
         if not provided, defaults all output to strings.
+    :param watermark_column: if given, read incrementally, emitting only records whose value for
+        this column is greater than the high-water mark saved by the previous run.
+    :param watermark_state: used with ``watermark_column``. Pathway to a JSON state file holding
+        high-water marks, keyed by layer and reader name.
+    :param watermark_type: used with ``watermark_column``. One of 'int', 'float', 'string' or 'date'.
+        Defaults to 'string'.
+    :param watermark_format: used with a ``watermark_type`` of 'date'. A strptime format string.
+    :param member: for a zip archive path, the name of the member to read.
+        Defaults to the only member of the archive.
+    :param decompress: for a '.gz', '.bz2', '.xz' or '.zip' path, one of 'inline', 'thread' or 'process'.
+        See ``DecompressedFile``. Defaults to 'inline'.
 
     Example configuration file entry::
 
@@ -132,20 +602,61 @@ class ReaderCSV(ReaderBaseClass):
                 "delimiter": ",",
                 "field_types": {'name':'string', 'age':'int', 'gender':'string'}
             },
+
+    Example configuration file entry for incremental reads::
+
+            "NationalSingleFile": {
+                "type": "ReaderCSV",
+                "path": "/Users/matt/Projects/dataplunger/sample_data/NATIONAL_SINGLE.csv",
+                "watermark_column": "UPDATE_DATE",
+                "watermark_state": "/Users/matt/Projects/dataplunger/sample_output/watermarks.json",
+                "watermark_type": "date",
+                "watermark_format": "%d-%b-%y"
+            },
+
+    Example configuration file entry for a zip archive member::
+
+            "Election": {
+                "type": "ReaderCSV",
+                "path": "/Users/matt/Projects/dataplunger/sample_data/election_2010_kc.csv.zip",
+                "member": "election_2010_kc.csv",
+                "decompress": "process"
+            },
     """
-    def __init__(self, path, delimiter=',', field_types=None, **kwargs):
+    def __init__(self, path, delimiter=',', field_types=None, watermark_column=None, watermark_state=None,
+                 watermark_type='string', watermark_format=None, watermark_key=None, member=None,
+                 decompress='inline', **kwargs):
         """
         :param path: the pathway for a given file.
         :param delimiter:  defaults to ','
         :param field_types: a dict of field name, field type pairs.
+        :param watermark_column: column used for incremental reads.
+        :param watermark_state: pathway to a JSON state file.
+        :param watermark_type: type used to compare watermark values.
+        :param watermark_format: strptime format for date watermarks.
+        :param watermark_key: name of the mark within the state file, set by ProcessorGetData.
+        :param member: zip archive member to read.
+        :param decompress: decompression mode for compressed paths.
         :param _file_handler:  set in __enter__(), a read only pointer to the CSV.
         :param _dict_reader:  an instance of csv.dict_reader()
+        :param _watermark:  a Watermark instance, if reading incrementally.
         """
         # If no delimiter given in config, default to ','
         self.delimiter = delimiter
         self.path = path
         self.field_types = field_types
-        self._file_handler = open(self.path, 'rt')
+        self._watermark = None
+        if watermark_column:
+            watermark_casts = {
+                'int': int,
+                'float': float,
+                'string': None,
+                'date': lambda v: datetime.strptime(v, watermark_format)
+            }
+            self._watermark = Watermark(watermark_state, watermark_key or watermark_column, watermark_column,
+                                        watermark_casts[watermark_type])
+        self._file_handler = None
+        self._file_handler = open_input(self.path, member, decompress)
         self._dict_reader = csv.DictReader(self._file_handler, delimiter=self.delimiter)
 
     def _map_field_types(self, row):
@@ -169,7 +680,11 @@ class ReaderCSV(ReaderBaseClass):
         """
         Generator returning a dict of field name: field value pairs for each record.
         """
-        for row in self._dict_reader:
+        records = self._dict_reader
+        if self._watermark:
+            # Filter and track using raw string values, prior to casting.
+            records = self._watermark.track(itertools.ifilter(self._watermark.is_newer, records))
+        for row in records:
             # Cast fields to proper type, if given.
             if self.field_types:
                 row = self._map_field_types(row)
@@ -193,10 +708,249 @@ class ReaderCSV(ReaderBaseClass):
         return self.__del__(exc_type, exc_val, exc_tb)
 
 
+class GeographyIndexError(EnvironmentError):
+    """Raised when a ``CensusGeographyIndex`` can't be created or written."""
+
+
+class CensusGeographyIndex(object):
+    """
+    A memory-mapped, binary index of the LOGRECNO keyed fields of a census geography file.
+    Behaves like the dictionary built by ``ReaderCensus._build_logrecno_dict()``, supporting
+    ``in`` tests and item lookup using a LOGRECNO string.
+
+    The index is written alongside the geography file, with an '.idx' extension, the first time
+    it is needed, or within ``index_dir`` if given. It is rebuilt when the size or modification
+    time of the geography file no longer match those recorded in the index header.
+
+    Index records are fixed-width and sorted by LOGRECNO. As LOGRECNO values are typically dense,
+    records are directly addressed by their offset from the first LOGRECNO, falling back to a
+    binary search when gaps are found.
+
+    :param geography_path: path to a census geography file.
+    :param delimiter: delimiter for the geography file, defaults to comma.
+    :param index_dir: directory to write the index to, e.g. when census directories are read only.
+        Index file names include a hash of the geography file's path, so one directory can hold
+        the indexes of many census directories. Created if it does not exist.
+
+    Raises a ``GeographyIndexError`` if the index directory can't be created or the index can't be
+    written. Errors reading the geography file are raised unchanged.
+    """
+    # magic, version, source size, source mtime, record count, first LOGRECNO, dense flag.
+    header_struct = struct.Struct('<4sHqdqq?')
+    # LOGRECNO, FILEID, STUSAB, SUMLEVEL, COMPONENT.
+    record_struct = struct.Struct('<q7s6s2s3s2s')
+    magic = 'DPGI'
+    version = 1
+
+    def __init__(self, geography_path, delimiter=',', index_dir=None):
+        self.geography_path = geography_path
+        self.delimiter = delimiter
+        if index_dir:
+            if not os.path.isdir(index_dir):
+                try:
+                    os.makedirs(index_dir)
+                except EnvironmentError as e:
+                    raise GeographyIndexError(e.errno, "Can't create geography index directory: %s" % e,
+                                              index_dir)
+            path_hash = hashlib.md5(os.path.abspath(geography_path)).hexdigest()[:12]
+            self.index_path = os.path.join(index_dir, '%s.%s.idx' % (os.path.basename(geography_path), path_hash))
+        else:
+            self.index_path = geography_path + '.idx'
+        self._index_handler = None
+        self._index_map = None
+        if not self._is_current():
+            self._build_index()
+        self._open_index()
+
+    def _source_stat(self):
+        """Return the size and modification time of the geography file."""
+        source_stat = os.stat(self.geography_path)
+        return source_stat.st_size, source_stat.st_mtime
+
+    def _is_current(self):
+        """Return True if an index exists and was built from the current geography file."""
+        if not os.path.isfile(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as index_file_handle:
+            header_bytes = index_file_handle.read(self.header_struct.size)
+        if len(header_bytes) != self.header_struct.size:
+            return False
+        magic, version, source_size, source_mtime = self.header_struct.unpack(header_bytes)[:4]
+        return (magic, version, source_size, source_mtime) == \
+            (self.magic, self.version) + self._source_stat()
+
+    def _build_index(self):
+        """
+        Parse the geography file, writing sorted fixed-width records to a temporary file
+        which then replaces any existing index.
+        """
+        source_size, source_mtime = self._source_stat()
+        geography_file_handle = open_input(self.geography_path)
+        try:
+            geography_reader = csv.reader(geography_file_handle, delimiter=self.delimiter)
+            # FILEID, STUSAB, SUMLEVEL, COMPONENT, LOGRECNO are the first five fields.
+            records = sorted((int(row[4]), row[4], row[0], row[1], row[2], row[3]) for row in geography_reader)
+        finally:
+            geography_file_handle.close()
+
+        first_logrecno = records[0][0] if records else 0
+        dense = all(record[0] == first_logrecno + i for i, record in enumerate(records))
+        try:
+            index_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_path), suffix='.tmp')
+        except EnvironmentError as e:
+            raise GeographyIndexError(e.errno, "Can't write geography index: %s" % e, self.index_path)
+        try:
+            with os.fdopen(index_fd, 'wb') as index_file_handle:
+                index_file_handle.write(self.header_struct.pack(
+                    self.magic, self.version, source_size, source_mtime, len(records), first_logrecno, dense))
+                for record in records:
+                    index_file_handle.write(self.record_struct.pack(*record))
+            os.rename(temp_path, self.index_path)
+        except Exception as e:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            if isinstance(e, EnvironmentError):
+                raise GeographyIndexError(e.errno, "Can't write geography index: %s" % e, self.index_path)
+            raise
+
+    def _open_index(self):
+        """Memory-map the index file and read its header."""
+        self._index_handler = open(self.index_path, 'rb')
+        self._index_map = mmap.mmap(self._index_handler.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.header_struct.unpack_from(self._index_map, 0)
+        self._record_count, self._first_logrecno, self._dense = header[4:]
+
+    def _record_at(self, position):
+        """Return the unpacked index record at a given position."""
+        offset = self.header_struct.size + position * self.record_struct.size
+        return self.record_struct.unpack_from(self._index_map, offset)
+
+    def _find(self, logrecno):
+        """Return the unpacked index record for an integer LOGRECNO, or None."""
+        if self._dense:
+            position = logrecno - self._first_logrecno
+            if 0 <= position < self._record_count:
+                return self._record_at(position)
+            return None
+        low, high = 0, self._record_count
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record_at(middle)
+            if record[0] < logrecno:
+                low = middle + 1
+            elif record[0] > logrecno:
+                high = middle
+            else:
+                return record
+        return None
+
+    def __getitem__(self, logrecno):
+        """Return a dictionary of geography fields for a LOGRECNO string."""
+        try:
+            record = self._find(int(logrecno))
+        except ValueError:
+            record = None
+        if record is None:
+            raise KeyError(logrecno)
+        return {
+            'COMPONENT': record[5].rstrip('\0'),
+            'FILEID': record[2].rstrip('\0'),
+            'LOGRECNO': record[1].rstrip('\0'),
+            'STUSAB': record[3].rstrip('\0'),
+            'SUMLEVEL': record[4].rstrip('\0')
+        }
+
+    def __contains__(self, logrecno):
+        try:
+            self[logrecno]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return self._record_count
+
+    def close(self):
+        """Close the memory map and index file handle."""
+        if self._index_map:
+            self._index_map.close()
+            self._index_map = None
+        if self._index_handler:
+            self._index_handler.close()
+            self._index_handler = None
+
+
+class DelimitedFileScanner(object):
+    """
+    A memory-mapped scanner for simple, unquoted delimited files, such as census estimate files.
+    Iterating yields a list of field values for each line, split only as far as the greatest
+    column needed, so the remaining columns of wide rows are never parsed.
+
+    Lines are found in bulk by slicing blocks of the memory map at line boundaries,
+    bypassing the csv module and file object line buffering. Quoted values are not supported.
+
+    :param path: path to an uncompressed delimited file.
+    :param delimiter: delimiter for the file, defaults to comma.
+    :param max_column: index of the greatest column needed. Columns after this index
+        are returned unsplit, as a single trailing value.
+    :param block_size: approximate number of bytes sliced from the memory map at once.
+    """
+    def __init__(self, path, delimiter=',', max_column=None, block_size=1 << 20):
+        if compression_suffix(path):
+            raise ValueError("Memory-mapped scanning requires an uncompressed file: %s" % path)
+        self.path = path
+        self.delimiter = delimiter
+        self.max_split = -1 if max_column is None else max_column + 1
+        self.block_size = block_size
+        self._file_handler = open(path, 'rb')
+        self._map = None
+        if os.fstat(self._file_handler.fileno()).st_size:
+            self._map = mmap.mmap(self._file_handler.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _iter_blocks(self):
+        """Generator returning blocks of the memory map, each ending at a line boundary."""
+        map_size = len(self._map)
+        start = 0
+        while start < map_size:
+            stop = self._map.find('\n', min(start + self.block_size, map_size) - 1)
+            stop = map_size if stop == -1 else stop + 1
+            yield self._map[start:stop]
+            start = stop
+
+    def __iter__(self):
+        if self._map is None:
+            return
+        # Match the line terminator of the file, leaving no trailing '\r' on the final column.
+        first_line_end = self._map.find('\n')
+        line_terminator = '\r\n' if first_line_end > 0 and self._map[first_line_end - 1] == '\r' else '\n'
+        delimiter, max_split = self.delimiter, self.max_split
+        for block in self._iter_blocks():
+            lines = block.split(line_terminator)
+            if not lines[-1]:
+                lines.pop()
+            for line in lines:
+                yield line.split(delimiter, max_split)
+
+    def close(self):
+        """Close the memory map and file handle."""
+        if self._map:
+            self._map.close()
+            self._map = None
+        if self._file_handler:
+            self._file_handler.close()
+            self._file_handler = None
+
+
 class ReaderCensus(ReaderBaseClass):
     """
     Reader class implementation for Census ACS Summary Files.
 
+    A single table is described using the ``fields``, ``sequence`` and ``starting_position``
+    parameters. Multiple tables, potentially spread across many sequence files, are described
+    using the ``tables`` parameter. In either case the geography file is parsed once, each
+    required estimate file is scanned once, and a single record is emitted per LOGRECNO
+    containing the fields of every requested table.
+
     Required Config Parameters:
 
     :param path: contains a pathway to an ACS formatted directory of estimate and geography tables.
@@ -209,6 +963,27 @@ class ReaderCensus(ReaderBaseClass):
     Non-Required Config Parameters:
 
     :param delimiter: delimiter for CSV file, defaults to comma.
+    :param tables: an array of table objects, each containing ``fields``, ``sequence`` and
+        ``starting_position`` members. Replaces the single table parameters above.
+        Field names must be unique across all tables.
+    :param geography_index: if true, look up geography records using a memory-mapped
+        ``CensusGeographyIndex``, built beside the geography file on first use, rather than
+        parsing the geography file into a dictionary. If the index can't be written, e.g. as the
+        census directory is read only, a RuntimeWarning is issued and the dictionary is used
+        instead. Defaults to false.
+    :param geography_index_dir: used with ``geography_index``. Directory to write indexes to,
+        rather than beside each geography file.
+    :param margins_of_error: if true, read the margin of error file paired with each estimate file,
+        emitting a ``<field>_moe`` value alongside each field. Margin of error files begin with 'm'
+        and are aligned row for row with their estimate file. Defaults to false.
+    :param decompress: estimate, margin of error and geography files may be compressed, with a '.gz',
+        '.bz2' or '.xz' suffix. One of 'inline', 'thread' or 'process'. See ``DecompressedFile``.
+        Defaults to 'inline'.
+    :param scan_mode: either 'csv' or 'mmap'. In 'mmap' mode, uncompressed estimate and margin of
+        error files are scanned using a memory-mapped ``DelimitedFileScanner``, splitting each row
+        only as far as the last requested field. Census estimate files are unquoted, making this
+        safe and considerably faster for wide sequence files. Compressed files can't be
+        memory-mapped, and are parsed as in 'csv' mode. Defaults to 'csv'.
 
     Example configuration file entry::
 
@@ -224,32 +999,73 @@ class ReaderCensus(ReaderBaseClass):
                 "sequence": 2,
                 "starting_position": 87
             }
+
+    Example configuration file entry for multiple tables::
+
+            "WA_Profile": {
+                "type": "ReaderCensus",
+                "path": "path/to/Washington_All_Geographies_Tracts_Block_Groups_Only",
+                "tables": [
+                    {"sequence": 1, "starting_position": 7, "fields": {"UnweightedPop": 1}},
+                    {"sequence": 2, "starting_position": 87, "fields": {"Total": 1, "Male": 2}}
+                ]
+            }
     """
 
-    def __init__(self, fields, path, sequence, starting_position, delimiter=",", **kwargs):
+    def __init__(self, path, fields=None, sequence=None, starting_position=None, delimiter=",",
+                 tables=None, geography_index=False, margins_of_error=False, decompress='inline',
+                 scan_mode='csv', geography_index_dir=None, **kwargs):
         """
         :param delimiter: extracted from conn_info, defaults to ','.
         :param fields: dict of field names and line number indexes.
         :param path: location of directory of census data.
         :param sequence: sequence number for table of interest.
         :param starting_position: starting position for table of interest.
-        :param _estimate_reader: csv.reader instance parsing estimate tables.
-        :param _estimate_handler: file handler for estimate file.
-        :param _estimate_path: path to estimate file, generated based on user provided path and sequence value.
+        :param tables: list of dicts, each containing fields, sequence and starting_position.
+        :param geography_index: use a CensusGeographyIndex for geography lookups.
+        :param geography_index_dir: directory holding geography indexes.
+        :param margins_of_error: read margin of error files paired with estimate files.
+        :param decompress: decompression mode for compressed files.
+        :param scan_mode: 'csv' or 'mmap', how estimate and margin of error files are parsed.
+        :param _estimate_fields: dict of sequence numbers, each mapping field names to
+            list indexes within that sequence's estimate file.
+        :param _estimate_readers: dict of csv.reader or DelimitedFileScanner instances parsing
+            estimate tables, by sequence.
+        :param _estimate_handlers: dict of file handlers for estimate files, by sequence.
+        :param _estimate_paths: dict of paths to estimate files, by sequence. Generated based
+            on user provided path and sequence values.
+        :param _margin_readers: dict of csv.reader instances parsing margin of error tables, by sequence.
+        :param _margin_handlers: dict of file handlers for margin of error files, by sequence.
+        :param _margin_paths: dict of paths to margin of error files, by sequence.
         :param _geography_path: path to geography file, generated based on user provided path.
         :param _geography_records: populated by parsing a geography file.
             a dictionary populated with keys representing LOGRECNO values
             for a given row, and values representing the first six fields
-            of that row.
+            of that row. A CensusGeographyIndex if geography_index is true.
         """
         self.delimiter = delimiter
+        self.geography_index = geography_index
+        self.geography_index_dir = geography_index_dir
+        self.margins_of_error = margins_of_error
+        self.decompress = decompress
+        if scan_mode not in ('csv', 'mmap'):
+            raise ValueError("Scan mode must be one of 'csv' or 'mmap'.")
+        self.scan_mode = scan_mode
         self.fields = fields
         self.path = path
         self.sequence = sequence
         self.starting_position = starting_position
-        self._estimate_reader = None
-        self._estimate_handler = None
-        self._estimate_path = None
+        # Single table parameters are treated as a one element list of tables.
+        if tables is None:
+            tables = [{'fields': fields, 'sequence': sequence, 'starting_position': starting_position}]
+        self.tables = tables
+        self._estimate_fields = {}
+        self._estimate_readers = {}
+        self._estimate_handlers = {}
+        self._estimate_paths = {}
+        self._margin_readers = {}
+        self._margin_handlers = {}
+        self._margin_paths = {}
         self._geography_path = None
         self._geography_records = {}
 
@@ -257,44 +1073,85 @@ class ReaderCensus(ReaderBaseClass):
         self._setup()
 
     def _setup(self):
+        self._build_estimate_fields()
         self._get_paths()
         self._build_logrecno_dict()
-        self._build_estimate_reader()
+        self._build_estimate_readers()
         return True
 
+    def _build_estimate_fields(self):
+        """
+        Group the fields of each requested table by sequence number.
+        Reformat starting_position and individual field indexes
+        for use in list lookup.
+        """
+        seen_fields = set()
+        for table in self.tables:
+            if not table.get('fields') or table.get('sequence') is None or table.get('starting_position') is None:
+                raise ValueError("Census tables require fields, sequence and starting_position values.")
+            sequence_num = int(table['sequence'])
+            sequence_fields = self._estimate_fields.setdefault(sequence_num, {})
+            # Reformat the user-provided field indexes with values reflecting starting_position
+            # Decrement by two to account for both the user-provided starting position and the field values
+            start_index = int(table['starting_position']) - 2
+            for k, v in table['fields'].iteritems():
+                if k in seen_fields:
+                    raise ValueError("Field name %s is used by more than one census table." % k)
+                seen_fields.add(k)
+                sequence_fields[k] = start_index + int(v)
+
     def _get_paths(self):
         """
         Build paths for the geography and estimate files.
         Geography files begin a 'g' and have a CSV extension.
-        Estimate files are based on the sequence number.
+        Estimate files are based on the sequence numbers of the requested tables.
+        Margin of error files share the estimate file name, beginning with 'm' rather than 'e'.
+        Any file may carry a compression suffix, e.g. '.gz'.
         """
         dir_contents = os.listdir(self.path)
-        sequence_num = int(self.sequence)
         for f in dir_contents:
             # Get geography path. Slice doesn't need to be trapped for index error due to string < 3 char.
-            if f[0] == 'g' and f[len(f)-3:] == 'csv':
+            if f[0] == 'g' and strip_compression_suffix(f)[-3:] == 'csv':
                 self._geography_path = os.path.join(self.path, f)
-            # Set estimate path. Pass over when string is too short (index error) or
+            # Set estimate and margin of error paths. Pass over when string is too short (index error) or
             # when characters f[8:12] are not coercible to integers (Value Error).
-            if f[0] == 'e':
+            if f[0] in ('e', 'm'):
                 try:
-                    if int(f[8:12]) == sequence_num:
-                        self._estimate_path = os.path.join(self.path, f)
+                    sequence_num = int(f[8:12])
+                    if sequence_num in self._estimate_fields:
+                        if f[0] == 'e':
+                            self._estimate_paths[sequence_num] = os.path.join(self.path, f)
+                        else:
+                            self._margin_paths[sequence_num] = os.path.join(self.path, f)
                 except (ValueError, IndexError):
                     pass
 
         # Raise Errors if not populated.
         if not self._geography_path:
             raise IOError("Expected geography file not found. Starts with 'g' and csv extent")
-        if not self._estimate_path:
-            raise IOError("Expected estimate file not found. Sequence given: %s." % self.sequence)
+        for sequence_num in sorted(self._estimate_fields):
+            if sequence_num not in self._estimate_paths:
+                raise IOError("Expected estimate file not found. Sequence given: %s." % sequence_num)
+            if self.margins_of_error and sequence_num not in self._margin_paths:
+                raise IOError("Expected margin of error file not found. Sequence given: %s." % sequence_num)
 
     def _build_logrecno_dict(self):
         """
         Create a dictionary of LOGRECNO values with associated attributes.
         Will be used as a lookup during iteration of estimate table.
+        If self.geography_index is set, open a memory-mapped index instead,
+        unless the index can't be written.
         """
-        with open(self._geography_path, 'rt') as geography_file_handle:
+        if self.geography_index:
+            try:
+                self._geography_records = CensusGeographyIndex(self._geography_path, self.delimiter,
+                                                               self.geography_index_dir)
+                return
+            except GeographyIndexError as e:
+                warnings.warn("Geography index not available, parsing geography file instead. "
+                              "Set geography_index_dir to a writable directory. %s" % e.strerror, RuntimeWarning)
+        geography_file_handle = open_input(self._geography_path, decompress=self.decompress)
+        try:
             geography_field_names = ['FILEID', 'STUSAB', 'SUMLEVEL', 'COMPONENT', 'LOGRECNO']
             geography_reader = csv.DictReader(geography_file_handle, geography_field_names, delimiter=self.delimiter)
 
@@ -306,53 +1163,434 @@ class ReaderCensus(ReaderBaseClass):
                     'STUSAB': record['STUSAB'],
                     'SUMLEVEL': record['SUMLEVEL']
                 }
+        finally:
+            geography_file_handle.close()
 
-    def _build_estimate_reader(self):
+    def _open_estimate_file(self, path, max_column):
         """
-        Create a CSV reader using the estimate file.
-        Reformat starting_position and individual field indexes
-        for use in list lookup.
+        Return a (file handler, reader) tuple for an estimate or margin of error file.
+        In 'mmap' scan mode, a DelimitedFileScanner acts as both file handler and reader.
+        Compressed files can't be memory-mapped, so are always parsed using a CSV reader.
         """
-        self._estimate_handler = open(self._estimate_path, 'rt')
-        self._estimate_reader = csv.reader(self._estimate_handler, delimiter=self.delimiter)
+        if self.scan_mode == 'mmap' and not compression_suffix(path):
+            scanner = DelimitedFileScanner(path, self.delimiter, max_column)
+            return scanner, scanner
+        file_handler = open_input(path, decompress=self.decompress)
+        return file_handler, csv.reader(file_handler, delimiter=self.delimiter)
 
-        # Reformat the user-provided field indexes with values reflecting starting_position
-        # Decrement by two to account for both the user-provided starting position and the field values
-        start_index = int(self.starting_position) - 2
-        for k, v in self.fields.iteritems():
-            self.fields[k] = start_index + int(v)
+    def _build_estimate_readers(self):
+        """
+        Create a reader for each required estimate file,
+        and each paired margin of error file if requested.
+        """
+        for sequence_num, estimate_path in self._estimate_paths.iteritems():
+            # LOGRECNO is the sixth column.
+            max_column = max(self._estimate_fields[sequence_num].values() + [5])
+            self._estimate_handlers[sequence_num], self._estimate_readers[sequence_num] = \
+                self._open_estimate_file(estimate_path, max_column)
+            if self.margins_of_error:
+                self._margin_handlers[sequence_num], self._margin_readers[sequence_num] = \
+                    self._open_estimate_file(self._margin_paths[sequence_num], max_column)
 
     def __del__(self, exc_type=None, exc_val=None, exc_tb=None):
         """
-        Close estimate file handle.
+        Close estimate and margin of error file handles, and any geography index.
         """
-        if self._estimate_handler:
-            self._estimate_handler.close()
+        for estimate_handler in self._estimate_handlers.itervalues():
+            estimate_handler.close()
+        for margin_handler in self._margin_handlers.itervalues():
+            margin_handler.close()
+        if isinstance(self._geography_records, CensusGeographyIndex):
+            self._geography_records.close()
         if exc_type is not None:
             # Exception occurred
             return False  # Will raise the exception
         return True  # Everything's okay
 
+    def _iter_estimates(self, sequence_num):
+        """
+        Generator returning a (LOGRECNO, sequence, estimate dict) tuple for each row of
+        a single estimate file. The sequence number orders rows sharing a LOGRECNO.
+        If self.margins_of_error is set, the paired margin of error row is read in
+        lockstep, adding a <field>_moe value for each field.
+        NOTE: We assume all estimate and margin of error values to return INTs.
+        """
+        fields = self._estimate_fields[sequence_num]
+        if not self.margins_of_error:
+            for row in self._estimate_readers[sequence_num]:
+                yield row[5], sequence_num, {k: int(row[v]) for k, v in fields.iteritems()}
+            return
+
+        margin_fields = {k + '_moe': v for k, v in fields.iteritems()}
+        paired_rows = itertools.izip_longest(self._estimate_readers[sequence_num], self._margin_readers[sequence_num])
+        for row, margin_row in paired_rows:
+            if row is None or margin_row is None or row[5] != margin_row[5]:
+                raise ValueError("Estimate and margin of error files for sequence %s are not aligned." % sequence_num)
+            estimate_vals = {k: int(row[v]) for k, v in fields.iteritems()}
+            estimate_vals.update((k, int(margin_row[v])) for k, v in margin_fields.iteritems())
+            yield row[5], sequence_num, estimate_vals
+
+    def _check_sorted(self, estimate_rows, sequence_num):
+        """
+        Generator returning each estimate row, raising a ValueError if LOGRECNO decreases.
+        The merge on LOGRECNO would otherwise emit several partial records per LOGRECNO.
+        """
+        previous_logrecno = None
+        for estimate_row in estimate_rows:
+            logrecno = estimate_row[0]
+            if previous_logrecno is not None and logrecno < previous_logrecno:
+                raise ValueError("Estimate file for sequence %s is not sorted by LOGRECNO: %s follows %s." %
+                                 (sequence_num, logrecno, previous_logrecno))
+            previous_logrecno = logrecno
+            yield estimate_row
+
     def __iter__(self):
         """
         Generator returning a dict of field name: field value pairs for each record.
-        Combines estimate row with corresponding geography row based on common LOGRECNO value.
-        NOTE: We assume all estimate values to return INTs.
+        Performs an ordered merge on LOGRECNO across all estimate files, combining
+        the merged estimate values with the corresponding geography row.
+        Fields of a sequence file missing a given LOGRECNO are emitted as None.
+        Raises a ValueError if an estimate file is not sorted by LOGRECNO.
         """
-        fields = self.fields
-        for row in self._estimate_reader:
-            logrecno = row[5]
-            estimate_vals = {k: int(row[v]) for k, v in fields.items()}
+        empty_vals = dict.fromkeys(itertools.chain.from_iterable(self._estimate_fields.itervalues()))
+        if self.margins_of_error:
+            empty_vals.update(dict.fromkeys(k + '_moe' for k in empty_vals.keys()))
+        # Estimate files are sorted by LOGRECNO, a zero-padded string.
+        estimate_iterators = [self._check_sorted(self._iter_estimates(s), s) for s in sorted(self._estimate_readers)]
+        merged_rows = heapq.merge(*estimate_iterators)
+        for logrecno, logrecno_rows in itertools.groupby(merged_rows, key=operator.itemgetter(0)):
             # get the corresponding geographic record
             if logrecno in self._geography_records:
+                record = dict(empty_vals)
+                for _, _, estimate_vals in logrecno_rows:
+                    record.update(estimate_vals)
                 # yield a concatenated estimate and geography dictionary
-                geography_vals = self._geography_records[logrecno]
-                yield dict(estimate_vals.items() + geography_vals.items())
+                record.update(self._geography_records[logrecno])
+                yield record
             else:
                 raise KeyError("LOGRECNO: %s not found in geography table." % str(logrecno))
 
 
-class ReaderPostgres(ReaderBaseClass):
+def _read_census_directory(reader_kwargs, chunk_size):
+    """
+    Generator yielding lists of up to chunk_size records from a ReaderCensus instance
+    created using reader_kwargs.
+    """
+    with ReaderCensus(**reader_kwargs) as census_reader:
+        chunk = []
+        for record in census_reader:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _census_directory_worker(task_queue, result_queues, chunk_size):
+    """
+    Read census directories from task_queue until a None task is received, run within a worker process.
+    Each task is a (result queue index, reader kwargs) tuple. Chunks of records are put on the
+    result queue, followed by None once the directory has been read. Any exception is put in
+    place of the remaining chunks. Result queues are bounded, blocking the worker until the
+    reading process catches up.
+    """
+    for queue_index, reader_kwargs in iter(task_queue.get, None):
+        result_queue = result_queues[queue_index]
+        try:
+            for chunk in _read_census_directory(reader_kwargs, chunk_size):
+                result_queue.put(chunk)
+        except Exception as e:
+            result_queue.put(e)
+        result_queue.put(None)
+
+
+class ReaderCensusMultiState(ReaderBaseClass):
+    """
+    Reader class implementation for many ACS Summary File directories, e.g. one per state.
+    Each directory is read by a ``ReaderCensus`` instance within a worker process, passing
+    records back in chunks. Records carry the STUSAB value of their geography file.
+
+    Required Config Parameters:
+
+    :param paths: either a glob pattern or an array of pathways to ACS formatted directories.
+
+    Non-Required Config Parameters:
+
+    :param processes: number of worker processes. Defaults to the number of CPUs.
+        A value of 1 reads each directory within the current process.
+    :param ordered: if true, emit records ordered by state, using the STUSAB abbreviation
+        of each directory's geography file. Otherwise emit records for each state as soon
+        as they are available. Defaults to false.
+    :param chunk_size: number of records passed from a worker process at a time. Each worker holds
+        at most ``queue_size`` chunks awaiting the reading process, bounding memory use regardless
+        of the size of each state. Defaults to 10000.
+    :param queue_size: number of chunks a worker may read ahead of the reading process. Defaults to 4.
+
+    All other parameters, e.g. ``fields``, ``sequence``, ``starting_position`` or ``tables``,
+    are passed to each ``ReaderCensus`` instance. See ``ReaderCensus``.
+
+    Example configuration file entry::
+
+            "US_All": {
+                "type": "ReaderCensusMultiState",
+                "paths": "path/to/*_All_Geographies_Tracts_Block_Groups_Only",
+                "processes": 8,
+                "ordered": true,
+                "fields": {
+                    "Total": 1,
+                    "Male": 2,
+                    "Female": 17
+                },
+                "sequence": 2,
+                "starting_position": 87
+            }
+    """
+
+    def __init__(self, paths, processes=None, ordered=False, chunk_size=10000, queue_size=4, **kwargs):
+        """
+        :param paths: glob pattern or list of census directories.
+        :param processes: number of worker processes.
+        :param ordered: emit records ordered by state.
+        :param chunk_size: number of records passed from a worker process at a time.
+        :param queue_size: number of chunks a worker may read ahead.
+        :param census_kwargs: parameters passed to each ReaderCensus instance.
+        :param _workers: list of multiprocessing.Process instances, started during iteration.
+        """
+        if isinstance(paths, basestring):
+            paths = glob.glob(os.path.expanduser(paths))
+        self.paths = [p for p in paths if os.path.isdir(p)]
+        if not self.paths:
+            raise IOError("No census directories found for paths: %s" % paths)
+        self.processes = processes
+        self.ordered = ordered
+        self.chunk_size = int(chunk_size)
+        self.queue_size = int(queue_size)
+        self.census_kwargs = kwargs
+        self._workers = []
+
+    def _directory_stusab(self, path):
+        """
+        Return the state abbreviation for a census directory,
+        parsed from the name of its geography file, e.g. g20125wa.csv
+        """
+        for f in os.listdir(path):
+            if f[0] == 'g' and strip_compression_suffix(f)[-3:] == 'csv':
+                return f[6:8].upper()
+        raise IOError("Expected geography file not found. Starts with 'g' and csv extent")
+
+    def _reader_kwargs(self):
+        """Return a list of ReaderCensus kwargs, one per census directory."""
+        paths = self.paths
+        if self.ordered:
+            paths = sorted(paths, key=self._directory_stusab)
+        return [dict(self.census_kwargs, path=p) for p in paths]
+
+    def __del__(self, exc_type=None, exc_val=None, exc_tb=None):
+        """Terminate the worker processes. Note: Will be Called Twice if a Context Manager is used."""
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+        self._workers = []
+        if exc_type is not None:
+            # Exception occurred
+            return False  # Will raise the exception
+        return True  # Everything's okay
+
+    def _iter_chunks(self, result_queue):
+        """Generator yielding chunks from result_queue until None, raising any worker exception."""
+        for chunk in iter(result_queue.get, None):
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def _iter_worker_chunks(self, reader_kwargs):
+        """
+        Generator yielding chunks of records read by worker processes. In ordered mode each
+        directory has its own result queue, read in turn. Directories are taken by workers in
+        the same order, so the directory being read is always in progress or complete.
+        """
+        queue_count = len(reader_kwargs) if self.ordered else 1
+        result_queues = [multiprocessing.Queue(self.queue_size) for i in range(queue_count)]
+        task_queue = multiprocessing.Queue()
+        for i, kwargs in enumerate(reader_kwargs):
+            task_queue.put((i if self.ordered else 0, kwargs))
+        worker_count = min(self.processes or multiprocessing.cpu_count(), len(reader_kwargs))
+        for i in range(worker_count):
+            task_queue.put(None)
+            worker = multiprocessing.Process(target=_census_directory_worker,
+                                             args=(task_queue, result_queues, self.chunk_size))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        if self.ordered:
+            for result_queue in result_queues:
+                for chunk in self._iter_chunks(result_queue):
+                    yield chunk
+        else:
+            for i in range(len(reader_kwargs)):
+                for chunk in self._iter_chunks(result_queues[0]):
+                    yield chunk
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def __iter__(self):
+        """
+        Generator returning a dict of field name: field value pairs for each record,
+        for each census directory.
+        """
+        reader_kwargs = self._reader_kwargs()
+        if self.processes == 1:
+            chunks = itertools.chain.from_iterable(_read_census_directory(kwargs, self.chunk_size)
+                                                   for kwargs in reader_kwargs)
+        else:
+            chunks = self._iter_worker_chunks(reader_kwargs)
+        for chunk in chunks:
+            for record in chunk:
+                yield record
+
+
+class PostgresConnectionPool(object):
+    """
+    A thread-safe pool of psycopg2 connections sharing a single set of connection parameters.
+    Connections are borrowed and released by ``ReaderPostgres`` instances. Once
+    ``max_connections`` are borrowed, borrowing blocks until one is released, raising
+    ``psycopg2.pool.PoolError`` after ``timeout`` seconds.
+
+    Pools are created using ``get_connection_pool()`` and closed by ``close_connection_pools()``,
+    which is called once the ``Controller`` has processed all layers.
+
+    :param conn_params: dict of psycopg2 connection parameters.
+    :param max_connections: maximum number of connections open at once.
+    :param timeout: seconds to wait for a connection before raising an error.
+    """
+
+    def __init__(self, conn_params, max_connections=4, timeout=30):
+        self.conn_params = conn_params
+        self.max_connections = int(max_connections)
+        self.timeout = timeout
+        self._idle_connections = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.max_connections)
+        self._closed = False
+
+    def borrow(self, connect):
+        """
+        Return an idle connection, or a new connection created by calling connect(conn_params).
+        """
+        deadline = time.time() + self.timeout
+        while not self._slots.acquire(False):
+            if time.time() > deadline:
+                raise psycopg2.pool.PoolError("Connection pool exhausted, %s connections in use." % self.max_connections)
+            time.sleep(0.01)
+        try:
+            with self._lock:
+                if self._idle_connections:
+                    return self._idle_connections.pop()
+            return connect(self.conn_params)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """
+        Return a borrowed connection to the pool, ending any open transaction.
+        Broken connections, or those released after the pool is closed, are discarded.
+        """
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+        with self._lock:
+            if self._closed:
+                conn.close()
+            elif not conn.closed:
+                self._idle_connections.append(conn)
+        self._slots.release()
+
+    def close(self):
+        """Close all idle connections. Connections still borrowed are closed on release."""
+        with self._lock:
+            self._closed = True
+            for conn in self._idle_connections:
+                conn.close()
+            self._idle_connections = []
+
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(conn_params, max_connections=4, timeout=30):
+    """
+    Return the PostgresConnectionPool for a set of connection parameters, creating it if needed.
+    The pool size is set by the first caller.
+    """
+    pool_key = tuple(sorted(conn_params.items()))
+    with _connection_pools_lock:
+        if pool_key not in _connection_pools:
+            _connection_pools[pool_key] = PostgresConnectionPool(conn_params, max_connections, timeout)
+        return _connection_pools[pool_key]
+
+
+def close_connection_pools():
+    """Close and discard all connection pools."""
+    with _connection_pools_lock:
+        for pool in _connection_pools.itervalues():
+            pool.close()
+        _connection_pools.clear()
+
+
+class PostgresConnectionMixin(object):
+    """
+    Connection handling shared by ``ReaderPostgres`` and ``processors.ProcessorPostgresWriter``.
+    Connections are borrowed from a shared ``PostgresConnectionPool`` if a pool size is given,
+    otherwise opened per instance. Subclasses may override ``_open_connection()``.
+
+    A pooled connection may be borrowed by either class, so connections are opened the same way
+    for both; a subclass needing a particular cursor type requests it for each cursor.
+    """
+
+    def _init_connection_params(self, database, user=None, password=None, host='localhost', port=5432,
+                                pool_size=None, pool_timeout=30):
+        """Set self.conn_params, and self._pool if pooling."""
+        self.conn_params = {
+            'database': database,
+            'host': host,
+            'port': port}
+        # Append user and password if provided
+        # Else i think this uses your system user. TODO: Check on that.
+        if user:
+            self.conn_params['user'] = user
+        if password:
+            self.conn_params['password'] = password
+        self._pool = None
+        if pool_size:
+            self._pool = get_connection_pool(self.conn_params, pool_size, pool_timeout)
+
+    def _open_connection(self, conn_params):
+        """Return an open psycopg2 connection with Unicode support"""
+        conn = psycopg2.connect(**conn_params)
+        psycopg2.extensions.register_type(psycopg2.extensions.UNICODE, conn)
+        return conn
+
+    def _get_connection(self):
+        """Return a connection, borrowed from self._pool if pooling, else newly opened."""
+        if self._pool:
+            return self._pool.borrow(self._open_connection)
+        return self._open_connection(self.conn_params)
+
+    def _release_connection(self, conn):
+        """Return a connection to self._pool if pooling, else close it."""
+        if self._pool:
+            self._pool.release(conn)
+        else:
+            conn.close()
+
+
+class ReaderPostgres(ReaderBaseClass, PostgresConnectionMixin):
     """
     Reader class implementation executing a single query via psycopg2.
     Specifically, the __iter__() method will yield a single dictionary
@@ -370,6 +1608,39 @@ class ReaderPostgres(ReaderBaseClass):
     :param password: password for db user.
     :param host: host name, defaults to localhost.
     :param port: port number, defaults to 5432.
+    :param server_side: if true, stream results using a named (server-side) cursor,
+        rather than fetching the entire result set into client memory. Defaults to false.
+    :param itersize: number of rows fetched per round trip by a server-side cursor.
+        Defaults to 2000.
+    :param copy: if true, extract results using ``COPY (query) TO STDOUT WITH CSV``,
+        parsing the CSV stream as it arrives, rather than using a cursor. Defaults to false.
+    :param field_types: used with ``copy``. A mapping of field names to output python data type.
+        If not provided, defaults all output to unicode strings. NULL values are emitted as None.
+
+    :param partition_column: if given, split the query into partitions on the values of this
+        column, reading partitions concurrently over several connections. Records from each
+        partition are emitted as they arrive.
+    :param partitions: used with ``partition_column``. Either a number of ranges to split the
+        minimum to maximum values of the column into, or an array of explicit partitions. Each
+        member of the array is a ``[low, high]`` range, including low and excluding high, or a
+        single value. When given a number, rows with NULL values form an additional partition.
+        Defaults to 4.
+    :param connections: used with ``partition_column``. Maximum number of concurrent connections.
+        Defaults to 4.
+    :param snapshot: used with ``partition_column``. If true, all partitions read from a single
+        snapshot exported by the reader's own connection. Defaults to false.
+    :param pool_size: if given, borrow connections from a ``PostgresConnectionPool`` shared by all
+        readers using the same connection parameters, holding at most pool_size connections.
+        Connections are returned to the pool, rather than closed, when the reader is deleted.
+    :param pool_timeout: used with ``pool_size``. Seconds to wait for a free connection. Defaults to 30.
+    :param watermark_column: if given, read incrementally, adding a WHERE clause to the query
+        selecting only rows whose value for this column is greater than the high-water mark
+        saved by the previous run.
+    :param watermark_state: used with ``watermark_column``. Pathway to a JSON state file holding
+        high-water marks, keyed by layer and reader name.
+
+    NOTE: When using ``copy``, a text value of '\\N' is indistinguishable from NULL.
+    ``copy`` and ``partition_column`` can not be combined.
 
     Example configuration file entry::
 
@@ -380,29 +1651,97 @@ class ReaderPostgres(ReaderBaseClass):
                 "user": "postgres",
                 "password": "postgres",
                 "host": "localhost",
-                "port": 5432
+                "port": 5432,
+                "server_side": true,
+                "itersize": 5000
             },
-    """
 
-    def __init__(self, query, database, user=None, password=None, host='localhost', port=5432, **kwargs):
-        self.conn_params = {
-            'database': database,
-            'host': host,
-            'port': port}
-        # Append user and password if provided
-        # Else i think this uses your system user. TODO: Check on that.
-        if user:
-            self.conn_params['user'] = user
-        if password:
-            self.conn_params['password'] = password
-        self.query = query
-        self._conn_handler = self._open_connection(self.conn_params)
-        self._dict_cursor = self._execute_query(self._conn_handler, self.query)
+    Example configuration file entry using COPY::
 
-    def _open_connection(self, conn_params):
-        """Return an open psycopg2 connection"""
-        conn = psycopg2.connect(cursor_factory=RealDictCursor, **conn_params)
-        return conn
+            "Facilities": {
+                "type": "ReaderPostgres",
+                "query": "SELECT registry_id, name, latitude83 FROM frs_facilities",
+                "database": "dbname",
+                "copy": true,
+                "field_types": {"registry_id": "int", "latitude83": "float"}
+            },
+
+    Example configuration file entry using partitions::
+
+            "Facilities": {
+                "type": "ReaderPostgres",
+                "query": "SELECT * FROM frs_facilities",
+                "database": "dbname",
+                "partition_column": "registry_id",
+                "partitions": 8,
+                "connections": 8,
+                "snapshot": true
+            },
+
+    Example configuration file entry using a connection pool::
+
+            "CountyLookup": {
+                "type": "ReaderPostgres",
+                "query": "SELECT county_fips, county_name FROM counties",
+                "database": "dbname",
+                "pool_size": 8
+            },
+
+    Example configuration file entry for incremental reads::
+
+            "Facilities": {
+                "type": "ReaderPostgres",
+                "query": "SELECT * FROM frs_facilities",
+                "database": "dbname",
+                "watermark_column": "updated_at",
+                "watermark_state": "/path/to/watermarks.json"
+            },
+    """
+    field_mapping = {
+        'int': int,
+        'integer': int,
+        'float': float,
+        'str': lambda v: v.decode('utf8'),
+        'string': lambda v: v.decode('utf8'),
+        'unicode': lambda v: v.decode('utf8'),
+        'text': lambda v: v.decode('utf8')
+    }
+    copy_null = '\\N'
+
+    def __init__(self, query, database, user=None, password=None, host='localhost', port=5432,
+                 server_side=False, itersize=2000, copy=False, field_types=None, partition_column=None,
+                 partitions=4, connections=4, snapshot=False, pool_size=None, pool_timeout=30,
+                 watermark_column=None, watermark_state=None, watermark_key=None, **kwargs):
+        self._init_connection_params(database, user, password, host, port, pool_size, pool_timeout)
+        self.query = query
+        self.server_side = server_side
+        self.itersize = int(itersize)
+        self.copy = copy
+        self.field_types = field_types or {}
+        self._copy_error = None
+        self.partition_column = partition_column
+        self.partitions = partitions
+        self.connections = int(connections)
+        self.snapshot = snapshot
+        self._partition_stop = threading.Event()
+        if self.copy and self.partition_column:
+            raise ValueError("ReaderPostgres copy and partition_column can not be combined.")
+        self._watermark = None
+        if watermark_column:
+            self._watermark = Watermark(watermark_state, watermark_key or watermark_column, watermark_column)
+        self._conn_handler = None
+        self._conn_handler = self._get_connection()
+        # COPY output and partitioned queries are requested when iteration begins.
+        self._dict_cursor = None
+        if not (self.copy or self.partition_column):
+            self._dict_cursor = self._execute_query(self._conn_handler, self._query_text())
+
+    def _cursor(self, db_conn, name=None):
+        """
+        Return a RealDictCursor on db_conn, named if name is given. The cursor type is requested
+        explicitly, as pooled connections may have been opened by a ProcessorPostgresWriter.
+        """
+        return db_conn.cursor(name=name, cursor_factory=RealDictCursor)
 
     def _validate_query(self, query):
         """Return validated query.
@@ -420,20 +1759,214 @@ class ReaderPostgres(ReaderBaseClass):
         except Exception:
             raise Exception
 
-    def _execute_query(self, db_conn, query):
+    def _quote_identifier(self, identifier):
+        """Return a double-quoted SQL identifier."""
+        return '"%s"' % identifier.replace('"', '""')
+
+    def _query_text(self):
+        """
+        Return the text of self.query. If reading incrementally, the query is wrapped
+        to select only rows newer than the stored high-water mark.
+        """
+        query_text = self._validate_query(self.query).strip().rstrip(';')
+        if self._watermark and self._watermark.value is not None:
+            incremental_query = 'SELECT * FROM (%s) AS dp_incremental WHERE %s > %%s' % (
+                query_text.replace('%', '%%'), self._quote_identifier(self._watermark.column))
+            query_text = self._conn_handler.cursor().mogrify(incremental_query, (self._watermark.value,))
+        return query_text
+
+    def _execute_query(self, db_conn, query, query_vars=None):
         """Return a cursor with result set from self.query"""
         # Test if self.query is a file for inline query
         validated_query = self._validate_query(query)
-        # Create cursor with Unicode support and Execute Query
-        cur = db_conn.cursor()
-        psycopg2.extensions.register_type(psycopg2.extensions.UNICODE, cur)
-        cur.execute(validated_query)
+        if self.server_side:
+            # A named cursor is declared on the server, rows are fetched itersize at a time.
+            cur = self._cursor(db_conn, 'dataplunger_%x' % id(self))
+            cur.itersize = self.itersize
+        else:
+            cur = self._cursor(db_conn)
+        cur.execute(validated_query, query_vars)
         return cur
 
+    def _partition_predicates(self, query_text):
+        """
+        Return a list of (where clause, query parameters) tuples, one per partition.
+        """
+        column = self._quote_identifier(self.partition_column)
+        if isinstance(self.partitions, list):
+            predicates = []
+            for partition in self.partitions:
+                if isinstance(partition, list):
+                    predicates.append(('%s >= %%s AND %s < %%s' % (column, column), tuple(partition)))
+                else:
+                    predicates.append(('%s = %%s' % column, (partition,)))
+            return predicates
+
+        # Split the minimum to maximum values of the partition column into equal ranges.
+        cur = self._cursor(self._conn_handler)
+        cur.execute('SELECT min(%s) AS partition_min, max(%s) AS partition_max FROM (%s) AS dp_partition'
+                    % (column, column, query_text))
+        bounds = cur.fetchone()
+        low, high = bounds['partition_min'], bounds['partition_max']
+        predicates = [('%s IS NULL' % column, None)]
+        if low is None:
+            return predicates
+        count = int(self.partitions)
+        try:
+            if isinstance(low, (int, long)):
+                edges = [low + (high - low) * i // count for i in range(count)] + [high]
+            else:
+                edges = [low + (high - low) * i / count for i in range(count)] + [high]
+        except TypeError:
+            raise ValueError("Partitioning into %s ranges requires a numeric or date partition_column." % count)
+        for i in range(count - 1):
+            predicates.append(('%s >= %%s AND %s < %%s' % (column, column), (edges[i], edges[i + 1])))
+        predicates.append(('%s >= %%s AND %s <= %%s' % (column, column), (edges[-2], edges[-1])))
+        return predicates
+
+    def _put_partition_item(self, record_queue, item):
+        """Put an item on the record queue, giving up if iteration has stopped."""
+        while not self._partition_stop.is_set():
+            try:
+                record_queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def _read_partitions(self, query_text, partition_queue, record_queue, snapshot_id):
+        """
+        Read partitions from partition_queue over a single connection, putting lists of
+        records on record_queue. Run within a separate thread. Any exception is put on
+        record_queue, followed by None to signal the thread has finished.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            if snapshot_id:
+                cur = conn.cursor()
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            while not self._partition_stop.is_set():
+                try:
+                    where_clause, query_vars = partition_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                # Parameters are formatted into the whole query, so literal '%' characters are escaped.
+                partition_query = 'SELECT * FROM (%s) AS dp_partition WHERE %s' % (
+                    query_text.replace('%', '%%') if query_vars is not None else query_text, where_clause)
+                cur = self._execute_query(conn, partition_query, query_vars)
+                for rows in iter(lambda: cur.fetchmany(self.itersize), []):
+                    self._put_partition_item(record_queue, rows)
+                cur.close()
+        except Exception as e:
+            self._put_partition_item(record_queue, e)
+        finally:
+            if conn:
+                self._release_connection(conn)
+            self._put_partition_item(record_queue, None)
+
+    def _iter_partitions(self):
+        """
+        Generator yielding records from each partition of the query,
+        read concurrently by up to self.connections threads.
+        """
+        query_text = self._query_text()
+        snapshot_id = None
+        if self.snapshot:
+            # The exporting transaction remains open until all partitions have been read.
+            cur = self._cursor(self._conn_handler)
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute("SELECT pg_export_snapshot() AS snapshot_id")
+            snapshot_id = cur.fetchone()['snapshot_id']
+
+        partition_queue = Queue.Queue()
+        for predicate in self._partition_predicates(query_text):
+            partition_queue.put(predicate)
+        worker_count = max(1, min(self.connections, partition_queue.qsize()))
+        record_queue = Queue.Queue(maxsize=worker_count * 4)
+        self._partition_stop.clear()
+        workers = []
+        for i in range(worker_count):
+            worker = threading.Thread(target=self._read_partitions,
+                                      args=(query_text, partition_queue, record_queue, snapshot_id))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        running = worker_count
+        try:
+            while running:
+                item = record_queue.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    for row in item:
+                        yield row
+        finally:
+            # Signal threads still reading to stop.
+            self._partition_stop.set()
+        for worker in workers:
+            worker.join()
+        if self.snapshot:
+            self._conn_handler.rollback()
+
+    def _copy_to_handle(self, copy_query, write_handle):
+        """
+        Execute a COPY ... TO STDOUT statement, writing its output to write_handle.
+        Run within a separate thread, storing any exception for the reading thread.
+        """
+        try:
+            cur = self._conn_handler.cursor()
+            cur.copy_expert(copy_query, write_handle)
+        except Exception as e:
+            self._copy_error = e
+        finally:
+            write_handle.close()
+
+    def _build_casting_plan(self, header):
+        """
+        Return a list of (field name, cast function) tuples, one per column of the COPY output.
+        """
+        casting_plan = []
+        for field_name in header:
+            cast = self.field_mapping[self.field_types.get(field_name, 'unicode')]
+            casting_plan.append((field_name.decode('utf8'), cast))
+        return casting_plan
+
+    def _iter_copy(self):
+        """
+        Generator yielding a dict for each row of COPY output. The COPY runs in a separate
+        thread writing to a pipe, which is parsed as CSV as data arrives.
+        """
+        query_text = self._query_text()
+        copy_query = "COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '%s')" % (query_text, self.copy_null)
+        read_fd, write_fd = os.pipe()
+        read_handle = os.fdopen(read_fd, 'rb', 1 << 16)
+        copy_thread = threading.Thread(target=self._copy_to_handle,
+                                       args=(copy_query, os.fdopen(write_fd, 'wb', 1 << 16)))
+        copy_thread.daemon = True
+        copy_thread.start()
+        try:
+            copy_reader = csv.reader(read_handle)
+            casting_plan = self._build_casting_plan(next(copy_reader, []))
+            copy_null = self.copy_null
+            for row in copy_reader:
+                yield {field_name: None if value == copy_null else cast(value)
+                       for (field_name, cast), value in itertools.izip(casting_plan, row)}
+        finally:
+            # Closing the read end stops a COPY still writing into the pipe.
+            read_handle.close()
+        copy_thread.join()
+        if self._copy_error:
+            raise self._copy_error
+
     def __del__(self, exc_type=None, exc_val=None, exc_tb=None):
         """Close the db connection. Note: Will be Called Twice if a Context Manager is used."""
         if self._conn_handler:
-            self._conn_handler.close()
+            self._release_connection(self._conn_handler)
+            self._conn_handler = None
         if exc_type is not None:
             # Exception occurred
             return False  # Will raise the exception
@@ -441,5 +1974,156 @@ class ReaderPostgres(ReaderBaseClass):
 
     def __iter__(self):
         """Yield a single record back to the caller."""
-        for row in self._dict_cursor:
+        if self.copy:
+            records = self._iter_copy()
+        elif self.partition_column:
+            records = self._iter_partitions()
+        else:
+            records = self._dict_cursor
+        if self._watermark:
+            records = self._watermark.track(records)
+        for row in records:
             yield row
+
+
+class ReaderSQLite(ReaderBaseClass):
+    """
+    Reader class implementation executing a single query against a SQLite database.
+    Rows are streamed from the cursor using fetchmany(), ``arraysize`` rows at a time.
+    Text values are emitted as unicode.
+
+    Useful alongside ``ProcessorSQLiteWriter`` as a local staging store between layers,
+    or as an indexed lookup source for ``ProcessorCombineData_ValueHash``.
+
+    Required Config Parameters:
+
+    :param path: pathway to a SQLite database file.
+    :param query: Attribute containing either a file path to a sql statement,
+        ending in '.sql'; or a sql statement as a string.
+
+    Non-Required Config Parameters:
+
+    :param arraysize: number of rows fetched at a time. Defaults to 2000.
+
+    Example configuration file entry::
+
+            "StagedFacilities": {
+                "type": "ReaderSQLite",
+                "path": "/Users/matt/Projects/dataplunger/sample_output/staging.sqlite",
+                "query": "SELECT registry_id, primary_name FROM facilities WHERE state_code = 'WA'"
+            },
+    """
+
+    def __init__(self, path, query, arraysize=2000, **kwargs):
+        """
+        :param path: the pathway for a SQLite database file.
+        :param query: sql statement, or pathway to a file containing one.
+        :param arraysize: rows fetched at a time.
+        :param _conn_handler: sqlite3 connection.
+        :param _cursor: cursor with the result set of query.
+        """
+        self.path = path
+        self.query = query
+        self.arraysize = int(arraysize)
+        self._conn_handler = None
+        if not os.path.isfile(self.path):
+            raise IOError("SQLite database not found: %s" % self.path)
+        self._conn_handler = sqlite3.connect(self.path)
+        self._cursor = self._conn_handler.cursor()
+        self._cursor.arraysize = self.arraysize
+        self._cursor.execute(self._query_text())
+
+    def _query_text(self):
+        """Return the text of self.query, reading it from a file if given a file path."""
+        if os.path.isfile(self.query):
+            with open(self.query, 'r') as query_file_handle:
+                return query_file_handle.read()
+        return self.query
+
+    def __del__(self, exc_type=None, exc_val=None, exc_tb=None):
+        """Close the db connection. Note: Will be Called Twice if a Context Manager is used."""
+        if self._conn_handler:
+            self._conn_handler.close()
+            self._conn_handler = None
+        if exc_type is not None:
+            # Exception occurred
+            return False  # Will raise the exception
+        return True  # Everything's okay
+
+    def __iter__(self):
+        """Yield a single record back to the caller."""
+        field_names = [column[0] for column in self._cursor.description]
+        for rows in iter(self._cursor.fetchmany, []):
+            for row in rows:
+                yield dict(itertools.izip(field_names, row))
+
+
+class ReaderRecordFile(ReaderBaseClass):
+    """
+    Reader class implementation for record files, a typed binary format written by
+    ``ProcessorRecordFileWriter``. Values are emitted with the types they were written with,
+    without parsing or casting. See ``dataplunger.recordfile``.
+
+    Required Config Parameters:
+
+    :param path: pathway to a record file.
+
+    Non-Required Config Parameters:
+
+    :param fields: an array of field names to read. Only the columns of these fields are read
+        from disk. Defaults to all fields.
+    :param filters: an array of ``[field, operator, value]`` filters, where operator is one of
+        '=', '!=', '<', '<=', '>', '>=' or 'in'. Only records satisfying every filter are emitted.
+        Row groups whose minimum and maximum values exclude a match are skipped without being read.
+        Filter values must share the type of the field's values, e.g. "140" for a string SUMLEVEL.
+
+    Unlike ``ProcessorMatchValue``, which compares string representations, filters compare values
+    exactly. The ``ProcessorMatchValue`` entry ``{"matches": {"SUMLEVEL": ["140", "150"]}}``
+    is written as the filter ``["SUMLEVEL", "in", ["140", "150"]]``.
+
+    Example configuration file entry::
+
+            "StagedFacilities": {
+                "type": "ReaderRecordFile",
+                "path": "/Users/matt/Projects/dataplunger/sample_output/facilities.dprf",
+                "fields": ["REGISTRY_ID", "STATE_CODE"]
+            },
+
+    Example configuration file entry using filters::
+
+            "WATracts": {
+                "type": "ReaderRecordFile",
+                "path": "/Users/matt/Projects/dataplunger/sample_output/census_extract.dprf",
+                "filters": [["STUSAB", "=", "WA"], ["SUMLEVEL", "in", ["140", "150"]]]
+            },
+    """
+
+    def __init__(self, path, fields=None, filters=None, **kwargs):
+        """
+        :param path: the pathway for a record file.
+        :param fields: list of field names to read.
+        :param filters: list of (field, operator, value) filters.
+        :param _record_file: a recordfile.RecordFile instance.
+        """
+        self.path = path
+        self.fields = fields
+        self.filters = filters
+        self._record_file = None
+        self._record_file = recordfile.RecordFile(self.path)
+
+    def __del__(self, exc_type=None, exc_val=None, exc_tb=None):
+        """Close the record file. Note: Will be Called Twice if a Context Manager is used."""
+        if self._record_file:
+            self._record_file.close()
+            self._record_file = None
+        if exc_type is not None:
+            # Exception occurred
+            return False  # Will raise the exception
+        return True  # Everything's okay
+
+    def __iter__(self):
+        """
+        Generator returning a dict of field name: field value pairs for each record.
+        """
+        for record in self._record_file.iter_records(self.fields, filters=self.filters):
+            yield record
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: recordfile.py
+   :platform: Unix
+   :synopsis: A compact, typed, binary file format for records.
+
+.. moduleauthor:: Matt
+
+Record files store records in a columnar, binary layout, allowing records written by one
+layer to be read by another without re-parsing text or re-casting values.
+
+A record file is laid out as follows::
+
+    magic, version                  'DPRF', unsigned short
+    row group 1
+        column chunk 1              optionally compressed null mask and values
+        ...
+        column chunk n
+    ...
+    row group n
+    footer                          JSON encoded schema and row group index
+    footer length, magic            unsigned long long, 'DPRF'
+
+Records are buffered into row groups of ``row_group_size`` records. Each row group stores
+every field as a separate column chunk, with its own type and compression, allowing a reader
+to read only the fields it requires. The footer records the field names, declared field types,
+and the offset, length, type, codec and null count of each column chunk.
+
+For 'int', 'float', 'bool', 'string' and 'bytes' columns, the footer also records the minimum and
+maximum value of each column chunk. Filters given to ``RecordFile.iter_records()`` use these statistics
+to skip row groups that can not contain a matching record, without reading them. JSON can not hold
+byte strings, so the statistics of 'bytes' columns are stored decoded as Latin-1, mapping each byte
+to a single character.
+
+Supported column types:
+
+* 'int' - 64-bit signed integers.
+* 'float' - 64-bit floats.
+* 'bool' - booleans.
+* 'string' - unicode values, stored UTF8 encoded.
+* 'bytes' - byte strings.
+* 'object' - any other picklable value, e.g. a Fiona geometry or a datetime.
+
+Fields given a type are cast to that type when written. Types of other fields are inferred
+for each column chunk from its values. Any field may contain None values.
+
+Supported codecs are 'none', 'zlib' and 'bz2'.
+"""
+__author__ = 'mkenny'
+import bz2
+import cPickle
+import itertools
+import json
+import math
+import operator
+import os
+import struct
+import tempfile
+import zlib
+import numpy
+
+MAGIC = 'DPRF'
+VERSION = 1
+header_struct = struct.Struct('<4sH')
+trailer_struct = struct.Struct('<Q4s')
+# Length of the null mask preceding values within a column chunk.
+mask_length_struct = struct.Struct('<I')
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+# Field type names, including aliases used by reader field_types, mapped to column types.
+COLUMN_TYPES = {
+    'int': 'int',
+    'integer': 'int',
+    'float': 'float',
+    'bool': 'bool',
+    'boolean': 'bool',
+    'str': 'string',
+    'string': 'string',
+    'unicode': 'string',
+    'text': 'string',
+    'bytes': 'bytes',
+    'object': 'object'
+}
+
+CODECS = {
+    'none': (lambda data: data, lambda data: data),
+    'zlib': (zlib.compress, zlib.decompress),
+    'bz2': (bz2.compress, bz2.decompress)
+}
+
+# numpy data types of fixed-width column types.
+NUMPY_TYPES = {
+    'int': '<i8',
+    'float': '<f8',
+    'bool': '<u1'
+}
+
+
+# Filter operators, mapped to functions comparing a record value with a filter value.
+FILTER_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, filter_values: value in filter_values
+}
+
+# Column types for which minimum and maximum statistics are recorded.
+STATISTICS_TYPES = ('int', 'float', 'bool', 'string', 'bytes')
+
+
+def _cast_string(value):
+    """Return value as unicode, decoding byte strings as UTF8."""
+    if isinstance(value, str):
+        return value.decode('utf8')
+    return unicode(value)
+
+
+def _cast_bytes(value):
+    """Return value as a byte string, encoding unicode as UTF8."""
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+    return str(value)
+
+
+CASTS = {
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'string': _cast_string,
+    'bytes': _cast_bytes,
+    'object': lambda value: value
+}
+
+
+def infer_column_type(values):
+    """Return the column type of a list of values, ignoring None values."""
+    value_types = set(type(v) for v in values if v is not None)
+    if not value_types or value_types <= set([int, long]):
+        present = [v for v in values if v is not None]
+        if not present or (INT64_MIN <= min(present) and max(present) <= INT64_MAX):
+            return 'int'
+        return 'object'
+    if value_types == set([float]):
+        return 'float'
+    if value_types == set([bool]):
+        return 'bool'
+    if value_types == set([unicode]):
+        return 'string'
+    if value_types == set([str]):
+        return 'bytes'
+    return 'object'
+
+
+def encode_column(values, column_type, codec='none'):
+    """
+    Return a (chunk, null count) tuple, encoding a list of values of column_type as a column chunk.
+    """
+    if column_type == 'object':
+        # Pickled values retain None, so no null mask is required.
+        null_count = sum(1 for v in values if v is None)
+        mask = ''
+        data = cPickle.dumps(values, cPickle.HIGHEST_PROTOCOL)
+    else:
+        nulls = numpy.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        null_count = int(nulls.sum())
+        mask = numpy.packbits(nulls).tostring() if null_count else ''
+        if column_type in NUMPY_TYPES:
+            fill = False if column_type == 'bool' else 0
+            data = numpy.array([fill if v is None else v for v in values], dtype=NUMPY_TYPES[column_type]).tostring()
+        else:
+            if column_type == 'string':
+                encoded = [u'' if v is None else v for v in values]
+                encoded = [v.encode('utf8') for v in encoded]
+            else:
+                encoded = ['' if v is None else v for v in values]
+            lengths = numpy.fromiter(itertools.imap(len, encoded), dtype='<u4', count=len(encoded))
+            data = lengths.tostring() + ''.join(encoded)
+    chunk = mask_length_struct.pack(len(mask)) + mask + data
+    return CODECS[codec][0](chunk), null_count
+
+
+def decode_column(chunk, column_type, row_count, codec='none'):
+    """Return a list of values, decoded from a column chunk."""
+    chunk = CODECS[codec][1](chunk)
+    mask_length = mask_length_struct.unpack_from(chunk)[0]
+    data_start = mask_length_struct.size + mask_length
+    data = chunk[data_start:]
+    if column_type == 'object':
+        return cPickle.loads(data)
+    if column_type in NUMPY_TYPES:
+        values = numpy.frombuffer(data, dtype=NUMPY_TYPES[column_type], count=row_count)
+        if column_type == 'bool':
+            values = values.astype(bool)
+        values = values.tolist()
+    else:
+        lengths = numpy.frombuffer(data, dtype='<u4', count=row_count)
+        ends = numpy.cumsum(lengths, dtype=numpy.int64) + lengths.nbytes
+        starts = (ends - lengths).tolist()
+        values = [data[start:end] for start, end in itertools.izip(starts, ends.tolist())]
+        if column_type == 'string':
+            values = [v.decode('utf8') for v in values]
+    if mask_length:
+        mask = numpy.frombuffer(chunk, dtype=numpy.uint8, count=mask_length, offset=mask_length_struct.size)
+        for position in numpy.flatnonzero(numpy.unpackbits(mask)[:row_count]).tolist():
+            values[position] = None
+    return values
+
+
+def column_statistics(values, column_type):
+    """
+    Return a dict containing the minimum and maximum of a list of values, ignoring None
+    and NaN values. Returns an empty dict for other column types, or if no values remain.
+    """
+    if column_type not in STATISTICS_TYPES:
+        return {}
+    present = [v for v in values if v is not None]
+    if column_type == 'float':
+        present = [v for v in present if not math.isnan(v)]
+    if not present:
+        return {}
+    return {'min': min(present), 'max': max(present)}
+
+
+def row_group_may_match(row_group, filters, fields):
+    """
+    Return False if the column statistics of a row group show that no record within it
+    can satisfy every filter, otherwise True.
+
+    :param row_group: a row group entry from a record file footer.
+    :param filters: a list of (field, operator, value) tuples.
+    :param fields: the list of field names of the record file.
+    """
+    for field, filter_operator, filter_value in filters:
+        column = row_group['columns'][fields.index(field)]
+        if column['nulls'] == row_group['rows']:
+            # None never satisfies a filter.
+            return False
+        if 'min' not in column:
+            continue
+        column_min, column_max = column['min'], column['max']
+        if column['type'] == 'bytes':
+            column_min, column_max = column_min.encode('latin-1'), column_max.encode('latin-1')
+        if filter_operator == '=':
+            may_match = column_min <= filter_value <= column_max
+        elif filter_operator == 'in':
+            may_match = any(column_min <= v <= column_max for v in filter_value)
+        elif filter_operator == '!=':
+            may_match = not (column_min == column_max == filter_value)
+        elif filter_operator == '<':
+            may_match = column_min < filter_value
+        elif filter_operator == '<=':
+            may_match = column_min <= filter_value
+        elif filter_operator == '>':
+            may_match = column_max > filter_value
+        else:
+            may_match = column_max >= filter_value
+        if not may_match:
+            return False
+    return True
+
+
+class RecordFileWriter(object):
+    """
+    Write records to a record file.
+
+    Records are written to a temporary file beside ``path``, renamed to ``path`` once the footer
+    has been written by ``close()``. Leaving the context manager due to an exception calls
+    ``abort()`` instead, removing the temporary file, so that an incomplete record file is
+    never read as complete.
+
+    :param path: output path.
+    :param fields: list of field names to write.
+    :param field_types: dict mapping field names to column types. Values of typed fields are
+        cast when written. Types of other fields are inferred for each row group.
+    :param row_group_size: number of records per row group.
+    :param compression: either a codec name applied to all fields, or a dict mapping field
+        names to codec names. Defaults to 'none'.
+    """
+    def __init__(self, path, fields, field_types=None, row_group_size=65536, compression=None):
+        self.path = path
+        self.fields = list(fields)
+        self.field_types = {}
+        for field, field_type in (field_types or {}).iteritems():
+            if field_type not in COLUMN_TYPES:
+                raise ValueError("Record file field type %s not supported." % field_type)
+            self.field_types[field] = COLUMN_TYPES[field_type]
+        self.row_group_size = int(row_group_size)
+        if isinstance(compression, dict):
+            self.codecs = [compression.get(f, 'none') for f in self.fields]
+        else:
+            self.codecs = [compression or 'none'] * len(self.fields)
+        for codec in self.codecs:
+            if codec not in CODECS:
+                raise ValueError("Record file codec %s not supported." % codec)
+        self._casts = [CASTS[self.field_types[f]] if f in self.field_types else None for f in self.fields]
+        self._row_groups = []
+        self._rows = []
+        temp_fd, self._temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                                    prefix='.%s.' % os.path.basename(path))
+        # mkstemp creates files readable only by their owner, give the usual permissions instead.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self._temp_path, 0666 & ~umask)
+        self._file = os.fdopen(temp_fd, 'wb')
+        self._file.write(header_struct.pack(MAGIC, VERSION))
+
+    def write(self, record):
+        """Buffer a record, writing a row group once row_group_size records are buffered."""
+        self._rows.append(tuple(itertools.imap(record.get, self.fields)))
+        if len(self._rows) >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        """Write buffered records as a row group, recording its column chunks."""
+        if not self._rows:
+            return
+        row_group = {'rows': len(self._rows), 'columns': []}
+        for field, values, cast, codec in itertools.izip(self.fields, itertools.izip(*self._rows),
+                                                         self._casts, self.codecs):
+            if cast:
+                column_type = self.field_types[field]
+                values = [None if v is None else cast(v) for v in values]
+            else:
+                values = list(values)
+                column_type = infer_column_type(values)
+            chunk, null_count = encode_column(values, column_type, codec)
+            row_group['columns'].append(self._column_metadata(values, column_type, codec,
+                                                              self._file.tell(), len(chunk), null_count))
+            self._file.write(chunk)
+        self._row_groups.append(row_group)
+        self._rows = []
+
+    def _column_metadata(self, values, column_type, codec, offset, length, null_count):
+        """Return the footer entry describing a column chunk."""
+        metadata = {'type': column_type, 'codec': codec, 'offset': offset, 'length': length, 'nulls': null_count}
+        statistics = column_statistics(values, column_type)
+        if column_type == 'bytes' and statistics:
+            statistics = dict((k, v.decode('latin-1')) for k, v in statistics.iteritems())
+        metadata.update(statistics)
+        return metadata
+
+    def close(self):
+        """Write any buffered records and the footer, then close the file and move it into place."""
+        if self._file.closed:
+            return
+        try:
+            self._write_row_group()
+            footer = json.dumps({'fields': self.fields, 'field_types': self.field_types,
+                                 'row_groups': self._row_groups})
+            self._file.write(footer)
+            self._file.write(trailer_struct.pack(len(footer), MAGIC))
+            self._file.close()
+        except Exception:
+            self.abort()
+            raise
+        os.rename(self._temp_path, self.path)
+
+    def abort(self):
+        """Close and remove the incomplete file, leaving any existing file at path unchanged."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class RecordFile(object):
+    """
+    Read records from a record file.
+
+    :param path: path to a record file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        magic, version = header_struct.unpack(self._file.read(header_struct.size))
+        if magic != MAGIC:
+            raise IOError("%s is not a record file." % path)
+        if version != VERSION:
+            raise IOError("Record file version %s not supported." % version)
+        self._file.seek(-trailer_struct.size, os.SEEK_END)
+        footer_length, magic = trailer_struct.unpack(self._file.read(trailer_struct.size))
+        if magic != MAGIC:
+            raise IOError("Record file %s is incomplete." % path)
+        self._file.seek(-(trailer_struct.size + footer_length), os.SEEK_END)
+        footer = json.loads(self._file.read(footer_length))
+        self.fields = footer['fields']
+        self.field_types = footer['field_types']
+        self.row_groups = footer['row_groups']
+
+    def __len__(self):
+        return sum(row_group['rows'] for row_group in self.row_groups)
+
+    def read_column(self, row_group, field):
+        """Return a list of the values of field within a row group."""
+        column = row_group['columns'][self.fields.index(field)]
+        self._file.seek(column['offset'])
+        chunk = self._file.read(column['length'])
+        return decode_column(chunk, column['type'], row_group['rows'], column['codec'])
+
+    def _compile_filters(self, filters):
+        """Return a list of validated (field, operator, value) tuples."""
+        compiled_filters = []
+        for field, filter_operator, filter_value in filters or []:
+            if field not in self.fields:
+                raise KeyError("Filter field not found in record file: %s" % field)
+            if filter_operator not in FILTER_OPERATORS:
+                raise ValueError("Filter operator %s not supported." % filter_operator)
+            if filter_operator == 'in':
+                filter_value = list(filter_value)
+            compiled_filters.append((field, filter_operator, filter_value))
+        return compiled_filters
+
+    def _matching_positions(self, row_group, filters):
+        """Return a list of the positions of records within a row group satisfying every filter."""
+        positions = xrange(row_group['rows'])
+        for field, filter_operator, filter_value in filters:
+            compare = FILTER_OPERATORS[filter_operator]
+            values = self.read_column(row_group, field)
+            positions = [p for p in positions if values[p] is not None and compare(values[p], filter_value)]
+        return positions
+
+    def iter_records(self, fields=None, row_groups=None, filters=None):
+        """
+        Generator returning a dict for each record, containing the given fields,
+        defaulting to all fields. Only the column chunks of the given fields are read.
+
+        Filters are given as (field, operator, value) sequences, where operator is one of
+        '=', '!=', '<', '<=', '>', '>=' or 'in'. For 'in', value is a sequence of values.
+        Only records satisfying every filter are returned. None values never satisfy a filter.
+        Row groups whose column statistics exclude a match are skipped without being read,
+        the count of which is kept by ``skipped_row_groups``.
+
+        :param fields: list of field names to read.
+        :param row_groups: iterable of row groups to read, defaulting to all row groups.
+        :param filters: list of (field, operator, value) filters.
+        """
+        fields = list(fields or self.fields)
+        missing_fields = set(fields) - set(self.fields)
+        if missing_fields:
+            raise KeyError("Fields not found in record file: %s" % ', '.join(sorted(missing_fields)))
+        filters = self._compile_filters(filters)
+        self.skipped_row_groups = 0
+        for row_group in (self.row_groups if row_groups is None else row_groups):
+            if not filters:
+                columns = [self.read_column(row_group, field) for field in fields]
+                for row in itertools.izip(*columns):
+                    yield dict(itertools.izip(fields, row))
+                continue
+            if not row_group_may_match(row_group, filters, self.fields):
+                self.skipped_row_groups += 1
+                continue
+            positions = self._matching_positions(row_group, filters)
+            if not positions:
+                continue
+            columns = [operator.itemgetter(*positions)(self.read_column(row_group, field)) for field in fields]
+            if len(positions) == 1:
+                columns = [(value,) for value in columns]
+            for row in itertools.izip(*columns):
+                yield dict(itertools.izip(fields, row))
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def close(self):
+        self._file.close()
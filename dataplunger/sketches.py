@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: sketches.py
+   :platform: Unix
+   :synopsis: Bounded memory, approximate summaries of streams of values.
+
+.. moduleauthor:: Matt
+
+Sketches summarize a stream of values in a single pass, using a fixed amount of memory
+regardless of the number of values seen. Used by ``ProcessorProfile``.
+
+* ``HyperLogLog`` - estimates the number of distinct values.
+* ``KLLSketch`` - estimates quantiles, e.g. the median.
+* ``SpaceSaving`` - finds the most frequent values, and bounds their counts.
+"""
+__author__ = 'mkenny'
+import hashlib
+import heapq
+import math
+import random
+import struct
+
+hash_struct = struct.Struct('<Q')
+
+
+def hash64(value):
+    """
+    Return a 64-bit hash of a value, stable across processes.
+    Unicode values hash as their UTF8 encoding, other non-string values as their repr().
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf8')
+    elif not isinstance(value, str):
+        value = repr(value)
+    return hash_struct.unpack_from(hashlib.md5(value).digest())[0]
+
+
+class HyperLogLog(object):
+    """
+    Estimate the number of distinct values added, using the HyperLogLog algorithm.
+    The standard error of estimates is approximately 1.04 / sqrt(2 ** precision),
+    0.8% for the default precision of 14, using 2 ** precision bytes of memory.
+
+    :param precision: number of bits of each hash used to select a register, from 4 to 18.
+    """
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18.")
+        self.precision = precision
+        self.register_count = 1 << precision
+        self.registers = bytearray(self.register_count)
+        # Bits of each hash remaining after the register index.
+        self._rank_bits = 64 - precision
+        self._rank_mask = (1 << self._rank_bits) - 1
+
+    def add(self, value):
+        hashed = hash64(value)
+        index = hashed >> self._rank_bits
+        # Position of the leftmost 1 bit within the remaining bits.
+        rank = self._rank_bits - (hashed & self._rank_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Combine another HyperLogLog of the same precision into this one."""
+        if other.precision != self.precision:
+            raise ValueError("Only HyperLogLogs of the same precision can be merged.")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        """Return the estimated number of distinct values added."""
+        m = self.register_count
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zero_registers = self.registers.count('\x00')
+        if estimate <= 2.5 * m and zero_registers:
+            # Small range correction, using linear counting.
+            estimate = m * math.log(float(m) / zero_registers)
+        return int(round(estimate))
+
+
+class KLLSketch(object):
+    """
+    Estimate quantiles of the values added, using the KLL algorithm of Karnin, Lang and Liberty.
+
+    Values are held in a hierarchy of compactors. When a compactor fills, its values are
+    sorted and every other value is promoted to the next compactor, where each value represents
+    twice as many values. The rank error of estimates is approximately 1.7 / k, 0.85% for the
+    default k of 200, holding roughly 3 * k values.
+
+    :param k: size of the largest compactor, controlling accuracy and memory use.
+    :param seed: seed for the random choice of values promoted, for reproducible results.
+    """
+    def __init__(self, k=200, seed=None):
+        self.k = int(k)
+        self.count = 0
+        self._compactors = []
+        self._size = 0
+        self._max_size = 0
+        self._random = random.Random(seed)
+        self._grow()
+
+    def _capacity(self, level):
+        """Return the capacity of the compactor at a level. Lower levels are smaller."""
+        depth = len(self._compactors) - level - 1
+        return int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1
+
+    def _grow(self):
+        self._compactors.append([])
+        self._max_size = sum(self._capacity(level) for level in xrange(len(self._compactors)))
+
+    def _compress(self):
+        """Compact full compactors, until the sketch is within its maximum size."""
+        for level in xrange(len(self._compactors)):
+            compactor = self._compactors[level]
+            if len(compactor) < self._capacity(level):
+                continue
+            if level + 1 >= len(self._compactors):
+                self._grow()
+            compactor.sort()
+            # An odd value out remains, keeping the total weight exact.
+            remainder = [compactor.pop()] if len(compactor) % 2 else []
+            self._compactors[level + 1].extend(compactor[self._random.randint(0, 1)::2])
+            self._compactors[level] = remainder
+            self._size = sum(len(c) for c in self._compactors)
+            if self._size < self._max_size:
+                break
+
+    def add(self, value):
+        self._compactors[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def quantiles(self, fractions):
+        """
+        Return a list of estimated values at each fraction, from 0 (the minimum) to 1 (the maximum).
+        Returns None values if nothing has been added.
+        """
+        if not self.count:
+            return [None for fraction in fractions]
+        weighted = sorted((value, 1 << level) for level, compactor in enumerate(self._compactors)
+                          for value in compactor)
+        total_weight = sum(weight for value, weight in weighted)
+        results = []
+        for fraction in fractions:
+            target = fraction * total_weight
+            cumulative_weight = 0
+            result = weighted[-1][0]
+            for value, weight in weighted:
+                cumulative_weight += weight
+                if cumulative_weight >= target:
+                    result = value
+                    break
+            results.append(result)
+        return results
+
+
+class SpaceSaving(object):
+    """
+    Find the most frequent values added, using the Space-Saving algorithm of Metwally et al.
+
+    At most ``capacity`` values are monitored. When a new value arrives and all counters are in
+    use, the value with the smallest count is replaced, the new value inheriting its count as
+    an overestimate. Any value occurring more than count / capacity times is guaranteed to be
+    monitored, with a count overestimated by at most its recorded error.
+
+    The smallest counter is found using a heap, whose entries may lag behind their counter.
+    Lagging entries are corrected as they reach the top of the heap.
+
+    :param capacity: number of values monitored.
+    """
+    def __init__(self, capacity=100):
+        self.capacity = int(capacity)
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def add(self, value):
+        counts = self.counts
+        if value in counts:
+            counts[value] += 1
+            return
+        if len(counts) < self.capacity:
+            counts[value] = 1
+            self.errors[value] = 0
+            heapq.heappush(self._heap, (1, value))
+            return
+        # Replace the value with the smallest count, correcting lagging heap entries.
+        while True:
+            count, replaced = heapq.heappop(self._heap)
+            if counts[replaced] == count:
+                break
+            heapq.heappush(self._heap, (counts[replaced], replaced))
+        del counts[replaced]
+        del self.errors[replaced]
+        counts[value] = count + 1
+        self.errors[value] = count
+        heapq.heappush(self._heap, (count + 1, value))
+
+    def top(self, k):
+        """Return a list of up to k (value, count, error) tuples, most frequent first."""
+        top_values = heapq.nlargest(k, self.counts.iteritems(), key=lambda item: item[1])
+        return [(value, count, self.errors[value]) for value, count in top_values]
@@ -3,7 +3,12 @@
 __author__ = 'matt'
 __date__ = '3/2/14'
 from dataplunger.processors import *
+from datetime import datetime
+from decimal import Decimal
+import gzip
 import os
+import shutil
+import sqlite3
 import tempfile
 from nose.tools import raises
 
@@ -49,6 +54,81 @@ class TestProcessorCSVWriter(TestBase):
             contents = test_file_handle.readlines()
             assert contents == expected
 
+    def test_csvwriter_append(self):
+        """
+        Appending to a file should add records, without writing another header.
+        """
+        for i in range(2):
+            csv_writer = ProcessorCSVWriter(self.devnull, self.test_file[1], ['name', 'age', 'gender'], mode='append')
+            csv_writer.process(self.records)
+            del csv_writer
+        expected = ['name,age,gender\r\n', 'Matt,27,male\r\n', 'Matt,27,male\r\n']
+        with open(self.test_file[1], 'r') as test_file_handle:
+            assert test_file_handle.readlines() == expected
+
+    def test_csvwriter_batches(self):
+        """
+        Rows spanning several batches should be written in field order, with missing fields
+        written empty, extra fields ignored, and unicode encoded. Records pass through unmodified.
+        """
+        records = [{'name': u'M\xe4laren', 'age': 27, 'gender': u'male', 'extra': u'\xe4'},
+                   {'name': u'Matt', 'gender': u'male'},
+                   {'name': u'Matt', 'age': 28, 'gender': u'male'}]
+        csv_writer = ProcessorCSVWriter(None, self.test_file[1], ['name', 'age', 'gender'], batch_size=2)
+        assert [r for r in csv_writer.process(records)][0]['name'] == u'M\xe4laren'
+        del csv_writer
+        expected = ['name,age,gender\r\n', 'M\xc3\xa4laren,27,male\r\n', 'Matt,,male\r\n', 'Matt,28,male\r\n']
+        with open(self.test_file[1], 'r') as test_file_handle:
+            assert test_file_handle.readlines() == expected
+
+    def test_csvwriter_background(self):
+        """
+        Writing from a background thread should produce the same file.
+        """
+        records = [{'name': u'Matt', 'age': i, 'gender': u'male'} for i in range(10)]
+        csv_writer = ProcessorCSVWriter(None, self.test_file[1], ['name', 'age', 'gender'], batch_size=3,
+                                        background=True, queue_size=1)
+        assert len([r for r in csv_writer.process(records)]) == 10
+        del csv_writer
+        expected = ['name,age,gender\r\n'] + ['Matt,%s,male\r\n' % i for i in range(10)]
+        with open(self.test_file[1], 'r') as test_file_handle:
+            assert test_file_handle.readlines() == expected
+
+    def test_csvwriter_compressed(self):
+        """
+        Output blocks compressed in parallel should form a single valid gzip file.
+        """
+        records = [{'name': u'Matt', 'age': i, 'gender': u'male'} for i in range(1000)]
+        gzip_path = self.test_file[1] + '.gz'
+        try:
+            csv_writer = ProcessorCSVWriter(None, gzip_path, ['name', 'age', 'gender'], batch_size=100,
+                                            compression_processes=2)
+            csv_writer.file.block_size = 1024
+            assert len([r for r in csv_writer.process(records)]) == 1000
+            assert csv_writer.file.closed
+            expected = ['name,age,gender\r\n'] + ['Matt,%s,male\r\n' % i for i in range(1000)]
+            gzip_handle = gzip.open(gzip_path, 'rb')
+            assert gzip_handle.readlines() == expected
+            gzip_handle.close()
+        finally:
+            os.remove(gzip_path)
+
+    def test_csvwriter_compressed_bz2(self):
+        """
+        Output written as many bz2 streams should be read back in full by ReaderCSV.
+        """
+        records = [{'name': u'Matt', 'age': i, 'gender': u'male'} for i in range(5000)]
+        bz2_path = self.test_file[1] + '.bz2'
+        try:
+            csv_writer = ProcessorCSVWriter(None, bz2_path, ['name', 'age', 'gender'], compression_processes=1)
+            csv_writer.file.block_size = 1024
+            assert len([r for r in csv_writer.process(records)]) == 5000
+            for decompress in ('inline', 'thread'):
+                with readers.ReaderCSV(bz2_path, decompress=decompress) as t_reader:
+                    assert [r['age'] for r in t_reader] == [str(i) for i in range(5000)]
+        finally:
+            os.remove(bz2_path)
+
     def teardown(self):
         """
         Delete temp file if it still exists.
@@ -57,6 +137,34 @@ class TestProcessorCSVWriter(TestBase):
             os.remove(self.test_file[1])
 
 
+class TestBackgroundWriter(object):
+    """
+    Test BackgroundWriter.
+    """
+    def test_backgroundwriter(self):
+        """
+        Batches should be written in order.
+        """
+        written = []
+        writer = BackgroundWriter(written.extend, queue_size=1)
+        for i in range(5):
+            writer.put([i, i])
+        writer.close()
+        assert written == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+
+    @raises(ZeroDivisionError)
+    def test_backgroundwriter_error(self):
+        """
+        An error within the writer thread should be raised within the pipeline.
+        """
+        writer = BackgroundWriter(lambda batch: batch[0] / 0, queue_size=1)
+        try:
+            for i in range(5):
+                writer.put([i])
+        finally:
+            writer.close()
+
+
 class TestProcessorDevNull(object):
     """
     ProcessorDevNull should populate its record_constructor's records attribute
@@ -114,6 +222,69 @@ class TestProcessorSortRecords(object):
         assert sort_processor.process(self.records) == expected_list
 
 
+class TestProcessorAggregate(object):
+    """
+    Test ProcessorAggregate.
+    Records are grouped by state, computing every aggregate function.
+    """
+    def __init__(self):
+        self.records = [{'state': u'WA', 'county': u'King', 'total': 10},
+                        {'state': u'WA', 'county': u'King', 'total': 5},
+                        {'state': u'OR', 'county': u'Lane', 'total': None},
+                        {'state': u'WA', 'county': u'Pierce', 'total': 3},
+                        {'state': u'OR', 'county': u'Coos', 'total': 4}]
+        self.aggregates = {'records': ['count', '*'], 'totals': ['count', 'total'], 'sum': ['sum', 'total'],
+                           'min': ['min', 'total'], 'max': ['max', 'total'], 'mean': ['mean', 'total'],
+                           'first': ['first', 'county'], 'last': ['last', 'county'],
+                           'counties': ['distinct', 'county']}
+        self.expected = [
+            {'state': u'OR', 'records': 2, 'totals': 1, 'sum': 4, 'min': 4, 'max': 4, 'mean': 4.0,
+             'first': u'Lane', 'last': u'Coos', 'counties': 2},
+            {'state': u'WA', 'records': 3, 'totals': 3, 'sum': 18, 'min': 3, 'max': 10, 'mean': 6.0,
+             'first': u'King', 'last': u'Pierce', 'counties': 2}
+        ]
+
+    def test_aggregate_hash(self):
+        """
+        Hash aggregation should compute each aggregate per group.
+        """
+        p = ProcessorAggregate(None, ['state'], self.aggregates)
+        assert sorted(p.process(self.records), key=lambda r: r['state']) == self.expected
+
+    def test_aggregate_hash_spill(self):
+        """
+        Spilling partial groups to disk should not change the results, including first and last.
+        """
+        p = ProcessorAggregate(None, ['state'], self.aggregates, max_groups=1, spill_partitions=3)
+        assert sorted(p.process(self.records), key=lambda r: r['state']) == self.expected
+
+    def test_aggregate_hash_spill_null_partial(self):
+        """
+        A group spilled with a value, then again with only None values, should keep its min and max.
+        """
+        records = [{'k': 'a', 'v': 5}, {'k': 'b', 'v': 1}, {'k': 'a', 'v': None}, {'k': 'c', 'v': 2}]
+        aggregates = {'lo': ['min', 'v'], 'hi': ['max', 'v']}
+        p = ProcessorAggregate(None, ['k'], aggregates, max_groups=1, spill_partitions=3)
+        assert sorted(p.process(records), key=lambda r: r['k']) == [
+            {'k': 'a', 'lo': 5, 'hi': 5}, {'k': 'b', 'lo': 1, 'hi': 1}, {'k': 'c', 'lo': 2, 'hi': 2}]
+
+    def test_aggregate_sorted(self):
+        """
+        Sorted aggregation should emit groups in key order.
+        """
+        sorted_records = sorted(self.records, key=lambda r: r['state'])
+        p = ProcessorAggregate(None, ['state'], self.aggregates, mode='sorted')
+        assert [r for r in p.process(sorted_records)] == self.expected
+
+    @raises(ValueError)
+    def test_aggregate_sorted_unsorted_input(self):
+        """
+        Unsorted input in sorted mode should raise a ValueError.
+        """
+        p = ProcessorAggregate(None, ['state'], self.aggregates, mode='sorted')
+        [r for r in p.process(self.records)]
+
+
 class TestProcessorConcatenateFields(object):
     """
     Test ProcessorConcatenateFields.
@@ -230,6 +401,402 @@ class TestProcessorCombineData_ValueHash(TestBase):
         assert output == expected
 
 
+class TestProcessorSpatialJoin(object):
+    """
+    Test ProcessorSpatialJoin.
+    Joins lake names to points located using x and y fields.
+    """
+    def __init__(self):
+        self.readers = {
+            'Test_Lakes': {
+                'path': os.path.join(os.path.dirname(__file__), 'test_data/50m_lakes_utf8.shp'),
+                'type': 'ReaderSHP'
+            }
+        }
+
+    def test_processorspatialjoin(self):
+        """
+        Points within lakes gain the lake's name, one record per lake.
+        Points outside all lakes gain an empty name.
+        """
+        points = [
+            {'id': 1, 'LONGITUDE83': '17.0', 'LATITUDE83': '59.5'},
+            {'id': 2, 'LONGITUDE83': '0.0', 'LATITUDE83': '0.0'},
+            {'id': 3, 'LONGITUDE83': '-87.0', 'LATITUDE83': '42.0'}
+        ]
+        expected = [
+            {'id': 1, 'LONGITUDE83': '17.0', 'LATITUDE83': '59.5', 'name': u'M\xe4laren'},
+            {'id': 2, 'LONGITUDE83': '0.0', 'LATITUDE83': '0.0', 'name': ''},
+            {'id': 3, 'LONGITUDE83': '-87.0', 'LATITUDE83': '42.0', 'name': u'GREAT  LAKES'},
+            {'id': 3, 'LONGITUDE83': '-87.0', 'LATITUDE83': '42.0', 'name': u'Lake Michigan'}
+        ]
+        p = ProcessorSpatialJoin(None, 'Test_Lakes', self.readers, fields=['name'],
+                                 x_field='LONGITUDE83', y_field='LATITUDE83')
+        assert [r for r in p.process(points)] == expected
+
+    def test_processorspatialjoin_missing_geometry(self):
+        """
+        Points with blank coordinates or no geometry are emitted unmatched,
+        and polygons without a geometry are ignored.
+        """
+        p = ProcessorSpatialJoin(None, 'Test_Lakes', self.readers, x_field='LONGITUDE83', y_field='LATITUDE83')
+        p.new_reader_iterable = [
+            {'name': u'Empty', 'geometry': None},
+            {'name': u'Square', 'geometry': {'type': 'Polygon', 'coordinates': [[(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)]]}}
+        ]
+        points = [{'id': 1, 'LONGITUDE83': '1.0', 'LATITUDE83': '1.0'},
+                  {'id': 2, 'LONGITUDE83': '', 'LATITUDE83': ' '},
+                  {'id': 3, 'LONGITUDE83': None, 'LATITUDE83': '1.0'}]
+        assert [r['name'] for r in p.process(points)] == [u'Square', '', '']
+        p = ProcessorSpatialJoin(None, 'Test_Lakes', self.readers, fields=['name'])
+        assert [r['name'] for r in p.process([{'id': 4, 'geometry': None}])] == ['']
+
+
+class TestProcessorPartitionedCSVWriter(object):
+    """
+    Test ProcessorPartitionedCSVWriter.
+    Records are split into one file per value of a field.
+    """
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+
+    def test_partitionedcsvwriter(self):
+        """
+        Interleaved partitions should be written completely with a single open file,
+        each file having a single header. Records are passed on unchanged.
+        """
+        records = [{'name': u'Matt', 'age': 27, 'state': u'WA'},
+                   {'name': u'Ann', 'age': 30, 'state': u'OR'},
+                   {'name': u'Bob', 'age': 31, 'state': u'WA'},
+                   {'name': u'Cal', 'age': 32, 'state': u'OR'}]
+        p = ProcessorPartitionedCSVWriter(None, os.path.join(self.path, '{state}', 'people.csv'),
+                                          ['name', 'age'], max_open_files=1, batch_size=1)
+        assert [r for r in p.process(records)] == records
+        with open(os.path.join(self.path, 'WA', 'people.csv')) as file_handle:
+            assert file_handle.readlines() == ['name,age\r\n', 'Matt,27\r\n', 'Bob,31\r\n']
+        with open(os.path.join(self.path, 'OR', 'people.csv')) as file_handle:
+            assert file_handle.readlines() == ['name,age\r\n', 'Ann,30\r\n', 'Cal,32\r\n']
+
+    def test_partitionedcsvwriter_shared_path(self):
+        """
+        Values sanitized to the same path should share a single file handle, keeping rows in order.
+        """
+        records = [{'name': u'Matt', 'state': u'a/b'},
+                   {'name': u'Ann', 'state': u'a_b'},
+                   {'name': u'Bob', 'state': u'a/b'}]
+        p = ProcessorPartitionedCSVWriter(None, os.path.join(self.path, 'people_{state}.csv'), ['name'],
+                                          batch_size=1, buffer_size=1 << 16)
+        [r for r in p.process(records)]
+        assert os.listdir(self.path) == ['people_a_b.csv']
+        with open(os.path.join(self.path, 'people_a_b.csv')) as file_handle:
+            assert file_handle.readlines() == ['name\r\n', 'Matt\r\n', 'Ann\r\n', 'Bob\r\n']
+
+    @raises(ValueError)
+    def test_no_placeholders(self):
+        """
+        A path without placeholders should raise a ValueError.
+        """
+        ProcessorPartitionedCSVWriter(None, os.path.join(self.path, 'people.csv'), ['name'])
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+
+class DependentObjectsStandIn(psycopg2.InternalError):
+    """
+    Stands in for the error raised when dropping a table that views or foreign keys depend upon.
+    """
+    pgcode = psycopg2.errorcodes.DEPENDENT_OBJECTS_STILL_EXIST
+
+
+class WriterCursorStandIn(object):
+    """
+    Stands in for a psycopg2 cursor, recording statements and copied data on its connection.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query):
+        self.connection.statements.append(query)
+        if query in self.connection.failing_statements:
+            raise DependentObjectsStandIn("cannot drop table because other objects depend on it")
+
+    def copy_expert(self, query, file_handle):
+        self.connection.statements.append(query)
+        self.connection.copied.append(file_handle.read())
+
+
+class WriterConnectionStandIn(object):
+    """
+    Stands in for a psycopg2 connection.
+    """
+    def __init__(self):
+        self.statements = []
+        self.copied = []
+        self.failing_statements = []
+
+    def cursor(self):
+        return WriterCursorStandIn(self)
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+    def rollback(self):
+        self.statements.append('ROLLBACK')
+
+    def close(self):
+        pass
+
+
+class ProcessorPostgresWriterStandIn(ProcessorPostgresWriter):
+    """
+    ProcessorPostgresWriter using a WriterConnectionStandIn rather than connecting to Postgres.
+    """
+    def _open_connection(self, conn_params):
+        self.connection = WriterConnectionStandIn()
+        return self.connection
+
+
+class TestProcessorPostgresWriter(object):
+    """
+    Test ProcessorPostgresWriter.
+    """
+    def __init__(self):
+        self.records = [{'registry_id': 1, 'name': u'M\xe4laren', 'state': u'WA'},
+                        {'registry_id': 2, 'name': None, 'state': u'OR'},
+                        {'registry_id': 3, 'name': u'Lake, "Big"', 'state': u'ID'}]
+        self.kwargs = {'table': 'public.facilities', 'fields': ['registry_id', 'name'], 'database': 'test',
+                       'batch_size': 2}
+
+    def test_postgreswriter_append(self):
+        """
+        Records should be copied in batches within a single transaction, NULL values as \\N.
+        """
+        p = ProcessorPostgresWriterStandIn(None, **self.kwargs)
+        assert [r for r in p.process(self.records)] == self.records
+        copy_statement = 'COPY "public"."facilities" ("registry_id", "name") FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+        assert p.connection.statements == [copy_statement, copy_statement, 'COMMIT']
+        assert p.connection.copied == ['1,M\xc3\xa4laren\r\n2,\\N\r\n', '3,"Lake, ""Big"""\r\n']
+
+    def test_postgreswriter_truncate_staging(self):
+        """
+        A truncating load using a staging table should swap the staging table in place of the table.
+        """
+        p = ProcessorPostgresWriterStandIn(None, mode='truncate', staging=True, **self.kwargs)
+        [r for r in p.process(self.records)]
+        statements = p.connection.statements
+        assert statements[:2] == ['DROP TABLE IF EXISTS "public"."facilities_dp_staging"',
+                                  'CREATE TABLE "public"."facilities_dp_staging" (LIKE "public"."facilities" INCLUDING ALL)']
+        assert statements[2].startswith('COPY "public"."facilities_dp_staging"')
+        assert statements[-5:] == ['SAVEPOINT dp_swap',
+                                   'DROP TABLE "public"."facilities"',
+                                   'ALTER TABLE "public"."facilities_dp_staging" RENAME TO "facilities"',
+                                   'RELEASE SAVEPOINT dp_swap',
+                                   'COMMIT']
+
+    def test_postgreswriter_truncate_staging_dependents(self):
+        """
+        If the target table has dependents, or swap is false, the staged rows should be
+        inserted into the truncated target table instead.
+        """
+        insert = ('INSERT INTO "public"."facilities" ("registry_id", "name") '
+                  'SELECT "registry_id", "name" FROM "public"."facilities_dp_staging"')
+        fallback = ['TRUNCATE TABLE "public"."facilities"', insert,
+                    'DROP TABLE "public"."facilities_dp_staging"', 'COMMIT']
+        p = ProcessorPostgresWriterStandIn(None, mode='truncate', staging=True, **self.kwargs)
+        records_iterable = p.process(self.records)
+        next(records_iterable)
+        p.connection.failing_statements.append('DROP TABLE "public"."facilities"')
+        [r for r in records_iterable]
+        assert p.connection.statements[-7:] == ['SAVEPOINT dp_swap', 'DROP TABLE "public"."facilities"',
+                                                'ROLLBACK TO SAVEPOINT dp_swap'] + fallback
+        p = ProcessorPostgresWriterStandIn(None, mode='truncate', staging=True, swap=False, **self.kwargs)
+        [r for r in p.process(self.records)]
+        assert p.connection.statements[-4:] == fallback
+        assert 'SAVEPOINT dp_swap' not in p.connection.statements
+
+    def test_postgreswriter_upsert(self):
+        """
+        Each batch should be merged from a temporary table on the key fields.
+        """
+        p = ProcessorPostgresWriterStandIn(None, mode='upsert', key_fields=['registry_id'], **self.kwargs)
+        [r for r in p.process(self.records)]
+        merge = ('INSERT INTO "public"."facilities" ("registry_id", "name") SELECT "registry_id", "name" '
+                 'FROM "dp_upsert_dp_staging" ON CONFLICT ("registry_id") DO UPDATE SET "name" = EXCLUDED."name"')
+        statements = p.connection.statements
+        assert statements[0].startswith('CREATE TEMPORARY TABLE "dp_upsert_dp_staging"')
+        assert statements.count(merge) == 2
+        assert statements[-1] == 'COMMIT'
+
+    def test_postgreswriter_rollback(self):
+        """
+        An upstream error should roll back the load.
+        """
+        def failing_records():
+            yield self.records[0]
+            raise ValueError("Upstream failure")
+        p = ProcessorPostgresWriterStandIn(None, mode='truncate', **self.kwargs)
+        try:
+            [r for r in p.process(failing_records())]
+        except ValueError:
+            pass
+        assert p.connection.statements == ['TRUNCATE TABLE "public"."facilities"', 'ROLLBACK']
+
+    @raises(ValueError)
+    def test_postgreswriter_upsert_requires_keys(self):
+        """
+        Upserting without key fields should raise a ValueError.
+        """
+        ProcessorPostgresWriterStandIn(None, mode='upsert', **self.kwargs)
+
+
+class TestProcessorProfile(object):
+    """
+    Test ProcessorProfile.
+    Records pass through unchanged, and a JSON report is written once all records are read.
+    """
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+        self.report_path = os.path.join(self.path, 'profile.json')
+
+    def test_profile(self):
+        """
+        Counts, rates, distinct values, quantiles and frequent values should be reported per field.
+        """
+        records = [{'name': u'Matt' if i % 2 else u'', 'age': i} for i in range(100)]
+        records.append({'name': None})
+        p = ProcessorProfile(None, self.report_path, quantiles=[0, 0.5, 1], top_k=2, seed=1)
+        assert [r for r in p.process(records)] == records
+        with open(self.report_path) as file_handle:
+            report = json.load(file_handle)
+        assert report['records'] == 101
+        name, age = report['fields']['name'], report['fields']['age']
+        assert (name['count'], name['nulls'], name['empty'], name['distinct']) == (100, 1, 50, 2)
+        assert name['numeric'] == 0 and 'quantiles' not in name
+        assert sorted(v['value'] for v in name['top_values']) == [u'', u'Matt']
+        assert (age['nulls'], age['min'], age['max'], age['distinct']) == (1, 0, 99, 100)
+        assert age['quantiles'] == {'0': 0, '0.5': 49, '1': 99}
+
+    def test_profile_unserializable_values(self):
+        """
+        Values JSON can't represent, e.g. dates, decimals and non-UTF8 byte strings, should be reported as text.
+        """
+        records = [{'updated': datetime(2014, 5, 1), 'amount': Decimal('1.50'), 'code': '\xff'}]
+        p = ProcessorProfile(None, self.report_path)
+        [r for r in p.process(records)]
+        with open(self.report_path) as file_handle:
+            fields = json.load(file_handle)['fields']
+        assert fields['updated']['top_values'][0]['value'] == u'2014-05-01 00:00:00'
+        assert fields['amount']['top_values'][0]['value'] == u'1.50'
+        assert fields['code']['top_values'][0]['value'] == u'\ufffd'
+
+    def test_profile_fields(self):
+        """
+        Only listed fields should be profiled, counting records lacking them as nulls.
+        """
+        p = ProcessorProfile(None, self.report_path, fields=['age'])
+        [r for r in p.process([{'name': u'Matt', 'age': 27}, {'name': u'Ann'}])]
+        with open(self.report_path) as file_handle:
+            report = json.load(file_handle)
+        assert report['fields'].keys() == ['age']
+        assert report['fields']['age']['null_rate'] == 0.5
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+
+class TestProcessorRecordFileWriter(object):
+    """
+    Test ProcessorRecordFileWriter.
+    Records written should be read back by ReaderRecordFile with their types.
+    """
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+
+    def test_recordfilewriter(self):
+        """
+        String values cast on write should be read back as integers.
+        """
+        file_path = os.path.join(self.path, 'people.dprf')
+        records = [{'name': u'Matt', 'age': '27', 'gender': u'male'},
+                   {'name': u'Ann', 'age': '30', 'gender': u'female'}]
+        p = ProcessorRecordFileWriter(None, file_path, ['name', 'age'], field_types={'age': 'int'},
+                                      compression='zlib')
+        assert [r for r in p.process(records)] == records
+        with readers.ReaderRecordFile(file_path) as t_reader:
+            assert [r for r in t_reader] == [{'name': u'Matt', 'age': 27}, {'name': u'Ann', 'age': 30}]
+
+    def test_recordfilewriter_failure(self):
+        """
+        A failing upstream step, or stopping early, should not leave a partial record file.
+        """
+        file_path = os.path.join(self.path, 'people.dprf')
+
+        def failing_records():
+            yield {'name': u'Matt', 'age': 27}
+            raise ValueError("Upstream failure.")
+        p = ProcessorRecordFileWriter(None, file_path, ['name', 'age'], row_group_size=1)
+        try:
+            [r for r in p.process(failing_records())]
+        except ValueError:
+            pass
+        records_iterable = p.process([{'name': u'Matt', 'age': 27}, {'name': u'Ann', 'age': 30}])
+        next(records_iterable)
+        records_iterable.close()
+        assert os.listdir(self.path) == []
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+
+class TestProcessorReproject(object):
+    """
+    Test ProcessorReproject.
+    Geometries are transformed from EPSG:4326 to EPSG:3857 in batches.
+    """
+    def test_processorreproject(self):
+        """
+        Points and lines across multiple batches are transformed, and records without geometry pass through.
+        """
+        records = [
+            {'id': 1, 'geometry': {'type': 'Point', 'coordinates': (1.0, 3.0)}},
+            {'id': 2, 'geometry': None},
+            {'id': 3, 'geometry': {'type': 'LineString', 'coordinates': [(1.0, 3.0), (2.0, 4.0)]}}
+        ]
+        p = ProcessorReproject(None, src_crs='EPSG:4326', dst_crs='EPSG:3857', batch_size=2)
+        results = [r for r in p.process(records)]
+        assert [r['id'] for r in results] == [1, 2, 3]
+        assert results[1]['geometry'] is None
+        x, y = results[0]['geometry']['coordinates']
+        assert round(x, 2) == 111319.49 and round(y, 2) == 334111.17
+        line = results[2]['geometry']['coordinates']
+        assert [(round(x, 2), round(y, 2)) for x, y in line] == [(111319.49, 334111.17), (222638.98, 445640.11)]
+
+
+class TestProcessorSimplify(object):
+    """
+    Test ProcessorSimplify.
+    """
+    def test_processorsimplify(self):
+        """
+        Nearly collinear coordinates are removed, while polygon rings keep at least four coordinates.
+        """
+        records = [
+            {'geometry': {'type': 'LineString',
+                          'coordinates': [(0.0, 0.0), (1.0, 0.05), (2.0, 0.0), (3.0, 1.0)]}},
+            {'geometry': {'type': 'Polygon',
+                          'coordinates': [[(0.0, 0.0), (0.5, 0.01), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0), (0.0, 0.0)],
+                                          [(0.2, 0.2), (0.21, 0.2), (0.2, 0.21), (0.2, 0.2)]]}}
+        ]
+        expected = [
+            {'type': 'LineString', 'coordinates': [(0.0, 0.0), (2.0, 0.0), (3.0, 1.0)]},
+            {'type': 'Polygon', 'coordinates': [[(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0), (0.0, 0.0)],
+                                                [(0.2, 0.2), (0.21, 0.2), (0.2, 0.21), (0.2, 0.2)]]}
+        ]
+        p = ProcessorSimplify(None, tolerance=0.1)
+        assert [r['geometry'] for r in p.process(records)] == expected
+
+
 class TestProcessorMatchValue(TestBase):
     """
     Test different combinations of ProcessorMatchValue.
@@ -357,6 +924,54 @@ class TestProcessorChangeCase(TestBase):
             pass
 
 
+class TestProcessorSQLiteWriter(object):
+    """
+    Test ProcessorSQLiteWriter.
+    """
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.path, 'staging.sqlite')
+        self.records = [{'name': 'Matt', 'age': 27, 'gender': u'male'},
+                        {'name': u'M\xe4laren', 'age': None, 'gender': u'n/a'},
+                        {'name': 'Ann', 'age': 30, 'gender': u'female'}]
+
+    def test_sqlitewriter(self):
+        """
+        Records should be inserted in batches, indexes created, and WAL journaling used.
+        Appending adds records to the existing table.
+        """
+        for mode in ('write', 'append'):
+            p = ProcessorSQLiteWriter(None, self.db_path, 'people', ['name', 'age'], mode=mode,
+                                      field_types={'age': 'int'}, indexes=[['name']], batch_size=2)
+            assert [r for r in p.process(self.records)] == self.records
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('SELECT name, age FROM people ORDER BY rowid').fetchall()
+        assert rows == [(u'Matt', 27), (u'M\xe4laren', None), (u'Ann', 30)] * 2
+        index_names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        assert index_names == ['idx_people_name']
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        conn.close()
+
+    def test_sqlitewriter_rollback(self):
+        """
+        An upstream error should leave no partially loaded table.
+        """
+        def failing_records():
+            yield self.records[0]
+            raise ValueError("Upstream failure")
+        p = ProcessorSQLiteWriter(None, self.db_path, 'people', ['name', 'age'])
+        try:
+            [r for r in p.process(failing_records())]
+        except ValueError:
+            pass
+        conn = sqlite3.connect(self.db_path)
+        assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'people'").fetchone()[0] == 0
+        conn.close()
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+
 class TestProcessorTruncateFields(TestBase):
     """
     Test ProcessorTruncateFields.
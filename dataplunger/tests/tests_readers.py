@@ -8,8 +8,17 @@ Test for Reader class implementations.
 """
 from nose.tools import raises
 from dataplunger.readers import *
+from dataplunger.processors import ProcessorPostgresWriter
+import bz2
+import gzip
+import itertools
+import json
 import tempfile
 import os
+import shutil
+import sqlite3
+import warnings
+import zipfile
 
 
 class TestReaderCensus_Success(object):
@@ -156,6 +165,291 @@ class TestReaderCensus_BadEstGeogFiles(object):
             os.rmdir(self.kwargs['path'])
 
 
+class TestReaderCensus_MultipleTables(object):
+    """
+    Test that a single census reader merges tables across sequence files.
+    """
+    def __init__(self):
+        """
+        Create connection info for two tables in separate sequence files.
+        """
+        self.kwargs = {'tables': [{'sequence': 1, 'starting_position': 7, 'fields': {'Pop': 1}},
+                                  {'sequence': 2, 'starting_position': 7, 'fields': {'Total': 1, 'Male': 2}}],
+                       'delimiter': ',',
+                       'type': 'ReaderCensus'}
+
+    def setup(self):
+        """
+        Create temporary directory and populate with a geography file and two estimate files.
+        The second estimate file is missing LOGRECNO 0000002.
+        """
+        self.kwargs['path'] = tempfile.mkdtemp()
+        contents = {
+            'g20125wa.csv': ['ACSSF,WA,140,00,0000001\n',
+                             'ACSSF,WA,140,00,0000002\n',
+                             'ACSSF,WA,150,00,0000003\n'],
+            'e20125wa0001000.txt': ['ACSSF,2012e5,wa,000,0001,0000001,10\n',
+                                    'ACSSF,2012e5,wa,000,0001,0000002,20\n',
+                                    'ACSSF,2012e5,wa,000,0001,0000003,30\n'],
+            'e20125wa0002000.txt': ['ACSSF,2012e5,wa,000,0002,0000001,9,4\n',
+                                    'ACSSF,2012e5,wa,000,0002,0000003,29,15\n'],
+            'm20125wa0001000.txt': ['ACSSF,2012m5,wa,000,0001,0000001,1\n',
+                                    'ACSSF,2012m5,wa,000,0001,0000002,2\n',
+                                    'ACSSF,2012m5,wa,000,0001,0000003,3\n'],
+            'm20125wa0002000.txt': ['ACSSF,2012m5,wa,000,0002,0000001,5,6\n',
+                                    'ACSSF,2012m5,wa,000,0002,0000003,7,8\n']
+        }
+        for file_name, lines in contents.iteritems():
+            with open(os.path.join(self.kwargs['path'], file_name), 'w') as file_handle:
+                file_handle.writelines(lines)
+
+    def test_readercensus_multiple_tables(self):
+        """
+        One record should be emitted per LOGRECNO, with fields from both sequences.
+        Fields from a sequence file missing the LOGRECNO should be None.
+        """
+        expected = [
+            {'Pop': 10, 'Total': 9, 'Male': 4, 'FILEID': 'ACSSF', 'STUSAB': 'WA',
+             'SUMLEVEL': '140', 'COMPONENT': '00', 'LOGRECNO': '0000001'},
+            {'Pop': 20, 'Total': None, 'Male': None, 'FILEID': 'ACSSF', 'STUSAB': 'WA',
+             'SUMLEVEL': '140', 'COMPONENT': '00', 'LOGRECNO': '0000002'},
+            {'Pop': 30, 'Total': 29, 'Male': 15, 'FILEID': 'ACSSF', 'STUSAB': 'WA',
+             'SUMLEVEL': '150', 'COMPONENT': '00', 'LOGRECNO': '0000003'}
+        ]
+        with ReaderCensus(**self.kwargs) as t_reader:
+            assert [record for record in t_reader] == expected
+
+    def test_readercensus_margins_of_error(self):
+        """
+        Margin of error values should be emitted alongside their estimates.
+        """
+        with ReaderCensus(margins_of_error=True, **self.kwargs) as t_reader:
+            records = [record for record in t_reader]
+        assert records[0]['Male'] == 4
+        assert records[0]['Male_moe'] == 6
+        assert records[1]['Pop_moe'] == 2
+        assert records[1]['Total_moe'] is None
+        assert records[2]['Total_moe'] == 7
+
+    def test_readercensus_compressed(self):
+        """
+        Gzip and bz2 compressed geography and estimate files should be read
+        identically to uncompressed files, decompressing in a background thread.
+        """
+        with ReaderCensus(**self.kwargs) as t_reader:
+            expected = [record for record in t_reader]
+        for i, file_name in enumerate(sorted(os.listdir(self.kwargs['path']))):
+            file_path = os.path.join(self.kwargs['path'], file_name)
+            with open(file_path, 'rb') as file_handle:
+                contents = file_handle.read()
+            compressed_open = gzip.open if i % 2 else bz2.BZ2File
+            compressed_handle = compressed_open(file_path + ('.gz' if i % 2 else '.bz2'), 'wb')
+            compressed_handle.write(contents)
+            compressed_handle.close()
+            os.remove(file_path)
+        with ReaderCensus(decompress='thread', **self.kwargs) as t_reader:
+            assert [record for record in t_reader] == expected
+
+    def test_readercensus_mmap(self):
+        """
+        Memory-mapped scanning should emit the same records as the csv module.
+        """
+        with ReaderCensus(margins_of_error=True, **self.kwargs) as t_reader:
+            expected = [record for record in t_reader]
+        with ReaderCensus(margins_of_error=True, scan_mode='mmap', **self.kwargs) as t_reader:
+            assert [record for record in t_reader] == expected
+
+    def test_readercensus_mmap_compressed(self):
+        """
+        In mmap mode, compressed estimate files should be parsed as CSV, alongside memory-mapped margin files.
+        """
+        with ReaderCensus(margins_of_error=True, **self.kwargs) as t_reader:
+            expected = [record for record in t_reader]
+        for file_name in os.listdir(self.kwargs['path']):
+            if file_name.startswith('e'):
+                file_path = os.path.join(self.kwargs['path'], file_name)
+                with open(file_path, 'rb') as file_handle:
+                    contents = file_handle.read()
+                compressed_handle = gzip.open(file_path + '.gz', 'wb')
+                compressed_handle.write(contents)
+                compressed_handle.close()
+                os.remove(file_path)
+        with ReaderCensus(margins_of_error=True, scan_mode='mmap', **self.kwargs) as t_reader:
+            assert not isinstance(t_reader._estimate_readers.values()[0], DelimitedFileScanner)
+            assert isinstance(t_reader._margin_readers.values()[0], DelimitedFileScanner)
+            assert [record for record in t_reader] == expected
+
+    def test_readercensus_geography_index_unwritable(self):
+        """
+        A geography index that can't be written should fall back to parsing the geography file.
+        """
+        with ReaderCensus(**self.kwargs) as t_reader:
+            expected = [record for record in t_reader]
+        unwritable_dir = os.path.join(self.kwargs['path'], 'g20125wa.csv', 'indexes')
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter('always')
+            with ReaderCensus(geography_index=True, geography_index_dir=unwritable_dir, **self.kwargs) as t_reader:
+                assert isinstance(t_reader._geography_records, dict)
+                assert [record for record in t_reader] == expected
+        assert [w.category for w in caught_warnings] == [RuntimeWarning]
+
+    @raises(ValueError)
+    def test_readercensus_unsorted(self):
+        """
+        An estimate file not sorted by LOGRECNO should raise a ValueError, rather than
+        emitting partial records.
+        """
+        with open(os.path.join(self.kwargs['path'], 'e20125wa0002000.txt'), 'w') as file_handle:
+            file_handle.writelines(['ACSSF,2012e5,wa,000,0002,0000003,29,15\n',
+                                    'ACSSF,2012e5,wa,000,0002,0000001,9,4\n'])
+        with ReaderCensus(**self.kwargs) as t_reader:
+            [record for record in t_reader]
+
+    @raises(ValueError)
+    def test_duplicate_field_names(self):
+        """
+        Field names shared between tables should raise a ValueError.
+        """
+        self.kwargs['tables'][1]['fields']['Pop'] = 3
+        ReaderCensus(**self.kwargs)
+
+    def teardown(self):
+        """
+        Remove contents of temp directory and delete.
+        """
+        for file_name in os.listdir(self.kwargs['path']):
+            os.remove(os.path.join(self.kwargs['path'], file_name))
+        os.rmdir(self.kwargs['path'])
+
+
+class TestCensusGeographyIndex(object):
+    """
+    Test the memory-mapped geography index used by ReaderCensus.
+    """
+    def setup(self):
+        """
+        Create a temporary geography file with a gap in its LOGRECNO values.
+        """
+        self.path = tempfile.mkdtemp()
+        self.geography_path = os.path.join(self.path, 'g20125wa.csv')
+        with open(self.geography_path, 'w') as file_handle:
+            file_handle.writelines(['ACSSF,WA,140,00,0000003,,,53\n',
+                                    'ACSSF,WA,040,00,0000001,,,53\n',
+                                    'ACSSF,WA,150,00,0000007,,,53\n'])
+
+    def test_lookup(self):
+        """
+        Lookups should match the records parsed from the geography file.
+        """
+        index = CensusGeographyIndex(self.geography_path)
+        assert len(index) == 3
+        assert index['0000007'] == {'FILEID': 'ACSSF', 'STUSAB': 'WA', 'SUMLEVEL': '150',
+                                    'COMPONENT': '00', 'LOGRECNO': '0000007'}
+        assert '0000001' in index
+        assert '0000002' not in index
+        index.close()
+
+    def test_index_dir(self):
+        """
+        An index_dir should hold the index, rather than the geography file's directory.
+        """
+        index_dir = os.path.join(self.path, 'indexes')
+        index = CensusGeographyIndex(self.geography_path, index_dir=index_dir)
+        assert index['0000001']['SUMLEVEL'] == '040'
+        index.close()
+        assert sorted(os.listdir(self.path)) == ['g20125wa.csv', 'indexes']
+        assert len(os.listdir(index_dir)) == 1
+        shutil.rmtree(index_dir)
+
+    @raises(GeographyIndexError)
+    def test_index_dir_unwritable(self):
+        """
+        An index_dir that can't be created should raise a GeographyIndexError.
+        """
+        CensusGeographyIndex(self.geography_path, index_dir=os.path.join(self.geography_path, 'indexes'))
+
+    @raises(OSError)
+    def test_missing_geography_file(self):
+        """
+        A missing geography file should raise an OSError, rather than a GeographyIndexError.
+        """
+        CensusGeographyIndex(os.path.join(self.path, 'g20125or.csv'))
+
+    def test_rebuild_on_change(self):
+        """
+        The index should be rebuilt once the geography file changes.
+        """
+        CensusGeographyIndex(self.geography_path).close()
+        with open(self.geography_path, 'a') as file_handle:
+            file_handle.write('ACSSF,WA,140,00,0000008,,,53\n')
+        index = CensusGeographyIndex(self.geography_path)
+        assert index['0000008']['SUMLEVEL'] == '140'
+        index.close()
+
+    def teardown(self):
+        """
+        Remove contents of temp directory and delete.
+        """
+        for file_name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, file_name))
+        os.rmdir(self.path)
+
+
+class TestReaderCensusMultiState(object):
+    """
+    Test reading many census directories with a pool of worker processes.
+    """
+    def setup(self):
+        """
+        Create temporary directories for four states, each with a geography and estimate file.
+        """
+        self.path = tempfile.mkdtemp()
+        for state_dir, stusab, total in [('Washington', 'wa', 10), ('Oregon', 'or', 20),
+                                         ('West_Virginia', 'wv', 30), ('Wisconsin', 'wi', 40)]:
+            os.mkdir(os.path.join(self.path, state_dir))
+            with open(os.path.join(self.path, state_dir, 'g20125%s.csv' % stusab), 'w') as file_handle:
+                file_handle.write('ACSSF,%s,140,00,0000001\n' % stusab.upper())
+            with open(os.path.join(self.path, state_dir, 'e20125%s0002000.txt' % stusab), 'w') as file_handle:
+                file_handle.write('ACSSF,2012e5,%s,000,0002,0000001,%s\n' % (stusab, total))
+        self.kwargs = {'paths': os.path.join(self.path, '*'),
+                       'sequence': 2,
+                       'starting_position': 7,
+                       'fields': {'Total': 1},
+                       'type': 'ReaderCensusMultiState'}
+
+    def test_readercensusmultistate_ordered(self):
+        """
+        Records should be emitted in STUSAB order, each carrying its state.
+        """
+        with ReaderCensusMultiState(processes=2, ordered=True, chunk_size=1, queue_size=1,
+                                    **self.kwargs) as t_reader:
+            assert [t_reader._directory_stusab(p) for p in sorted(t_reader.paths)] == ['OR', 'WA', 'WV', 'WI']
+            records = [(r['STUSAB'], r['Total']) for r in t_reader]
+        assert records == [('OR', 20), ('WA', 10), ('WI', 40), ('WV', 30)]
+
+    def test_readercensusmultistate_unordered(self):
+        """
+        Unordered reads should emit every state's records as they become available.
+        """
+        with ReaderCensusMultiState(processes=2, chunk_size=1, **self.kwargs) as t_reader:
+            records = sorted((r['STUSAB'], r['Total']) for r in t_reader)
+        assert records == [('OR', 20), ('WA', 10), ('WI', 40), ('WV', 30)]
+
+    def test_readercensusmultistate_single_process(self):
+        """
+        A single process should read every directory within the current process.
+        """
+        with ReaderCensusMultiState(processes=1, **self.kwargs) as t_reader:
+            records = sorted((r['STUSAB'], r['Total']) for r in t_reader)
+        assert records == [('OR', 20), ('WA', 10), ('WI', 40), ('WV', 30)]
+
+    def teardown(self):
+        """
+        Remove temp directories.
+        """
+        shutil.rmtree(self.path)
+
+
 class TestReaderCSV(object):
     """
     Test class for the csv reader.
@@ -213,6 +507,119 @@ class TestReaderCSV(object):
                 assert record == expected
                 break
 
+class TestReaderCSV_Compressed(object):
+    """
+    Test streaming reads of compressed CSV files.
+    """
+    def setup(self):
+        """
+        Write the election CSV to gzip, bz2 and zip files within a temp directory.
+        """
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(os.path.dirname(__file__), "test_data/election_2010_kc.csv"), 'rb') as file_handle:
+            self.contents = file_handle.read()
+        gzip_handle = gzip.open(os.path.join(self.path, 'election.csv.gz'), 'wb')
+        gzip_handle.write(self.contents)
+        gzip_handle.close()
+        bz2_handle = bz2.BZ2File(os.path.join(self.path, 'election.csv.bz2'), 'wb')
+        bz2_handle.write(self.contents)
+        bz2_handle.close()
+        with zipfile.ZipFile(os.path.join(self.path, 'election.zip'), 'w', zipfile.ZIP_DEFLATED) as zip_handle:
+            zip_handle.writestr('election.csv', self.contents)
+            zip_handle.writestr('README.txt', 'Not a CSV.')
+
+    def test_readercsv_compressed(self):
+        """
+        Each compressed file and decompression mode should emit the same records.
+        """
+        with open(os.path.join(self.path, 'election.csv'), 'wb') as file_handle:
+            file_handle.write(self.contents)
+        with ReaderCSV(os.path.join(self.path, 'election.csv')) as t_reader:
+            expected = [record for record in t_reader]
+        assert len(expected) == 4
+        for file_name in ('election.csv.gz', 'election.csv.bz2', 'election.zip'):
+            for decompress in ('inline', 'thread', 'process'):
+                with ReaderCSV(os.path.join(self.path, file_name), member='election.csv',
+                               decompress=decompress) as t_reader:
+                    assert [record for record in t_reader] == expected
+
+    def test_readercsv_compressed_early_close(self):
+        """
+        Closing a reader before all records are read should stop decompression.
+        """
+        for decompress in ('thread', 'process'):
+            t_reader = ReaderCSV(os.path.join(self.path, 'election.csv.gz'), decompress=decompress)
+            assert next(iter(t_reader))['Precinct'] == 'KELLY'
+            t_reader.__del__()
+
+    @raises(ValueError)
+    def test_readercsv_zip_member_required(self):
+        """
+        A zip archive with many members requires a member name.
+        """
+        ReaderCSV(os.path.join(self.path, 'election.zip'))
+
+    def teardown(self):
+        """
+        Remove temp directory.
+        """
+        shutil.rmtree(self.path)
+
+
+class TestReaderCSV_Watermark(object):
+    """
+    Test incremental reads of a CSV file using a watermark column.
+    """
+    def setup(self):
+        """
+        Create a temporary CSV file and state file path.
+        """
+        self.path = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.path, 'facilities.csv')
+        self.kwargs = {'watermark_column': 'UPDATE_DATE',
+                       'watermark_state': os.path.join(self.path, 'watermarks.json'),
+                       'watermark_type': 'date',
+                       'watermark_format': '%d-%b-%y',
+                       'watermark_key': 'FacilityLayer/Facilities'}
+        with open(self.csv_path, 'w') as file_handle:
+            file_handle.writelines(['REGISTRY_ID,UPDATE_DATE\n', '1,05-MAR-12\n', '2,20-JAN-13\n'])
+
+    def test_readercsv_watermark(self):
+        """
+        A second run should only emit records updated since the first.
+        """
+        with ReaderCSV(self.csv_path, **self.kwargs) as t_reader:
+            assert [r['REGISTRY_ID'] for r in t_reader] == ['1', '2']
+        commit_watermarks()
+        with open(self.csv_path, 'a') as file_handle:
+            file_handle.writelines(['3,01-FEB-13\n', '1,06-FEB-13\n', '4,\n'])
+        with ReaderCSV(self.csv_path, **self.kwargs) as t_reader:
+            assert [r['REGISTRY_ID'] for r in t_reader] == ['3', '1']
+        commit_watermarks()
+        with open(self.kwargs['watermark_state']) as state_file_handle:
+            assert json.load(state_file_handle) == {'FacilityLayer/Facilities': '06-FEB-13'}
+
+    def test_readercsv_watermark_discarded(self):
+        """
+        A mark should not be saved until committed, and a discarded mark should leave
+        the same records to be read by the next run.
+        """
+        with ReaderCSV(self.csv_path, **self.kwargs) as t_reader:
+            assert [r['REGISTRY_ID'] for r in t_reader] == ['1', '2']
+        assert not os.path.exists(self.kwargs['watermark_state'])
+        discard_watermarks()
+        commit_watermarks()
+        with ReaderCSV(self.csv_path, **self.kwargs) as t_reader:
+            assert [r['REGISTRY_ID'] for r in t_reader] == ['1', '2']
+        discard_watermarks()
+
+    def teardown(self):
+        """
+        Remove temp directory.
+        """
+        shutil.rmtree(self.path)
+
+
 class TestReaderSHP(object):
     """
     Test class for the SHP reader.
@@ -244,3 +651,326 @@ class TestReaderSHP(object):
             for record in t_reader:
                 assert record == expected
                 break
+
+    def test_readershp_pushdown(self):
+        """
+        Given a bbox, no geometry and a property list, only intersecting features
+        should be read, containing selected properties and no geometry.
+        """
+        expected = {u'scalerank': 2,
+                    u'name': u'Mälaren',
+                    'fiona_id': '0',
+                    'fiona_type': 'Feature'}
+        with ReaderSHP(self.path, bbox=[10, 50, 20, 60], geometry=False, properties=['name', 'scalerank']) as t_reader:
+            records = [record for record in t_reader]
+        assert records[0] == expected
+        assert [r['fiona_id'] for r in records] == ['0', '17', '55', '56', '146', '170']
+
+    def test_readershp_parallel(self):
+        """
+        Records decoded by worker processes should match those read serially.
+        """
+        with ReaderSHP(self.path) as t_reader:
+            expected = [record for record in t_reader]
+        with ReaderSHP(self.path, processes=2, chunk_size=50) as t_reader:
+            assert [record for record in t_reader] == expected
+        with ReaderSHP(self.path, bbox=[10, 50, 20, 60], processes=2, ordered=False, chunk_size=2) as t_reader:
+            assert sorted(int(r['fiona_id']) for r in t_reader) == [0, 17, 55, 56, 146, 170]
+
+
+class TestReaderSQLite(object):
+    """
+    Test class for the SQLite reader.
+    """
+    def setup(self):
+        """
+        Create a temporary SQLite database containing a people table.
+        """
+        self.path = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.path, 'staging.sqlite')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE people (name TEXT, age INTEGER)')
+        conn.executemany('INSERT INTO people VALUES (?, ?)', [(u'Matt', 27), (u'Ann', 30), (u'Bob', None)])
+        conn.commit()
+        conn.close()
+
+    def test_readersqlite(self):
+        """
+        Rows should be emitted as dictionaries, across several fetchmany() calls.
+        """
+        expected = [{'name': u'Matt', 'age': 27}, {'name': u'Ann', 'age': 30}, {'name': u'Bob', 'age': None}]
+        with ReaderSQLite(self.db_path, 'SELECT name, age FROM people ORDER BY rowid', arraysize=2) as t_reader:
+            assert [record for record in t_reader] == expected
+
+    @raises(IOError)
+    def test_readersqlite_missing_database(self):
+        """
+        A missing database file should raise an IOError, rather than creating an empty database.
+        """
+        ReaderSQLite(os.path.join(self.path, 'missing.sqlite'), 'SELECT 1')
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+
+class CursorStandIn(object):
+    """
+    Stand-in for a psycopg2 cursor, recording executed queries.
+    Rows are returned as tuples of values, unless the cursor is a RealDictCursor.
+    """
+    def __init__(self, connection, name=None, cursor_factory=None):
+        self.connection = connection
+        self.name = name
+        self.cursor_factory = cursor_factory
+        self.itersize = None
+        self.results = iter([])
+
+    def execute(self, query, vars=None):
+        if vars is not None:
+            # Raise on unescaped '%' characters, as psycopg2 does when formatting parameters.
+            query % tuple(vars)
+        self.connection.executed.append((query, vars))
+        rows = self.connection.select(query, vars)
+        if self.cursor_factory is not RealDictCursor:
+            rows = [tuple(row.values()) for row in rows]
+        self.results = iter(rows)
+
+    def copy_expert(self, sql, file):
+        self.connection.executed.append((sql, None))
+        file.write(self.connection.copy_data)
+
+    def mogrify(self, query, vars):
+        return query % tuple("'%s'" % v for v in vars)
+
+    def fetchone(self):
+        return next(self.results, None)
+
+    def fetchmany(self, size):
+        return list(itertools.islice(self.results, size))
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return self.results
+
+
+class ConnectionStandIn(object):
+    """
+    Stand-in for a psycopg2 connection, returning a fixed list of rows.
+    """
+    def __init__(self, rows, copy_data=''):
+        self.rows = rows
+        self.copy_data = copy_data
+        self.cursors = []
+        self.executed = []
+        self.closed = False
+
+    def select(self, query, vars):
+        return self.rows
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.cursors.append(CursorStandIn(self, name, cursor_factory))
+        return self.cursors[-1]
+
+    def commit(self):
+        self.executed.append(('COMMIT', None))
+
+    def rollback(self):
+        self.executed.append(('ROLLBACK', None))
+
+    def close(self):
+        self.closed = True
+
+
+class PartitionedConnectionStandIn(ConnectionStandIn):
+    """
+    Stand-in for a psycopg2 connection, returning rows matching a partition's age value.
+    """
+    def select(self, query, vars):
+        if 'pg_export_snapshot' in query:
+            return [{'snapshot_id': '00000003-1'}]
+        if 'partition_min' in query:
+            return [{'partition_min': 0, 'partition_max': 10}]
+        if 'dp_partition' in query and vars:
+            return [row for row in self.rows if row['age'] == vars[0]]
+        return []
+
+
+class ReaderPostgresStandIn(ReaderPostgres):
+    """
+    ReaderPostgres using a ConnectionStandIn, rather than connecting to a database.
+    """
+    rows = [{'name': u'Matt', 'age': 27}, {'name': u'Riley', 'age': 27}]
+    copy_data = 'name,age,note\r\nMatt,27,\\N\r\nRiley,27,"a, b"\r\n'
+    connection_class = ConnectionStandIn
+
+    def _open_connection(self, conn_params):
+        connection = self.connection_class(self.rows, self.copy_data)
+        self.__dict__.setdefault('opened', []).append(connection)
+        return connection
+
+
+class ReaderPostgresPartitionedStandIn(ReaderPostgresStandIn):
+    """
+    ReaderPostgres using a PartitionedConnectionStandIn.
+    """
+    rows = [{'name': u'Matt', 'age': 27}, {'name': u'Riley', 'age': 27}, {'name': u'Steve', 'age': 29}]
+    connection_class = PartitionedConnectionStandIn
+
+
+class ProcessorPostgresWriterStandIn(ProcessorPostgresWriter):
+    """
+    ProcessorPostgresWriter using a ConnectionStandIn, rather than connecting to a database.
+    """
+    def _open_connection(self, conn_params):
+        connection = ConnectionStandIn(ReaderPostgresStandIn.rows)
+        self.__dict__.setdefault('opened', []).append(connection)
+        return connection
+
+
+class TestReaderPostgres(object):
+    """
+    Test class for the Postgres reader, using a stand-in connection.
+    """
+    def test_readerpostgres(self):
+        """
+        A default cursor should execute the query and yield each row.
+        """
+        with ReaderPostgresStandIn('SELECT name, age FROM people', 'test_db') as t_reader:
+            assert [record for record in t_reader] == ReaderPostgresStandIn.rows
+            cursor = t_reader._conn_handler.cursors[0]
+            assert cursor.name is None
+            assert t_reader._conn_handler.executed == [('SELECT name, age FROM people', None)]
+
+    def test_readerpostgres_server_side(self):
+        """
+        A server-side cursor should be named and use the configured itersize.
+        """
+        with ReaderPostgresStandIn('SELECT name, age FROM people', 'test_db',
+                                   server_side=True, itersize=500) as t_reader:
+            assert [record for record in t_reader] == ReaderPostgresStandIn.rows
+            cursor = t_reader._conn_handler.cursors[0]
+            assert cursor.name.startswith('dataplunger_')
+            assert cursor.itersize == 500
+
+    def test_readerpostgres_copy(self):
+        """
+        COPY output should be parsed as CSV, casting values using field_types.
+        """
+        with ReaderPostgresStandIn('SELECT name, age, note FROM people;', 'test_db',
+                                   copy=True, field_types={'age': 'int'}) as t_reader:
+            records = [record for record in t_reader]
+            assert t_reader._conn_handler.executed[0][0].startswith('COPY (SELECT name, age, note FROM people) TO STDOUT')
+        assert records == [{u'name': u'Matt', u'age': 27, u'note': None},
+                           {u'name': u'Riley', u'age': 27, u'note': u'a, b'}]
+
+    def test_readerpostgres_partitions(self):
+        """
+        Partitions should be read over separate connections sharing an exported snapshot.
+        """
+        with ReaderPostgresPartitionedStandIn('SELECT name, age FROM people', 'test_db', partition_column='age',
+                                              partitions=[27, 29, 40], connections=2, snapshot=True) as t_reader:
+            names = sorted(record['name'] for record in t_reader)
+            main_connection, worker_connections = t_reader.opened[0], t_reader.opened[1:]
+        assert names == [u'Matt', u'Riley', u'Steve']
+        assert len(worker_connections) == 2
+        for connection in worker_connections:
+            assert ('SET TRANSACTION SNAPSHOT %s', ('00000003-1',)) in connection.executed
+            assert connection.closed
+        assert main_connection.executed[-1] == ('ROLLBACK', None)
+
+    def test_readerpostgres_partitions_literal_percent(self):
+        """
+        Literal '%' characters in the query should be escaped in partition queries.
+        """
+        with ReaderPostgresPartitionedStandIn("SELECT name, age FROM people WHERE name LIKE 'M%'", 'test_db',
+                                              partition_column='age', partitions=[27, 29]) as t_reader:
+            names = sorted(record['name'] for record in t_reader)
+            executed = t_reader.opened[1].executed
+        assert names == [u'Matt', u'Riley', u'Steve']
+        assert "LIKE 'M%%'" in executed[0][0]
+
+    def test_readerpostgres_partition_ranges(self):
+        """
+        A number of partitions should split the minimum to maximum values into ranges.
+        """
+        with ReaderPostgresPartitionedStandIn('SELECT name, age FROM people', 'test_db',
+                                              partition_column='age', partitions=3) as t_reader:
+            predicates = t_reader._partition_predicates('SELECT name, age FROM people')
+        assert predicates == [('"age" IS NULL', None),
+                              ('"age" >= %s AND "age" < %s', (0, 3)),
+                              ('"age" >= %s AND "age" < %s', (3, 6)),
+                              ('"age" >= %s AND "age" <= %s', (6, 10))]
+
+
+class TestReaderPostgres_Watermark(object):
+    """
+    Test incremental reads from Postgres using a watermark column.
+    """
+    def setup(self):
+        """
+        Create a state file holding a previous high-water mark.
+        """
+        self.state_path = tempfile.mkstemp()[1]
+        with open(self.state_path, 'w') as state_file_handle:
+            json.dump({'PeopleLayer/People': 20}, state_file_handle)
+
+    def test_readerpostgres_watermark(self):
+        """
+        The query should be restricted to rows newer than the stored mark,
+        and the greatest value read saved as the new mark.
+        """
+        with ReaderPostgresStandIn('SELECT name, age FROM people;', 'test_db', watermark_column='age',
+                                   watermark_state=self.state_path, watermark_key='PeopleLayer/People') as t_reader:
+            assert len([record for record in t_reader]) == 2
+            executed_query = t_reader._conn_handler.executed[0][0]
+        commit_watermarks()
+        assert executed_query == "SELECT * FROM (SELECT name, age FROM people) AS dp_incremental WHERE \"age\" > '20'"
+        with open(self.state_path) as state_file_handle:
+            assert json.load(state_file_handle) == {'PeopleLayer/People': 27}
+
+    def teardown(self):
+        os.remove(self.state_path)
+
+
+class TestPostgresConnectionPool(object):
+    """
+    Test reuse of pooled connections across ReaderPostgres instances.
+    """
+    def test_connection_reuse(self):
+        """
+        A connection released by one reader should be borrowed by the next.
+        """
+        first_reader = ReaderPostgresStandIn('SELECT name FROM people', 'pool_db', pool_size=2)
+        conn = first_reader._conn_handler
+        first_reader.__del__()
+        second_reader = ReaderPostgresStandIn('SELECT name FROM people', 'pool_db', pool_size=2)
+        assert second_reader._conn_handler is conn
+        assert ('ROLLBACK', None) in conn.executed
+        second_reader.__del__()
+        close_connection_pools()
+        assert conn.closed
+
+    def test_connection_reuse_after_writer(self):
+        """
+        A reader borrowing a connection released by a ProcessorPostgresWriter should still yield dicts.
+        """
+        writer = ProcessorPostgresWriterStandIn(None, 'public.people', ['name'], 'pool_db', pool_size=2)
+        [record for record in writer.process([])]
+        conn = writer.opened[0]
+        t_reader = ReaderPostgresStandIn('SELECT name, age FROM people', 'pool_db', pool_size=2)
+        assert t_reader._conn_handler is conn
+        assert [record for record in t_reader] == ReaderPostgresStandIn.rows
+        t_reader.__del__()
+
+    @raises(psycopg2.pool.PoolError)
+    def test_pool_exhausted(self):
+        """
+        Borrowing from an exhausted pool should raise a PoolError once the timeout passes.
+        """
+        first_reader = ReaderPostgresStandIn('SELECT name FROM people', 'pool_db', pool_size=1, pool_timeout=0.05)
+        ReaderPostgresStandIn('SELECT name FROM people', 'pool_db', pool_size=1, pool_timeout=0.05)
+
+    def teardown(self):
+        close_connection_pools()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the record file format.
+"""
+from nose.tools import raises
+from dataplunger.recordfile import *
+from datetime import datetime
+import os
+import shutil
+import tempfile
+
+
+class TestRecordFile(object):
+    """
+    Test writing and reading record files.
+    """
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, 'records.dprf')
+        self.fields = ['id', 'score', 'active', 'name', 'code', 'geometry']
+        self.records = [
+            {'id': 1, 'score': 0.5, 'active': True, 'name': u'M\xe4laren', 'code': 'A1',
+             'geometry': {'type': 'Point', 'coordinates': (1.0, 2.0)}},
+            {'id': None, 'score': None, 'active': None, 'name': None, 'code': None, 'geometry': None},
+            {'id': -(1 << 40), 'score': -2.25, 'active': False, 'name': u'', 'code': '', 'geometry': datetime(2014, 5, 1)}
+        ]
+
+    def test_round_trip(self):
+        """
+        Every column type, including None values, should be read back unchanged,
+        across several row groups and codecs.
+        """
+        with RecordFileWriter(self.file_path, self.fields, row_group_size=2,
+                              compression={'name': 'zlib', 'geometry': 'bz2'}) as record_writer:
+            for record in self.records:
+                record_writer.write(record)
+        record_file = RecordFile(self.file_path)
+        assert len(record_file) == 3
+        assert len(record_file.row_groups) == 2
+        assert [c['type'] for c in record_file.row_groups[0]['columns']] == \
+            ['int', 'float', 'bool', 'string', 'bytes', 'object']
+        assert [record for record in record_file] == self.records
+        record_file.close()
+
+    def test_field_types(self):
+        """
+        Declared field types should cast values when written.
+        """
+        with RecordFileWriter(self.file_path, ['id', 'name'], {'id': 'int', 'name': 'string'}) as record_writer:
+            record_writer.write({'id': '27', 'name': 'Matt'})
+            record_writer.write({'id': None})
+        record_file = RecordFile(self.file_path)
+        assert [record for record in record_file] == [{'id': 27, 'name': u'Matt'}, {'id': None, 'name': None}]
+        record_file.close()
+
+    def test_column_projection(self):
+        """
+        Reading a subset of fields should only return those fields.
+        """
+        with RecordFileWriter(self.file_path, self.fields) as record_writer:
+            for record in self.records:
+                record_writer.write(record)
+        record_file = RecordFile(self.file_path)
+        assert [r for r in record_file.iter_records(['id'])] == [{'id': 1}, {'id': None}, {'id': -(1 << 40)}]
+        record_file.close()
+
+    def test_statistics(self):
+        """
+        Column chunks should record minimum and maximum values, ignoring None values.
+        """
+        with RecordFileWriter(self.file_path, self.fields) as record_writer:
+            for record in self.records:
+                record_writer.write(record)
+        record_file = RecordFile(self.file_path)
+        columns = record_file.row_groups[0]['columns']
+        assert (columns[0]['min'], columns[0]['max'], columns[0]['nulls']) == (-(1 << 40), 1, 1)
+        assert (columns[3]['min'], columns[3]['max']) == (u'', u'M\xe4laren')
+        assert (columns[4]['min'], columns[4]['max']) == (u'', u'A1')
+        assert 'min' not in columns[5]
+        record_file.close()
+
+    def test_filters(self):
+        """
+        Filters should return matching records, skipping row groups excluded by their statistics.
+        """
+        with RecordFileWriter(self.file_path, ['SUMLEVEL', 'LOGRECNO'], row_group_size=10) as record_writer:
+            for i in range(100):
+                record_writer.write({'SUMLEVEL': u'140' if i < 50 else u'150', 'LOGRECNO': i})
+        record_file = RecordFile(self.file_path)
+        records = [r for r in record_file.iter_records(filters=[['SUMLEVEL', '=', u'150'], ['LOGRECNO', '<', 62]])]
+        assert [r['LOGRECNO'] for r in records] == range(50, 62)
+        assert record_file.skipped_row_groups == 8
+        records = [r for r in record_file.iter_records(['LOGRECNO'], filters=[['LOGRECNO', 'in', [5, 95]]])]
+        assert records == [{'LOGRECNO': 5}, {'LOGRECNO': 95}]
+        assert record_file.skipped_row_groups == 8
+        record_file.close()
+
+    def test_filters_bytes(self):
+        """
+        Byte string columns, as read from CSV files, should be skipped using their statistics,
+        including non-ASCII values.
+        """
+        with RecordFileWriter(self.file_path, ['SUMLEVEL', 'NAME'], row_group_size=50) as record_writer:
+            for i in range(200):
+                record_writer.write({'SUMLEVEL': '140' if i < 150 else '150', 'NAME': 'M\xc3\xa4laren %03d' % i})
+        record_file = RecordFile(self.file_path)
+        assert record_file.row_groups[0]['columns'][0]['type'] == 'bytes'
+        records = [r for r in record_file.iter_records(filters=[['SUMLEVEL', '=', '150']])]
+        assert len(records) == 50 and record_file.skipped_row_groups == 3
+        records = [r for r in record_file.iter_records(filters=[['NAME', '>=', 'M\xc3\xa4laren 190']])]
+        assert [r['NAME'] for r in records] == ['M\xc3\xa4laren %03d' % i for i in range(190, 200)]
+        assert record_file.skipped_row_groups == 3
+        record_file.close()
+
+    def test_abort(self):
+        """
+        An exception while writing should leave no record file, and no temporary file, behind.
+        """
+        try:
+            with RecordFileWriter(self.file_path, self.fields, row_group_size=1) as record_writer:
+                record_writer.write(self.records[0])
+                raise ValueError("Upstream failure.")
+        except ValueError:
+            pass
+        assert os.listdir(self.path) == []
+
+    @raises(IOError)
+    def test_not_a_record_file(self):
+        """
+        Reading a file lacking the record file header should raise an IOError.
+        """
+        with open(self.file_path, 'wb') as file_handle:
+            file_handle.write('name,age\r\nMatt,27\r\n')
+        RecordFile(self.file_path)
+
+    def teardown(self):
+        shutil.rmtree(self.path)
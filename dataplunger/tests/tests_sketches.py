@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for approximate sketches.
+"""
+from nose.tools import raises
+from dataplunger.sketches import *
+import random
+
+
+class TestHyperLogLog(object):
+    """
+    Test HyperLogLog distinct value estimates.
+    """
+    def test_count(self):
+        """
+        Estimates should be exact for few values, and within a few standard errors for many.
+        """
+        hll = HyperLogLog(precision=12)
+        for i in range(20):
+            hll.add(u'value %d' % i)
+            hll.add('value %d' % i)
+        assert hll.count() == 20
+        for i in range(50000):
+            hll.add(i)
+        assert abs(hll.count() - 50020) < 50020 * 0.05
+
+    def test_merge(self):
+        """
+        A merged HyperLogLog should estimate the union of values.
+        """
+        first, second = HyperLogLog(8), HyperLogLog(8)
+        for i in range(30):
+            first.add(i)
+            second.add(i + 15)
+        first.merge(second)
+        assert abs(first.count() - 45) <= 3
+
+    @raises(ValueError)
+    def test_precision(self):
+        """
+        Precision outside of 4 to 18 should raise a ValueError.
+        """
+        HyperLogLog(precision=2)
+
+
+class TestKLLSketch(object):
+    """
+    Test KLL sketch quantile estimates.
+    """
+    def test_quantiles(self):
+        """
+        Quantiles should be exact before compaction, and within the rank error afterwards.
+        """
+        kll = KLLSketch(k=50, seed=1)
+        assert kll.quantiles([0.5]) == [None]
+        for value in [5, 1, 4, 2, 3]:
+            kll.add(value)
+        assert kll.quantiles([0, 0.5, 1]) == [1, 3, 5]
+        values = range(20000)
+        random.Random(1).shuffle(values)
+        kll = KLLSketch(k=200, seed=1)
+        for value in values:
+            kll.add(value)
+        assert kll.count == 20000
+        for fraction, estimate in zip([0.1, 0.5, 0.9], kll.quantiles([0.1, 0.5, 0.9])):
+            assert abs(estimate - fraction * 20000) < 20000 * 0.02
+
+
+class TestSpaceSaving(object):
+    """
+    Test Space-Saving frequent values.
+    """
+    def test_top(self):
+        """
+        Frequent values should be found among many infrequent ones, with counts overestimated
+        by at most their error.
+        """
+        space_saving = SpaceSaving(capacity=20)
+        for i in range(3000):
+            space_saving.add(['WA', 'OR', 'WA'][i % 3] if i % 2 else i)
+        top = space_saving.top(2)
+        assert [value for value, count, error in top] == ['WA', 'OR']
+        for value, count, error in top:
+            true_count = 1000 if value == 'WA' else 500
+            assert count - error <= true_count <= count
+        assert len(space_saving.counts) == 20